@@ -2,24 +2,300 @@ import json
 import boto3
 from datetime import datetime
 import os
+import uuid
 
-def lambda_handler(event, context):
+from pairing import build_time_pairs
+from state import make_state_store, pair_key
+
+
+def list_nc_files(s3_client, bucket_name, folder_path):
+    """
+    分页列出目录下的所有.nc文件（list_objects_v2 每页最多1000个对象）
+
+    Returns:
+        (nc_objects, sub_prefixes): .nc对象列表，以及目录下的子目录前缀（预报结果目录）
+    """
+    paginator = s3_client.get_paginator('list_objects_v2')
+    pages = paginator.paginate(
+        Bucket=bucket_name,
+        Prefix=folder_path + '/',
+        Delimiter='/'
+    )
+
+    nc_objects = []
+    sub_prefixes = []
+    for page in pages:
+        for obj in page.get('Contents', []):
+            if obj['Key'].endswith('.nc'):
+                nc_objects.append(obj)
+        for prefix in page.get('CommonPrefixes', []):
+            sub_prefixes.append(prefix['Prefix'])
+    return nc_objects, sub_prefixes
+
+
+def shard_pairs(pairs, num_shards):
+    """
+    将文件对轮流分配到 num_shards 个分片，各分片的记录数最多相差1
+
+    批量转换任务按S3对象把输入分发到各个实例，因此分片数与实例数一致时
+    每个实例恰好处理一个JSONL文件。
+    """
+    num_shards = max(1, min(num_shards, len(pairs)))
+    shards = [[] for _ in range(num_shards)]
+    for i, pair in enumerate(pairs):
+        shards[i % num_shards].append(pair)
+    return shards
+
+
+def iter_s3_records(event):
+    """
+    事件中的S3通知记录
+
+    S3 通知经 SQS 转发时（批处理窗口把一段时间内的多个 _SUCCESS 合并为一次调用），
+    展开每条消息体中的记录；S3 发送的测试消息没有记录，直接跳过。
+    """
+    for record in event.get('Records', []):
+        if 'body' in record:
+            try:
+                body = json.loads(record['body'])
+            except ValueError:
+                print(f"⏭️  跳过无法解析的消息: {record['body'][:200]}")
+                continue
+            yield from body.get('Records', [])
+        else:
+            yield record
+
+
+def plan_batches(num_pairs, transform_config):
+    """
+    按待处理的文件对数（队列深度）确定任务数和每个任务的实例数
+
+    设置了 PAIRS_PER_INSTANCE 时每个实例分到约这么多条记录：积压少时用一个任务、
+    一个实例，积压多时再增加实例和任务，INSTANCE_COUNT / MAX_TRANSFORM_JOBS 为上限。
+    为0时使用固定的 INSTANCE_COUNT 和 MAX_TRANSFORM_JOBS。
+
+    Returns:
+        (任务数, 每个任务的实例数)
+    """
+    per_instance = transform_config['pairs_per_instance']
+    if per_instance <= 0:
+        return transform_config['max_jobs'], transform_config['instance_count']
+    instances = -(-num_pairs // per_instance)
+    jobs = max(1, min(transform_config['max_jobs'], -(-instances // transform_config['instance_count'])))
+    return jobs, max(1, min(transform_config['instance_count'], -(-instances // jobs)))
+
+
+def get_transform_config():
+    """从环境变量读取批量转换任务的并行度配置"""
+    return {
+        'instance_count': int(os.environ.get('INSTANCE_COUNT', '1')),
+        # 同时创建的批量转换任务数，文件对会平均分到各个任务
+        'max_jobs': int(os.environ.get('MAX_TRANSFORM_JOBS', '1')),
+        # 每个实例上同时发往模型服务器的请求数
+        'max_concurrent_transforms': int(os.environ.get('MAX_CONCURRENT_TRANSFORMS', '1')),
+        # 单个请求的最大负载（MB）；MultiRecord 模式下决定一次请求包含多少条记录
+        'max_payload_mb': int(os.environ.get('MAX_PAYLOAD_MB', '1')),
+        # SingleRecord: 每个请求一条记录；MultiRecord: 多条记录一起发送，由模型端流水线并行处理
+        'batch_strategy': os.environ.get('BATCH_STRATEGY', 'SingleRecord'),
+        # 每个实例的目标记录数，按积压的文件对数调整实例数和任务数；0 表示使用固定的实例数和任务数
+        'pairs_per_instance': int(os.environ.get('PAIRS_PER_INSTANCE', '0')),
+    }
+
+
+def submit_transform_job(s3_client, sagemaker_client, model_bucket, model_name, instance_type,
+                         transform_config, pairs, date_str, run_id, sagemaker_role):
+    """
+    上传分片后的JSONL清单并创建一个批量转换任务
+
+    清单按实例数拆分为多个文件放在同一前缀下，任务以该前缀为输入，
+    SageMaker 会把不同的文件分发到不同的实例。
+
+    Returns:
+        job_info: 任务信息，失败时返回 None
+    """
+    instance_count = transform_config['instance_count']
+    
+    # 设置S3路径
+    s3_prefix = 'sagemaker/fuxi'
+    
+    # 创建带日期和时间戳的JSONL清单目录
+    manifest_prefix = f'input/{date_str}-{run_id}/'
+    s3_data_path = f's3://{model_bucket}/{s3_prefix}/{manifest_prefix}'
+    s3_output_path = f's3://{model_bucket}/{s3_prefix}/output/{date_str}-{run_id}/'
+    
+    # 上传JSONL文件到S3
+    shards = shard_pairs(pairs, instance_count)
+    try:
+        for shard_index, shard in enumerate(shards):
+            jsonl_content = '\n'.join(json.dumps(pair) for pair in shard)
+            s3_client.put_object(
+                Bucket=model_bucket,
+                Key=f'{s3_prefix}/{manifest_prefix}part-{shard_index:05d}.jsonl',
+                Body=jsonl_content.encode('utf-8'),
+                ContentType='application/x-jsonlines'
+            )
+        print(f"✅ JSONL文件上传成功: {s3_data_path} ({len(shards)} 个分片, {len(pairs)} 行)")
+    except Exception as e:
+        print(f"❌ JSONL文件上传失败: {e}")
+        return None
+    
+    # 创建SageMaker批量转换任务
+    transform_job_name = f"fuxi-optimized-{date_str}-{run_id}"
+    
+    try:
+        # 使用优化的配置创建批量转换任务
+        response = sagemaker_client.create_transform_job(
+            TransformJobName=transform_job_name,
+            ModelName=model_name,  # 使用自定义Docker镜像的模型
+            MaxConcurrentTransforms=transform_config['max_concurrent_transforms'],
+            MaxPayloadInMB=transform_config['max_payload_mb'],
+            BatchStrategy=transform_config['batch_strategy'],
+            TransformInput={
+                'DataSource': {
+                    'S3DataSource': {
+                        'S3DataType': 'S3Prefix',
+                        'S3Uri': s3_data_path
+                    }
+                },
+                'ContentType': 'application/json',
+                'SplitType': 'Line'
+            },
+            TransformOutput={
+                'S3OutputPath': s3_output_path,
+                'Accept': 'application/json',
+                'AssembleWith': 'Line'
+            },
+            TransformResources={
+                'InstanceType': instance_type,
+                # 实例数不超过分片数，避免空闲实例
+                'InstanceCount': min(instance_count, len(shards))
+            },
+            Environment={
+                # 优化的环境变量配置
+                'TS_DEFAULT_WORKERS_PER_MODEL': '1',
+                'TS_DEFAULT_RESPONSE_TIMEOUT': '3600',
+                'SAGEMAKER_MODEL_SERVER_TIMEOUT': '3600',
+                'SAGEMAKER_MODEL_SERVER_WORKERS': '1',
+                # FuXi模型特定配置
+                'FUXI_MODEL_BUCKET': model_bucket,
+                'FUXI_MODEL_PREFIX': 'sagemaker/fuxi',
+                'SAGEMAKER_PROGRAM': 'inference.py'
+            },
+            Tags=[
+                {
+                    'Key': 'Project',
+                    'Value': 'FuXi-Weather-Forecast'
+                },
+                {
+                    'Key': 'Environment',
+                    'Value': os.environ.get('ENVIRONMENT', 'dev')
+                },
+                {
+                    'Key': 'OptimizedImage',
+                    'Value': 'true'
+                },
+                {
+                    'Key': 'Date',
+                    'Value': date_str
+                }
+            ]
+        )
+        
+        job_info = {
+            'job_name': transform_job_name,
+            'job_arn': response['TransformJobArn'],
+            'input_path': s3_data_path,
+            'output_path': s3_output_path,
+            'date': date_str,
+            'pairs_count': len(pairs),
+            'manifest_count': len(shards)
+        }
+        
+        print(f"✅ SageMaker批量转换任务创建成功: {transform_job_name}")
+        print(f"📍 任务ARN: {response['TransformJobArn']}")
+        print(f"📥 输入路径: {s3_data_path}")
+        print(f"📤 输出路径: {s3_output_path}")
+        print(f"🏷️  使用优化镜像: {model_name}")
+        return job_info
+        
+    except Exception as e:
+        print(f"❌ SageMaker批量转换任务创建失败: {e}")
+        print("💡 请检查:")
+        print(f"  - 模型是否存在: {model_name}")
+        print(f"  - 角色权限: {sagemaker_role}")
+        print(f"  - 实例配额: {instance_type}")
+        
+        # 记录详细信息供调试
+        print(f"📊 详细信息:")
+        print(f"  输入路径: {s3_data_path}")
+        print(f"  输出路径: {s3_output_path}")
+        print(f"  角色ARN: {sagemaker_role}")
+        print(f"  实例类型: {instance_type}")
+        return None
+
+
+def reconcile_state(store, sagemaker_client, ttl_hours):
+    """
+    按批量转换任务的状态整理状态记录，使没有完成的文件对在本次触发重新提交
+
+    - 失败或被停止的任务（以及查不到的任务）：释放它的文件对
+    - 完成的任务：不再跟踪，文件对保留（结果目录中有完成标记）
+    - 超过 ttl_hours 的记录（例如认领后 Lambda 中断、没有提交任务的文件对）：释放，
+      仍在运行的任务的文件对除外；ttl_hours 为0时不过期
+
+    Returns:
+        释放的状态键数
+    """
+    released = 0
+    running = set()
+    for job, keys in store.pending_jobs().items():
+        try:
+            status = sagemaker_client.describe_transform_job(TransformJobName=job)['TransformJobStatus']
+        except sagemaker_client.exceptions.ClientError as e:
+            if 'ValidationException' not in str(e):
+                print(f"⚠️  无法查询任务状态: {job}: {e}")
+                running.update(keys)
+                continue
+            status = 'Missing'
+        if status in ('InProgress', 'Stopping'):
+            running.update(keys)
+            continue
+        failed = status != 'Completed'
+        store.settle(job, keys, failed)
+        if failed:
+            released += len(keys)
+            print(f"♻️  任务 {job} 状态为 {status}，释放 {len(keys)} 个文件对")
+    if ttl_hours > 0:
+        expired = store.expire(ttl_hours * 3600, keep=running)
+        if expired:
+            released += len(expired)
+            print(f"♻️  释放 {len(expired)} 个超过 {ttl_hours} 小时的记录")
+    return released
+
+
+def lambda_handler(event, context, s3_client=None, sagemaker_client=None):
     """
     优化版Lambda处理函数
     - 使用自定义Docker镜像的SageMaker模型
     - 支持环境变量配置
     - 增强错误处理和日志
+    - 分页列出输入文件，按实例数拆分JSONL清单并行提交批量转换任务
+    - 合并同一次调用中的 _SUCCESS 事件（包括经 SQS 转发的），按 STATE_STORE 只提交新的文件对
+
+    s3_client/sagemaker_client 默认使用 boto3 客户端，本地测试时可以传入
+    lambda/local_stub.py 中的替身。
     """
     
-    s3_client = boto3.client('s3')
-    sagemaker_client = boto3.client('sagemaker')
+    s3_client = s3_client or boto3.client('s3')
+    sagemaker_client = sagemaker_client or boto3.client('sagemaker')
     
     # 从环境变量获取配置
     model_bucket = os.environ.get('MODEL_BUCKET')
     sagemaker_role = os.environ.get('SAGEMAKER_ROLE')
     model_name = os.environ.get('MODEL_NAME', 'fuxi-weather-model-optimized')
     instance_type = os.environ.get('INSTANCE_TYPE', 'ml.g4dn.2xlarge')
-    instance_count = int(os.environ.get('INSTANCE_COUNT', '1'))
+    transform_config = get_transform_config()
+    instance_count = transform_config['instance_count']
     
     print(f"🚀 Lambda函数启动 - 使用优化的Docker镜像")
     print(f"📋 配置信息:")
@@ -28,6 +304,8 @@ def lambda_handler(event, context):
     print(f"  模型名称: {model_name}")
     print(f"  实例类型: {instance_type}")
     print(f"  实例数量: {instance_count}")
+    print(f"  最大任务数: {transform_config['max_jobs']}")
+    print(f"  批处理策略: {transform_config['batch_strategy']}")
     
     # 验证必需的环境变量
     if not model_bucket:
@@ -45,224 +323,130 @@ def lambda_handler(event, context):
         }
     
     processed_jobs = []
+    store = make_state_store(os.environ.get('STATE_STORE'), s3_client)
+    if store is not None:
+        reconcile_state(store, sagemaker_client, float(os.environ.get('STATE_TTL_HOURS', '72')))
     
-    # 处理每个S3事件记录
-    for record in event['Records']:
+    # 合并本次调用中的全部 _SUCCESS 事件：同一目录只列出一次，所有文件对一起提交
+    folders = []
+    num_events = 0
+    for record in iter_s3_records(event):
         try:
-            # 获取触发事件的桶名和对象键
             bucket_name = record['s3']['bucket']['name']
             object_key = record['s3']['object']['key']
-            
-            print(f"📥 处理S3事件: s3://{bucket_name}/{object_key}")
-            
-            # 确保是_SUCCESS文件
-            if not object_key.endswith('_SUCCESS'):
-                print(f"⏭️  跳过非_SUCCESS文件: {object_key}")
-                continue
-                
-            # 获取_SUCCESS文件所在的目录路径
-            folder_path = os.path.dirname(object_key)
+        except (KeyError, TypeError):
+            print(f"⏭️  跳过非S3事件记录: {json.dumps(record)[:200]}")
+            continue
+        print(f"📥 处理S3事件: s3://{bucket_name}/{object_key}")
+        
+        # 确保是_SUCCESS文件
+        if not object_key.endswith('_SUCCESS'):
+            print(f"⏭️  跳过非_SUCCESS文件: {object_key}")
+            continue
+        num_events += 1
+        folder = (bucket_name, os.path.dirname(object_key))
+        if folder not in folders:
+            folders.append(folder)
+    print(f"🔀 {num_events} 个_SUCCESS事件，合并为 {len(folders)} 个目录")
+    
+    pairs = []
+    etags = {}
+    nc_files_count = 0
+    for bucket_name, folder_path in folders:
+        try:
             print(f"📁 处理目录: {folder_path}")
             
             # 列出该目录下的所有.nc文件
-            response = s3_client.list_objects_v2(
-                Bucket=bucket_name,
-                Prefix=folder_path + '/',
-                Delimiter='/'
-            )
+            nc_objects, sub_prefixes = list_nc_files(s3_client, bucket_name, folder_path)
             
-            nc_files = []
-            if 'Contents' in response:
-                for obj in response['Contents']:
-                    file_key = obj['Key']
-                    if file_key.endswith('.nc'):
-                        # 保存完整的S3路径
-                        s3_path = f's3://{bucket_name}/{file_key}'
-                        nc_files.append(s3_path)
+            print(f"🔍 找到 {len(nc_objects)} 个.nc文件")
             
-            print(f"🔍 找到 {len(nc_files)} 个.nc文件")
-            
-            if len(nc_files) == 0:
+            if len(nc_objects) == 0:
                 print("⚠️  未找到.nc文件，跳过处理")
                 continue
+            nc_files_count += len(nc_objects)
+            for obj in nc_objects:
+                etags[f's3://{bucket_name}/{obj["Key"]}'] = obj['ETag'].strip('"')
             
-            # 按文件名排序
-            nc_files.sort()
-            
-            # 创建JSONL内容，每两个文件为一组
-            jsonl_lines = []
-            for i in range(0, len(nc_files), 2):
-                if i + 1 < len(nc_files):
-                    line_data = {
-                        "filename1": nc_files[i],
-                        "filename2": nc_files[i + 1]
-                    }
-                    jsonl_lines.append(json.dumps(line_data))
-            
-            # 如果nc文件数量为奇数，处理最后一个文件
-            if len(nc_files) % 2 == 1:
-                line_data = {
-                    "filename1": nc_files[-1],
-                    "filename2": nc_files[0]  # 使用第一个文件作为备用
-                }
-                jsonl_lines.append(json.dumps(line_data))
-            
-            print(f"📝 生成 {len(jsonl_lines)} 行JSONL数据")
-            
-            # 创建JSONL文件内容
-            jsonl_content = '\n'.join(jsonl_lines)
-            
-            # 从nc文件名中提取日期
-            if nc_files:
-                # 从S3路径中提取文件名
-                first_file_name = os.path.basename(nc_files[0])
-                # 假设文件名格式如：20240101_00.nc 或 2024010100.nc
-                # 提取日期部分
-                if '_' in first_file_name:
-                    date_str = first_file_name.split('_')[0][:8]
-                elif '.' in first_file_name:
-                    date_str = first_file_name.split('.')[0][:8]
-                else:
-                    date_str = datetime.now().strftime('%Y%m%d')
-            else:
-                date_str = datetime.now().strftime('%Y%m%d')
-            
-            print(f"📅 提取日期: {date_str}")
-            
-            # 设置S3路径
-            s3_prefix = 'sagemaker/fuxi'
-            
-            # 创建带日期和时间戳的JSONL文件名
-            timestamp = int(datetime.now().timestamp())
-            jsonl_file_name = f'input/{date_str}-{timestamp}.jsonl'
-            s3_data_path = f's3://{model_bucket}/{s3_prefix}/{jsonl_file_name}'
-            s3_output_path = f's3://{model_bucket}/{s3_prefix}/output/{date_str}-{timestamp}/'
-            
-            # 上传JSONL文件到S3
-            try:
-                s3_client.put_object(
-                    Bucket=model_bucket,
-                    Key=f'{s3_prefix}/{jsonl_file_name}',
-                    Body=jsonl_content.encode('utf-8'),
-                    ContentType='application/x-jsonlines'
-                )
-                print(f"✅ JSONL文件上传成功: {s3_data_path}")
-            except Exception as e:
-                print(f"❌ JSONL文件上传失败: {e}")
-                continue
-            
-            # 创建SageMaker批量转换任务
-            transform_job_name = f"fuxi-optimized-{date_str}-{timestamp}"
-            
-            # 检查模型是否存在
-            try:
-                sagemaker_client.describe_model(ModelName=model_name)
-                print(f"✅ 确认模型存在: {model_name}")
-            except sagemaker_client.exceptions.ClientError as e:
-                if 'ValidationException' in str(e):
-                    print(f"❌ 模型不存在: {model_name}")
-                    print("💡 请先创建使用自定义Docker镜像的SageMaker模型")
-                    continue
-                else:
-                    raise e
-            
-            try:
-                # 使用优化的配置创建批量转换任务
-                response = sagemaker_client.create_transform_job(
-                    TransformJobName=transform_job_name,
-                    ModelName=model_name,  # 使用自定义Docker镜像的模型
-                    TransformInput={
-                        'DataSource': {
-                            'S3DataSource': {
-                                'S3DataType': 'S3Prefix',
-                                'S3Uri': s3_data_path
-                            }
-                        },
-                        'ContentType': 'application/json',
-                        'SplitType': 'Line'
-                    },
-                    TransformOutput={
-                        'S3OutputPath': s3_output_path,
-                        'Accept': 'application/json',
-                        'AssembleWith': 'Line'
-                    },
-                    TransformResources={
-                        'InstanceType': instance_type,
-                        'InstanceCount': instance_count
-                    },
-                    Environment={
-                        # 优化的环境变量配置
-                        'TS_DEFAULT_WORKERS_PER_MODEL': '1',
-                        'TS_DEFAULT_RESPONSE_TIMEOUT': '3600',
-                        'SAGEMAKER_MODEL_SERVER_TIMEOUT': '3600',
-                        'SAGEMAKER_MODEL_SERVER_WORKERS': '1',
-                        # FuXi模型特定配置
-                        'FUXI_MODEL_BUCKET': model_bucket,
-                        'FUXI_MODEL_PREFIX': 'sagemaker/fuxi',
-                        'SAGEMAKER_PROGRAM': 'inference.py'
-                    },
-                    Tags=[
-                        {
-                            'Key': 'Project',
-                            'Value': 'FuXi-Weather-Forecast'
-                        },
-                        {
-                            'Key': 'Environment',
-                            'Value': os.environ.get('ENVIRONMENT', 'dev')
-                        },
-                        {
-                            'Key': 'OptimizedImage',
-                            'Value': 'true'
-                        },
-                        {
-                            'Key': 'Date',
-                            'Value': date_str
-                        }
-                    ]
-                )
-                
-                job_info = {
-                    'job_name': transform_job_name,
-                    'job_arn': response['TransformJobArn'],
-                    'input_path': s3_data_path,
-                    'output_path': s3_output_path,
-                    'date': date_str,
-                    'nc_files_count': len(nc_files)
-                }
-                
-                processed_jobs.append(job_info)
-                
-                print(f"✅ SageMaker批量转换任务创建成功: {transform_job_name}")
-                print(f"📍 任务ARN: {response['TransformJobArn']}")
-                print(f"📥 输入路径: {s3_data_path}")
-                print(f"📤 输出路径: {s3_output_path}")
-                print(f"🏷️  使用优化镜像: {model_name}")
-                
-            except Exception as e:
-                print(f"❌ SageMaker批量转换任务创建失败: {e}")
-                print("💡 请检查:")
-                print(f"  - 模型是否存在: {model_name}")
-                print(f"  - 角色权限: {sagemaker_role}")
-                print(f"  - 实例配额: {instance_type}")
-                
-                # 记录详细信息供调试
-                print(f"📊 详细信息:")
-                print(f"  输入路径: {s3_data_path}")
-                print(f"  输出路径: {s3_output_path}")
-                print(f"  角色ARN: {sagemaker_role}")
-                print(f"  实例类型: {instance_type}")
+            # 按起报时间配对 (netcdf, grib)，跳过重复文件和已有预报结果的起报时间
+            folder_pairs, pair_report = build_time_pairs(
+                nc_objects, bucket_name, s3_client=s3_client, result_prefixes=sub_prefixes,
+                result_marker=os.environ.get('RESULT_MARKER', 'result/_COMPLETE')
+            )
+            print(f"📝 生成 {len(folder_pairs)} 行JSONL数据")
+            print(f"  重复文件: {pair_report['duplicates']}, 已处理: {len(pair_report['processed'])}, "
+                  f"缺少配对: {len(pair_report['unpaired'])}, 无法识别时间: {len(pair_report['no_time'])}, "
+                  f"无法识别类型: {len(pair_report['unknown_kind'])}")
+            for key in pair_report['unpaired'][:10]:
+                print(f"⚠️  缺少配对文件: {key}")
+            pairs += folder_pairs
                 
         except Exception as e:
-            print(f"❌ 处理记录时出错: {e}")
-            print(f"📊 记录详情: {json.dumps(record, indent=2)}")
+            print(f"❌ 处理目录时出错: s3://{bucket_name}/{folder_path}: {e}")
             continue
     
+    # 只提交状态记录中没有的文件对（按起报时间和输入文件的ETag）
+    keyed = {pair_key(pair, etags): pair for pair in pairs} if store is not None else dict(enumerate(pairs))
+    already_submitted = 0
+    if store is not None and keyed:
+        claimed = set(store.claim(keyed))
+        already_submitted = len(keyed) - len(claimed)
+        keyed = {key: pair for key, pair in keyed.items() if key in claimed}
+        print(f"🗂️  已提交过: {already_submitted}, 新的文件对: {len(keyed)}")
+    
+    if keyed:
+        # 检查模型是否存在
+        model_exists = True
+        try:
+            sagemaker_client.describe_model(ModelName=model_name)
+            print(f"✅ 确认模型存在: {model_name}")
+        except sagemaker_client.exceptions.ClientError as e:
+            if 'ValidationException' not in str(e):
+                raise e
+            print(f"❌ 模型不存在: {model_name}")
+            print("💡 请先创建使用自定义Docker镜像的SageMaker模型")
+            model_exists = False
+        
+        if not model_exists:
+            if store is not None:
+                store.release(list(keyed))
+        else:
+            # 按待处理的文件对数确定任务数和实例数，每个任务再按实例数拆分成多个JSONL清单
+            num_jobs, num_instances = plan_batches(len(keyed), transform_config)
+            job_config = dict(transform_config, instance_count=num_instances)
+            print(f"📦 {len(keyed)} 个文件对 -> {num_jobs} 个任务 × {num_instances} 个实例")
+            # 任务名 = 日期 + 时间戳 + 本次调用的随机后缀 + 任务序号：同一秒内的多次触发、
+            # 同一次调用中的多个任务都不会重名（CreateTransformJob 重名时失败）
+            run_id = f'{int(datetime.now().timestamp())}-{uuid.uuid4().hex[:6]}'
+            job_keys = shard_pairs(list(keyed), num_jobs)
+            for job_index, keys in enumerate(job_keys):
+                pairs_of_job = [keyed[key] for key in keys]
+                date_str = pairs_of_job[0]['init_time'][:8]
+                job_info = submit_transform_job(
+                    s3_client, sagemaker_client, model_bucket, model_name, instance_type,
+                    job_config, pairs_of_job, date_str, f'{run_id}-{job_index:02d}', sagemaker_role
+                )
+                if job_info:
+                    job_info['nc_files_count'] = nc_files_count
+                    processed_jobs.append(job_info)
+                    if store is not None:
+                        store.mark({key: keyed[key] for key in keys}, job_info['job_name'])
+                elif store is not None:
+                    # 提交失败的文件对由下一次触发重新提交
+                    store.release(keys)
+    else:
+        print("⚠️  没有需要处理的文件对，跳过处理")
+    
     # 返回处理结果
     result = {
         'statusCode': 200,
         'body': json.dumps({
             'message': 'Lambda function executed successfully with optimized Docker image',
-            'processed_records': len(event['Records']),
+            'processed_records': len(event.get('Records', [])),
+            'success_events': num_events,
+            'folders': len(folders),
+            'new_pairs': len(keyed),
+            'already_submitted': already_submitted,
             'created_jobs': len(processed_jobs),
             'jobs': processed_jobs,
             'optimizations': {
@@ -275,7 +459,7 @@ def lambda_handler(event, context):
     }
     
     print(f"🎉 Lambda执行完成:")
-    print(f"  处理记录数: {len(event['Records'])}")
+    print(f"  处理记录数: {len(event.get('Records', []))}")
     print(f"  创建任务数: {len(processed_jobs)}")
     print(f"  使用优化镜像: {model_name}")
     
@@ -0,0 +1,244 @@
+"""
+S3 / SageMaker 的本地内存替身，用于在没有AWS环境时运行 lambda_handler
+
+只实现 Lambda 函数用到的接口，行为与 boto3 保持一致：
+list_objects_v2 每页最多返回 MaxKeys（默认1000）个对象并通过
+ContinuationToken 分页，create_transform_job 会校验并记录请求参数。
+
+示例:
+    python local_stub.py --init-times 1500
+    # 每次触发前新增 8 个起报时间，状态记录使只有新的文件对被提交
+    python local_stub.py --init-times 100 --triggers 3 --new-per-trigger 8 \
+        --state-store sqlite:///tmp/fuxi-state.db --pairs-per-instance 4
+"""
+import argparse
+import hashlib
+import json
+import os
+from datetime import datetime
+
+from botocore.exceptions import ClientError
+
+__all__ = ["LocalS3Client", "LocalSageMakerClient", "make_success_event"]
+
+
+class _Exceptions:
+    ClientError = ClientError
+
+
+def _client_error(code, message, operation):
+    return ClientError({'Error': {'Code': code, 'Message': message}}, operation)
+
+
+class _Paginator:
+
+    def __init__(self, method):
+        self.method = method
+
+    def paginate(self, **kwargs):
+        token = None
+        while True:
+            params = dict(kwargs)
+            if token:
+                params['ContinuationToken'] = token
+            page = self.method(**params)
+            yield page
+            if not page.get('IsTruncated'):
+                return
+            token = page['NextContinuationToken']
+
+
+class LocalS3Client:
+    """内存中的S3替身，objects 以 (bucket, key) 为键"""
+
+    exceptions = _Exceptions
+
+    def __init__(self):
+        self.objects = {}
+        self.calls = []
+
+    def put_object(self, Bucket, Key, Body=b'', ContentType=None, Metadata=None, **kwargs):
+        self.calls.append(('put_object', Bucket, Key))
+        if isinstance(Body, str):
+            Body = Body.encode('utf-8')
+        self.objects[(Bucket, Key)] = {
+            'Body': Body,
+            'ETag': '"%s"' % hashlib.md5(Body).hexdigest(),
+            'ContentType': ContentType,
+            'Metadata': Metadata or {},
+            'LastModified': datetime.now(),
+        }
+        return {'ETag': self.objects[(Bucket, Key)]['ETag']}
+
+    def get_object(self, Bucket, Key, **kwargs):
+        self.calls.append(('get_object', Bucket, Key))
+        obj = self._get(Bucket, Key, 'GetObject')
+        return {'Body': _Body(obj['Body']), 'ETag': obj['ETag'], 'ContentLength': len(obj['Body']),
+                'Metadata': obj['Metadata']}
+
+    def head_object(self, Bucket, Key, **kwargs):
+        self.calls.append(('head_object', Bucket, Key))
+        obj = self._get(Bucket, Key, 'HeadObject')
+        return {'ETag': obj['ETag'], 'ContentLength': len(obj['Body']), 'Metadata': obj['Metadata'],
+                'LastModified': obj['LastModified']}
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        self.calls.append(('delete_object', Bucket, Key))
+        self.objects.pop((Bucket, Key), None)
+        return {}
+
+    def list_objects_v2(self, Bucket, Prefix='', Delimiter=None, MaxKeys=1000, ContinuationToken=None, **kwargs):
+        self.calls.append(('list_objects_v2', Bucket, Prefix))
+        keys = sorted(k for b, k in self.objects if b == Bucket and k.startswith(Prefix))
+
+        contents, prefixes = [], []
+        for key in keys:
+            rest = key[len(Prefix):]
+            if Delimiter and Delimiter in rest:
+                prefix = Prefix + rest.split(Delimiter)[0] + Delimiter
+                if prefix not in prefixes:
+                    prefixes.append(prefix)
+            else:
+                contents.append(key)
+
+        # 分页按键名排序，ContinuationToken 为上一页最后一个键
+        entries = sorted([(k, 'key') for k in contents] + [(p, 'prefix') for p in prefixes])
+        if ContinuationToken:
+            entries = [e for e in entries if e[0] > ContinuationToken]
+        page, rest = entries[:MaxKeys], entries[MaxKeys:]
+
+        response = {'IsTruncated': bool(rest), 'KeyCount': len(page), 'Prefix': Prefix}
+        page_keys = [k for k, kind in page if kind == 'key']
+        page_prefixes = [k for k, kind in page if kind == 'prefix']
+        if page_keys:
+            response['Contents'] = [
+                {'Key': k, 'ETag': self.objects[(Bucket, k)]['ETag'],
+                 'Size': len(self.objects[(Bucket, k)]['Body']),
+                 'LastModified': self.objects[(Bucket, k)]['LastModified']}
+                for k in page_keys
+            ]
+        if page_prefixes:
+            response['CommonPrefixes'] = [{'Prefix': p} for p in page_prefixes]
+        if rest:
+            response['NextContinuationToken'] = page[-1][0]
+        return response
+
+    def get_paginator(self, operation_name):
+        return _Paginator(getattr(self, operation_name))
+
+    def _get(self, bucket, key, operation):
+        if (bucket, key) not in self.objects:
+            raise _client_error('404', 'Not Found', operation)
+        return self.objects[(bucket, key)]
+
+
+class _Body:
+
+    def __init__(self, data):
+        self.data = data
+
+    def read(self):
+        return self.data
+
+
+class LocalSageMakerClient:
+    """SageMaker替身：记录创建的批量转换任务"""
+
+    exceptions = _Exceptions
+
+    def __init__(self, models=('fuxi-weather-model-optimized',)):
+        self.models = set(models)
+        self.transform_jobs = {}
+
+    def describe_model(self, ModelName):
+        if ModelName not in self.models:
+            raise _client_error('ValidationException', f'Could not find model "{ModelName}".', 'DescribeModel')
+        return {'ModelName': ModelName}
+
+    def create_transform_job(self, TransformJobName, **kwargs):
+        if TransformJobName in self.transform_jobs:
+            raise _client_error('ValidationException', f'Job {TransformJobName} already exists', 'CreateTransformJob')
+        if kwargs.get('BatchStrategy') not in (None, 'SingleRecord', 'MultiRecord'):
+            raise _client_error('ValidationException', 'Invalid BatchStrategy', 'CreateTransformJob')
+        if not 0 <= kwargs.get('MaxPayloadInMB', 6) <= 100:
+            raise _client_error('ValidationException', 'Invalid MaxPayloadInMB', 'CreateTransformJob')
+        self.transform_jobs[TransformJobName] = dict(kwargs, TransformJobStatus='InProgress')
+        return {'TransformJobArn': f'arn:aws-cn:sagemaker:cn-northwest-1:000000000000:transform-job/{TransformJobName}'}
+
+    def describe_transform_job(self, TransformJobName):
+        if TransformJobName not in self.transform_jobs:
+            raise _client_error('ValidationException', f'Could not find job "{TransformJobName}".',
+                                'DescribeTransformJob')
+        return dict(self.transform_jobs[TransformJobName], TransformJobName=TransformJobName)
+
+
+def make_success_event(bucket_name, folder_path):
+    """构造 _SUCCESS 文件的S3事件"""
+    return {'Records': [{'s3': {'bucket': {'name': bucket_name},
+                                'object': {'key': f'{folder_path}/_SUCCESS'}}}]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='使用本地替身运行 lambda_handler')
+    parser.add_argument('--init-times', type=int, default=1500, help='目录中的起报时间数（每个时间一对文件）')
+    parser.add_argument('--processed', type=int, default=10, help='其中已有预报结果的起报时间数')
+    parser.add_argument('--instance-count', default='2', help='INSTANCE_COUNT')
+    parser.add_argument('--max-jobs', default='2', help='MAX_TRANSFORM_JOBS')
+    parser.add_argument('--pairs-per-instance', default='0', help='PAIRS_PER_INSTANCE')
+    parser.add_argument('--state-store', default='', help='STATE_STORE，例如 sqlite:///tmp/fuxi-state.db')
+    parser.add_argument('--triggers', type=int, default=1, help='触发次数')
+    parser.add_argument('--new-per-trigger', type=int, default=0, help='每次后续触发前新增的起报时间数')
+    parser.add_argument('--fail-jobs', type=int, default=0,
+                        help='每次后续触发前把最早的几个运行中的任务标记为失败，其文件对被重新提交')
+    args = parser.parse_args()
+
+    from datetime import timedelta
+    from function import lambda_handler
+
+    os.environ.setdefault('MODEL_BUCKET', 'model-bucket')
+    os.environ.setdefault('SAGEMAKER_ROLE', 'arn:aws-cn:iam::000000000000:role/FuXiSageMakerExecutionRole')
+    os.environ['INSTANCE_COUNT'] = args.instance_count
+    os.environ['MAX_TRANSFORM_JOBS'] = args.max_jobs
+    os.environ['PAIRS_PER_INSTANCE'] = args.pairs_per_instance
+    os.environ['STATE_STORE'] = args.state_store
+
+    s3 = LocalS3Client()
+    sagemaker = LocalSageMakerClient()
+    start = datetime(2023, 10, 1)
+
+    def upload(first, count):
+        for i in range(first, first + count):
+            stem = (start + timedelta(hours=6 * i)).strftime('%Y%m%d-%H')
+            s3.put_object(Bucket='data-bucket', Key=f'incoming/{stem}_input_netcdf.nc', Body=f'netcdf {stem}')
+            s3.put_object(Bucket='data-bucket', Key=f'incoming/{stem}_input_grib.nc', Body=f'grib {stem}')
+            if i < args.processed:
+                s3.put_object(Bucket='data-bucket', Key=f'incoming/{stem}_input_netcdf/result/_COMPLETE', Body=b'{}')
+
+    upload(0, args.init_times)
+    # 孤立文件和重复上传的文件
+    s3.put_object(Bucket='data-bucket', Key='incoming/20991231-00_input_netcdf.nc', Body=b'orphan')
+    s3.put_object(Bucket='data-bucket', Key='incoming/copy_of_20231001-00_input_grib.nc', Body='grib 20231001-00')
+
+    uploaded = args.init_times
+    for trigger in range(args.triggers):
+        if trigger:
+            upload(uploaded, args.new_per_trigger)
+            uploaded += args.new_per_trigger
+            running = [job for job in sagemaker.transform_jobs.values() if job['TransformJobStatus'] == 'InProgress']
+            for job in running[:args.fail_jobs]:
+                job['TransformJobStatus'] = 'Failed'
+        # 同一目录的多个 _SUCCESS 事件在一次调用中合并
+        event = make_success_event('data-bucket', 'incoming')
+        event['Records'] *= 3
+        manifests = {k for k in s3.objects if k[1].endswith('.jsonl')}
+        result = lambda_handler(event, None, s3_client=s3, sagemaker_client=sagemaker)
+        body = json.loads(result['body'])
+        pairs = sum(len(s3.objects[k]['Body'].decode('utf-8').splitlines())
+                    for k in s3.objects if k[1].endswith('.jsonl') and k not in manifests)
+        print(f"第 {trigger + 1} 次触发 - 任务数: {body['created_jobs']}, 清单中的文件对: {pairs}, "
+              f"已提交过: {body['already_submitted']}, "
+              f"每个任务的清单数: {[job['manifest_count'] for job in body['jobs']]}")
+
+
+if __name__ == '__main__':
+    main()
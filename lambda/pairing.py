@@ -0,0 +1,131 @@
+"""
+按起报时间配对输入文件
+
+每个起报时间需要一个 netcdf 初始场和一个 grib 文件，例如:
+    20231012-06_input_netcdf.nc + 20231012-06_input_grib.nc
+
+起报时间优先从文件名解析（YYYYMMDD-HH、YYYYMMDD_HH、YYYYMMDDHH、YYYYMMDD），
+解析不到时读取对象的用户元数据 init-time。同一起报时间的同类重复文件只保留
+最新的一个（内容相同时保留先列出的一个），已经有预报完成标记的起报时间会被跳过。
+"""
+import os
+import re
+from datetime import datetime
+
+__all__ = ["parse_init_time", "detect_kind", "build_time_pairs"]
+
+_TIME_PATTERNS = [
+    # 20231012-06 / 20231012_06 / 20231012T06 / 2023101206
+    (re.compile(r'(?<!\d)(\d{8})[-_T]?(\d{2})(?!\d)'), '%Y%m%d%H'),
+    # 20231012
+    (re.compile(r'(?<!\d)(\d{8})(?!\d)'), '%Y%m%d'),
+]
+_METADATA_KEYS = ['init-time', 'init_time', 'inittime']
+
+
+def parse_init_time(text):
+    """从文件名或元数据值中解析起报时间，失败返回 None"""
+    for pattern, fmt in _TIME_PATTERNS:
+        for match in pattern.finditer(text):
+            try:
+                return datetime.strptime(''.join(match.groups()), fmt)
+            except ValueError:
+                continue
+    return None
+
+
+def detect_kind(file_name):
+    name = file_name.lower()
+    if 'grib' in name:
+        return 'grib'
+    if 'netcdf' in name:
+        return 'netcdf'
+    return None
+
+
+def _header_init_time(s3_client, bucket_name, key):
+    try:
+        metadata = s3_client.head_object(Bucket=bucket_name, Key=key).get('Metadata', {})
+    except Exception as e:
+        print(f"⚠️  读取元数据失败: {key}: {e}")
+        return None
+    for name in _METADATA_KEYS:
+        if name in metadata:
+            return parse_init_time(metadata[name].replace(':', '').replace(' ', 'T'))
+    return None
+
+
+def _is_processed(s3_client, bucket_name, key, result_marker):
+    try:
+        s3_client.head_object(Bucket=bucket_name, Key=f'{key[:-3]}/{result_marker}')
+        return True
+    except Exception:
+        return False
+
+
+def build_time_pairs(objects, bucket_name, s3_client=None, result_prefixes=(), result_marker='result/_COMPLETE'):
+    """
+    按起报时间构建 (netcdf, grib) 文件对
+
+    Args:
+        objects: list_objects_v2 返回的对象列表（包含 Key/ETag/LastModified）
+        bucket_name: 存储桶名称
+        s3_client: 用于读取元数据和检查结果的S3客户端，为 None 时只按文件名解析
+        result_prefixes: 目录中已存在的子目录前缀（list_objects_v2 的 CommonPrefixes），
+            只有存在结果目录的起报时间才需要检查是否已经完成
+        result_marker: 相对输入文件目录的完成标记，默认是推理容器在全部结果上传后写出的
+            result/_COMPLETE，与输出格式、预报时效和产品无关
+
+    Returns:
+        (pairs, report): 文件对列表和各类被跳过的文件统计
+    """
+    report = {'no_time': [], 'unknown_kind': [], 'duplicates': 0, 'unpaired': [], 'processed': []}
+    groups = {}
+
+    for obj in objects:
+        key = obj['Key']
+        file_name = os.path.basename(key)
+
+        init_time = parse_init_time(file_name)
+        if init_time is None and s3_client is not None:
+            init_time = _header_init_time(s3_client, bucket_name, key)
+        if init_time is None:
+            report['no_time'].append(key)
+            continue
+
+        kind = detect_kind(file_name)
+        if kind is None:
+            report['unknown_kind'].append(key)
+            continue
+
+        slots = groups.setdefault(init_time, {})
+        current = slots.get(kind)
+        if current is not None:
+            report['duplicates'] += 1
+            # 同一起报时间的同类文件只保留最新上传的一个；内容相同（ETag 相同）的重复上传保留已有的。
+            # 不同起报时间或不同类型的文件即使内容相同也是不同的输入，不在这里去重
+            if obj.get('ETag') and obj['ETag'] == current.get('ETag'):
+                continue
+            if obj.get('LastModified') and current.get('LastModified') and obj['LastModified'] <= current['LastModified']:
+                continue
+        slots[kind] = obj
+
+    result_prefixes = set(result_prefixes)
+    pairs = []
+    for init_time in sorted(groups):
+        slots = groups[init_time]
+        if 'netcdf' not in slots or 'grib' not in slots:
+            report['unpaired'] += [o['Key'] for o in slots.values()]
+            continue
+        netcdf_key = slots['netcdf']['Key']
+        if (s3_client is not None and f'{netcdf_key[:-3]}/' in result_prefixes
+                and _is_processed(s3_client, bucket_name, netcdf_key, result_marker)):
+            report['processed'].append(netcdf_key)
+            continue
+        pairs.append({
+            'filename1': f's3://{bucket_name}/{netcdf_key}',
+            'filename2': f's3://{bucket_name}/{slots["grib"]["Key"]}',
+            'init_time': init_time.strftime('%Y%m%d-%H'),
+        })
+
+    return pairs, report
@@ -0,0 +1,183 @@
+"""
+已提交的输入文件对的状态记录
+
+过去每个 _SUCCESS 都会重新列出整个目录、重建全部文件对并提交覆盖所有文件的
+批量转换任务，只有已经写出完成标记的起报时间才会被跳过，仍在运行或
+排队的起报时间会被重复预报。状态记录按文件对的 (起报时间, netcdf ETag, grib ETag)
+记下已经提交的工作，之后的触发只提交新的文件对；同一起报时间的文件被替换后
+ETag 变化，会被当作新的工作重新预报。
+
+两种实现，由环境变量 STATE_STORE 选择:
+  - sqlite:///path/to/state.db  本地文件，用于本地测试（local_stub.py）或单个容器
+  - s3://bucket/prefix/          每个文件对一个标记对象，Lambda 默认使用；
+                                 并发执行的 Lambda 之间没有原子的认领，部署时
+                                 把函数的预留并发设为1（deploy.py）
+
+claim 认领尚未记录的文件对，提交失败时用 release 释放，下一次触发会重新提交。
+mark 记下文件对所在的批量转换任务，任务在结束前一直是待确认的（pending_jobs）；
+任务失败或被停止时 settle 释放它的文件对，由下一次触发重新提交。expire 释放超过
+有效期的记录（例如认领后 Lambda 中断、没有提交任务的文件对），之后按完成标记判断是否重新预报。
+"""
+import json
+import os
+import sqlite3
+import time
+from urllib.parse import urlparse
+
+__all__ = ["S3StateStore", "SQLiteStateStore", "make_state_store", "pair_key"]
+
+
+def pair_key(pair, etags):
+    """文件对的状态键：起报时间和两个输入文件的 ETag"""
+    return f"{pair['init_time']}_{etags[pair['filename1']]}_{etags[pair['filename2']]}"
+
+
+class SQLiteStateStore:
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.conn.execute('CREATE TABLE IF NOT EXISTS pairs (key TEXT PRIMARY KEY, job TEXT, '
+                          'filename1 TEXT, submitted REAL)')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS jobs (job TEXT PRIMARY KEY, submitted REAL)')
+
+    def claim(self, pairs, job=None):
+        """
+        认领尚未记录的文件对
+
+        Args:
+            pairs: {状态键: 文件对}
+        Returns:
+            新认领的状态键列表
+        """
+        claimed = []
+        now = time.time()
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            for key, pair in pairs.items():
+                cursor = self.conn.execute('INSERT OR IGNORE INTO pairs VALUES (?, ?, ?, ?)',
+                                           (key, job, pair['filename1'], now))
+                if cursor.rowcount:
+                    claimed.append(key)
+            self.conn.execute('COMMIT')
+        except Exception:
+            self.conn.execute('ROLLBACK')
+            raise
+        return claimed
+
+    def mark(self, pairs, job):
+        """记录文件对（{状态键: 文件对}）所在的批量转换任务"""
+        self.conn.executemany('UPDATE pairs SET job = ? WHERE key = ?', [(job, key) for key in pairs])
+        self.conn.execute('INSERT OR REPLACE INTO jobs VALUES (?, ?)', (job, time.time()))
+
+    def release(self, keys):
+        self.conn.executemany('DELETE FROM pairs WHERE key = ?', [(key,) for key in keys])
+
+    def pending_jobs(self):
+        """尚未确认结束的任务: {任务名: 状态键列表}"""
+        jobs = {job: [] for job, in self.conn.execute('SELECT job FROM jobs')}
+        for key, job in self.conn.execute('SELECT key, job FROM pairs WHERE job IN (SELECT job FROM jobs)'):
+            jobs[job].append(key)
+        return jobs
+
+    def settle(self, job, keys, failed):
+        """任务结束：failed 为真时释放它的文件对（pending_jobs 中的状态键）"""
+        if failed:
+            self.release(keys)
+        self.conn.execute('DELETE FROM jobs WHERE job = ?', (job,))
+
+    def expire(self, max_age, keep=()):
+        """释放 max_age 秒之前记录的、不在 keep 中的文件对，返回释放的状态键"""
+        cutoff = time.time() - max_age
+        keep = set(keep)
+        keys = [key for key, in self.conn.execute('SELECT key FROM pairs WHERE submitted < ?', (cutoff,))
+                if key not in keep]
+        self.release(keys)
+        return keys
+
+    def __len__(self):
+        return self.conn.execute('SELECT COUNT(*) FROM pairs').fetchone()[0]
+
+
+class S3StateStore:
+
+    def __init__(self, s3_client, bucket, prefix):
+        self.s3 = s3_client
+        self.bucket = bucket
+        self.prefix = prefix.rstrip('/') + '/' if prefix else ''
+
+    def _recorded(self):
+        """列出标记前缀一次，得到全部已记录的状态键及其写入时间（jobs/ 下的任务记录不计）"""
+        keys = {}
+        for page in self.s3.get_paginator('list_objects_v2').paginate(Bucket=self.bucket, Prefix=self.prefix,
+                                                                      Delimiter='/'):
+            for obj in page.get('Contents', []):
+                if obj['Key'].endswith('.json'):
+                    keys[obj['Key'][len(self.prefix):-len('.json')]] = obj['LastModified'].timestamp()
+        return keys
+
+    def _put(self, key, pair, job):
+        body = json.dumps({'filename1': pair['filename1'], 'filename2': pair['filename2'], 'job': job,
+                           'submitted': time.time()})
+        self.s3.put_object(Bucket=self.bucket, Key=f'{self.prefix}{key}.json', Body=body.encode('utf-8'),
+                           ContentType='application/json')
+
+    def claim(self, pairs, job=None):
+        recorded = self._recorded()
+        claimed = []
+        for key, pair in pairs.items():
+            if key not in recorded:
+                self._put(key, pair, job)
+                claimed.append(key)
+        return claimed
+
+    def mark(self, pairs, job):
+        for key, pair in pairs.items():
+            self._put(key, pair, job)
+        # 每个未结束的任务一个记录对象，列出 jobs/ 即可得到待确认的任务，不必读取每个文件对的记录
+        body = json.dumps({'keys': list(pairs), 'submitted': time.time()})
+        self.s3.put_object(Bucket=self.bucket, Key=f'{self.prefix}jobs/{job}.json', Body=body.encode('utf-8'),
+                           ContentType='application/json')
+
+    def release(self, keys):
+        for key in keys:
+            self.s3.delete_object(Bucket=self.bucket, Key=f'{self.prefix}{key}.json')
+
+    def pending_jobs(self):
+        jobs = {}
+        for page in self.s3.get_paginator('list_objects_v2').paginate(Bucket=self.bucket,
+                                                                      Prefix=f'{self.prefix}jobs/'):
+            for obj in page.get('Contents', []):
+                job = obj['Key'][len(self.prefix) + len('jobs/'):-len('.json')]
+                body = self.s3.get_object(Bucket=self.bucket, Key=obj['Key'])['Body'].read()
+                jobs[job] = json.loads(body)['keys']
+        return jobs
+
+    def settle(self, job, keys, failed):
+        if failed:
+            self.release(keys)
+        self.s3.delete_object(Bucket=self.bucket, Key=f'{self.prefix}jobs/{job}.json')
+
+    def expire(self, max_age, keep=()):
+        cutoff = time.time() - max_age
+        keep = set(keep)
+        keys = [key for key, submitted in self._recorded().items() if submitted < cutoff and key not in keep]
+        self.release(keys)
+        return keys
+
+    def __len__(self):
+        return len(self._recorded())
+
+
+def make_state_store(spec, s3_client=None):
+    """按 STATE_STORE 创建状态记录，为空时返回 None（不记录，每次提交全部未完成的文件对）"""
+    if not spec:
+        return None
+    if spec.startswith('sqlite://'):
+        path = spec[len('sqlite://'):]
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        return SQLiteStateStore(path)
+    if spec.startswith('s3://'):
+        parsed = urlparse(spec)
+        return S3StateStore(s3_client, parsed.netloc, parsed.path.lstrip('/'))
+    raise ValueError(f'不支持的 STATE_STORE: {spec}，可选 sqlite:///path 或 s3://bucket/prefix/')
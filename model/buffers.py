@@ -0,0 +1,157 @@
+"""
+自回归循环的预分配缓冲区
+
+BufferRing 预先分配固定数量的状态缓冲区，onnxruntime 通过 IO binding
+把每一步的输出直接写入其中。每一步的输出 new_input[:, -1] 只是缓冲区的视图，
+后台写线程借用它完成序列化和上传后再归还，因此整个循环不再为每一步
+分配新的数组，稳态内存由环的大小决定。写线程跟不上时 acquire 会阻塞，
+起到反压作用。
+"""
+import queue
+import threading
+import time
+
+import numpy as np
+
+__all__ = ["BufferRing", "RingSession", "StepWriter"]
+
+
+class BufferRing:
+
+    def __init__(self, shape, dtype=np.float32, size=4):
+        self.buffers = [np.empty(shape, dtype=dtype) for _ in range(size)]
+        self.refs = [0] * size
+        self._cond = threading.Condition()
+        self.acquires = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.peak_in_use = 0
+
+    @property
+    def nbytes(self):
+        return sum(b.nbytes for b in self.buffers)
+
+    def acquire(self):
+        """取一个空闲缓冲区，引用计数置1；没有空闲缓冲区时等待归还"""
+        with self._cond:
+            start = time.perf_counter()
+            waited = False
+            while 0 not in self.refs:
+                waited = True
+                self._cond.wait()
+            if waited:
+                self.waits += 1
+                self.wait_time += time.perf_counter() - start
+            index = self.refs.index(0)
+            self.refs[index] = 1
+            self.acquires += 1
+            self.peak_in_use = max(self.peak_in_use, sum(1 for r in self.refs if r))
+            return index
+
+    def retain(self, index):
+        with self._cond:
+            self.refs[index] += 1
+
+    def release(self, index):
+        with self._cond:
+            self.refs[index] -= 1
+            if self.refs[index] == 0:
+                self._cond.notify_all()
+
+    def report(self):
+        return {
+            'buffers': len(self.buffers),
+            'buffer_mb': round(self.buffers[0].nbytes / 2**20, 1),
+            'total_mb': round(self.nbytes / 2**20, 1),
+            'peak_in_use': self.peak_in_use,
+            'acquires': self.acquires,
+            'waits': self.waits,
+            'wait_sec': round(self.wait_time, 3),
+        }
+
+
+class RingSession:
+    """
+    包装 onnxruntime 会话，通过 IO binding 把输出写入 BufferRing
+
+    run() 的返回值与 session.run 相同（单个输出的列表），last_index 为本步
+    输出所在的缓冲区编号。上一步的状态缓冲区在本步完成后释放。
+    """
+
+    def __init__(self, session, ring):
+        self.ring = ring
+        self.last_index = None
+        self.use(session)
+
+    def use(self, session):
+        """切换到下一个阶段的会话，上一阶段最后的状态缓冲区作为新阶段的输入继续保留"""
+        self.session = session
+        self.output_name = session.get_outputs()[0].name
+        return self
+
+    def detach(self):
+        """释放对当前阶段会话的引用，状态缓冲区保留；下一个阶段由 use 接上"""
+        self.session = None
+
+    def run(self, output_names, feeds):
+        index = self.ring.acquire()
+        buffer = self.ring.buffers[index]
+        binding = self.session.io_binding()
+        for name, value in feeds.items():
+            binding.bind_cpu_input(name, np.ascontiguousarray(value))
+        binding.bind_output(self.output_name, 'cpu', 0, buffer.dtype, buffer.shape, buffer.ctypes.data)
+        self.session.run_with_iobinding(binding)
+
+        if self.last_index is not None:
+            self.ring.release(self.last_index)
+        self.last_index = index
+        return [buffer]
+
+    def close(self):
+        if self.last_index is not None:
+            self.ring.release(self.last_index)
+            self.last_index = None
+
+
+class StepWriter:
+    """
+    后台写线程：按提交顺序执行序列化和上传任务
+
+    Args:
+        max_pending: 排队任务数上限，超过时 submit 阻塞
+    """
+
+    def __init__(self, max_pending=2):
+        self.tasks = queue.Queue(maxsize=max_pending)
+        self.error = None
+        self.busy_time = 0.0
+        self.thread = threading.Thread(target=self._run, name='fuxi-step-writer', daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            task = self.tasks.get()
+            if task is None:
+                return
+            fn, done = task
+            start = time.perf_counter()
+            try:
+                fn()
+            except Exception as e:
+                print(f"写出结果失败: {e}")
+                if self.error is None:
+                    self.error = e
+            finally:
+                done()
+            self.busy_time += time.perf_counter() - start
+
+    def submit(self, fn, done):
+        """fn 执行写出，done 在完成（无论成功与否）后调用，用于归还缓冲区"""
+        self.tasks.put((fn, done))
+
+    def close(self):
+        """等待所有任务完成，有任务失败时抛出第一个异常"""
+        self.tasks.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
@@ -0,0 +1,207 @@
+"""
+跨请求复用的输入数据缓存
+
+同一个输入对象经常被多条记录引用（批量转换中奇数个文件会回绕到第一个文件，
+重跑也很常见），每次都下载再删除浪费带宽和时间。InputCache 分两级：
+
+  - 磁盘：按 S3 ETag 为键的 LRU 缓存，总大小受限；正在使用的文件有引用计数，
+    不会被淘汰。缓存文件名包含 ETag，进程重启后可以从目录中恢复索引。
+  - 内存：解码后的数组按 ETag 缓存，同样按总字节数做 LRU 淘汰。
+
+对象内容变化时 ETag 随之变化，旧的缓存条目不再被命中，最终被淘汰。
+"""
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+
+__all__ = ["InputCache"]
+
+
+class _Entry:
+
+    def __init__(self, etag, path, size):
+        self.etag = etag
+        self.path = path
+        self.size = size
+        self.refs = 0
+        self.ready = threading.Event()
+        self.error = None
+
+
+class InputCache:
+    """
+    Args:
+        cache_dir: 磁盘缓存目录
+        max_bytes: 磁盘缓存总大小上限，0 表示文件释放后立即删除
+        head_fn: 查询对象元数据的函数，参数为 s3_path，返回 (etag, size)
+        download_fn: 下载函数，参数为 (s3_path, local_dir)，返回本地文件路径
+        memory_bytes: 解码数组内存缓存的总大小上限，0 表示不缓存
+    """
+
+    def __init__(self, cache_dir, max_bytes, head_fn, download_fn, memory_bytes=0):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.head_fn = head_fn
+        self.download_fn = download_fn
+        self.memory_bytes = memory_bytes
+        self._entries = OrderedDict()
+        self._paths = {}
+        self._memory = OrderedDict()
+        self._memory_size = 0
+        self._lock = threading.Lock()
+        self.stats = {
+            'hits': 0, 'misses': 0, 'evictions': 0,
+            'bytes_downloaded': 0, 'bytes_evicted': 0,
+            'memory_hits': 0, 'memory_misses': 0, 'memory_evictions': 0,
+        }
+        self._restore()
+
+    @property
+    def size(self):
+        return sum(e.size for e in self._entries.values())
+
+    def _restore(self):
+        """从缓存目录恢复索引，文件名格式为 {etag}_{原文件名}"""
+        if not os.path.isdir(self.cache_dir):
+            return
+        files = [os.path.join(self.cache_dir, f) for f in os.listdir(self.cache_dir)
+                 if '_' in f and not f.startswith('.')]
+        for path in sorted(files, key=os.path.getmtime):
+            if not os.path.isfile(path):
+                continue
+            etag = os.path.basename(path).split('_', 1)[0]
+            entry = _Entry(etag, path, os.path.getsize(path))
+            entry.ready.set()
+            self._entries[etag] = entry
+            self._paths[path] = entry
+
+    def acquire(self, s3_path):
+        """
+        返回 s3_path 对应的本地文件，引用计数加1，用完后需要调用 release
+
+        同一个对象同时被多个线程请求时只下载一次，其余线程等待下载完成。
+        """
+        etag, size = self.head_fn(s3_path)
+        with self._lock:
+            entry = self._entries.get(etag)
+            if entry is not None and entry.ready.is_set() and not os.path.exists(entry.path):
+                # 文件已被删除（例如被其他工作进程淘汰），重新下载
+                self._forget(entry)
+                entry = None
+            if entry is None:
+                path = os.path.join(self.cache_dir, f"{etag}_{os.path.basename(s3_path)}")
+                entry = _Entry(etag, path, size)
+                self._entries[etag] = entry
+                self._paths[path] = entry
+                download = True
+                self.stats['misses'] += 1
+            else:
+                download = False
+                self.stats['hits'] += 1
+            entry.refs += 1
+            self._entries.move_to_end(etag)
+
+        if download:
+            self._download(entry, s3_path)
+        else:
+            entry.ready.wait()
+        if entry.error is not None:
+            self.release(entry.path)
+            raise entry.error
+        return entry.path
+
+    def _download(self, entry, s3_path):
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            partial_dir = tempfile.mkdtemp(prefix='.partial-', dir=self.cache_dir)
+            try:
+                local_path = self.download_fn(s3_path, local_dir=partial_dir)
+                os.replace(local_path, entry.path)
+            finally:
+                shutil.rmtree(partial_dir, ignore_errors=True)
+            entry.size = os.path.getsize(entry.path)
+            with self._lock:
+                self.stats['bytes_downloaded'] += entry.size
+        except Exception as e:
+            entry.error = e
+            with self._lock:
+                self._forget(entry)
+        finally:
+            entry.ready.set()
+
+    def release(self, path):
+        """引用计数减1，并淘汰超出大小上限的未使用文件"""
+        with self._lock:
+            entry = self._paths.get(path)
+            if entry is None:
+                return
+            entry.refs -= 1
+            self._evict()
+
+    def _forget(self, entry):
+        if self._entries.get(entry.etag) is entry:
+            del self._entries[entry.etag]
+        if self._paths.get(entry.path) is entry:
+            del self._paths[entry.path]
+
+    def _evict(self):
+        size = self.size
+        for entry in list(self._entries.values()):
+            if size <= self.max_bytes:
+                break
+            if entry.refs > 0 or not entry.ready.is_set():
+                continue
+            self._forget(entry)
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+            size -= entry.size
+            self.stats['evictions'] += 1
+            self.stats['bytes_evicted'] += entry.size
+
+    def load(self, path, loader):
+        """
+        返回 acquire 得到的文件解码后的结果，按 ETag 缓存在内存中
+
+        loader 的参数为本地文件路径，返回值需要有 nbytes 属性。
+        缓存的对象会被多个请求共享，调用方不能原地修改。
+        """
+        with self._lock:
+            entry = self._paths.get(path)
+            key = entry.etag if entry is not None else path
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.stats['memory_hits'] += 1
+                return self._memory[key]
+            self.stats['memory_misses'] += 1
+
+        value = loader(path)
+        nbytes = int(getattr(value, 'nbytes', 0))
+        if nbytes == 0 or nbytes > self.memory_bytes:
+            return value
+        with self._lock:
+            if key not in self._memory:
+                self._memory[key] = value
+                self._memory_size += nbytes
+            while self._memory_size > self.memory_bytes:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_size -= int(evicted.nbytes)
+                self.stats['memory_evictions'] += 1
+        return value
+
+    def report(self):
+        with self._lock:
+            lookups = self.stats['hits'] + self.stats['misses']
+            return {
+                **self.stats,
+                'hit_rate': round(self.stats['hits'] / lookups, 3) if lookups else None,
+                'files': len(self._entries),
+                'in_use': sum(1 for e in self._entries.values() if e.refs > 0),
+                'disk_mb': round(self.size / 2**20, 1),
+                'max_disk_mb': round(self.max_bytes / 2**20, 1),
+                'memory_items': len(self._memory),
+                'memory_mb': round(self._memory_size / 2**20, 1),
+            }
@@ -0,0 +1,166 @@
+"""
+每次预报的结果目录（catalog）
+
+下游任务过去只拿到一串 s3_paths，要知道每个文件里有什么（时效、大小、数值范围、
+是否出现 NaN）只能把网格逐个打开。ForecastCatalog 在推理循环中记录每一步
+按通道的 min/max/mean/NaN 个数，在上传时记录文件的 S3 路径、大小和 ETag，
+预报结束后写出一个 JSON（或 Parquet 长表），与结果文件放在同一个目录下。
+
+按通道的统计在一次遍历中完成：每个通道按约 1MB 的块处理，块在缓存中时
+依次做 min/max/sum 三个归约；min 不是 NaN 说明块中没有 NaN（NaN 会传播到 min），
+只有出现 NaN 的块才额外计数并改用忽略 NaN 的归约。
+"""
+import json
+import os
+import threading
+
+import numpy as np
+
+from lazy import lazy_module
+from util import parquet_available
+
+pd = lazy_module('pandas')
+
+__all__ = ["ForecastCatalog", "channel_stats"]
+
+FORMATS = {'json': '.json', 'parquet': '.parquet'}
+STATS = ('min', 'max', 'mean', 'nan')
+
+
+def channel_stats(output, block=2**18):
+    """
+    单步输出 (1, C, lat, lon) 按通道的 min/max/mean/NaN 个数
+
+    Returns:
+        dict: 每个统计量一个长度为 C 的数组；全部为 NaN 的通道 min/max/mean 为 NaN
+    """
+    grid = np.asarray(output).reshape(output.shape[-3], -1)
+    channels, size = grid.shape
+    stats = {'min': np.empty(channels, dtype=np.float64), 'max': np.empty(channels, dtype=np.float64),
+             'mean': np.empty(channels, dtype=np.float64), 'nan': np.zeros(channels, dtype=np.int64)}
+    for c in range(channels):
+        row = grid[c]
+        lo, hi, total, nan = np.inf, -np.inf, 0.0, 0
+        for start in range(0, size, block):
+            chunk = row[start:start + block]
+            chunk_min = chunk.min()
+            if np.isnan(chunk_min):
+                count = int(np.count_nonzero(np.isnan(chunk)))
+                nan += count
+                if count == len(chunk):
+                    continue
+                chunk_min, chunk_max, chunk_sum = np.nanmin(chunk), np.nanmax(chunk), np.nansum(chunk)
+            else:
+                chunk_max, chunk_sum = chunk.max(), chunk.sum()
+            lo = min(lo, float(chunk_min))
+            hi = max(hi, float(chunk_max))
+            total += float(chunk_sum)
+        valid = size - nan
+        stats['min'][c] = lo if valid else np.nan
+        stats['max'][c] = hi if valid else np.nan
+        stats['mean'][c] = total / valid if valid else np.nan
+        stats['nan'][c] = nan
+    return stats
+
+
+def _number(value):
+    """JSON 不支持 NaN/Inf，写为 null"""
+    value = float(value)
+    return value if np.isfinite(value) else None
+
+
+class ForecastCatalog:
+    """
+    Args:
+        level_names: 输出通道名称（data.level）
+        init_time: 起报时间
+        freq: 每一步的时效（小时）
+        meta: 写入目录的其他信息（模型变体、输出格式等）
+    """
+
+    def __init__(self, level_names, init_time, freq=6, meta=None):
+        self.channels = [str(name) for name in level_names]
+        self.init_time = pd.Timestamp(init_time)
+        self.freq = freq
+        self.meta = dict(meta or {})
+        self.steps = {}
+        self.products = []
+        self._lock = threading.Lock()
+
+    def _step(self, step):
+        if step not in self.steps:
+            lead = (step + 1) * self.freq
+            self.steps[step] = {'step': step + 1, 'lead_hours': lead,
+                                'valid_time': str(self.init_time + pd.Timedelta(hours=lead)),
+                                'files': [], 'stats': None}
+        return self.steps[step]
+
+    def add_stats(self, step, output):
+        """计算并记录一步输出的按通道统计，返回用于日志的汇总 (min, max, NaN 个数)"""
+        stats = channel_stats(output)
+        with self._lock:
+            self._step(step)['stats'] = stats
+        return np.fmin.reduce(stats['min']), np.fmax.reduce(stats['max']), int(stats['nan'].sum())
+
+    def add_file(self, step, s3_path, info=None):
+        """记录上传的文件；step 为 None 时为聚合产品、站点表等非单步的结果"""
+        entry = {'s3_path': s3_path, **{k: v for k, v in (info or {}).items() if k in ('bytes', 'etag')}}
+        with self._lock:
+            if step is None:
+                self.products.append(entry)
+            else:
+                self._step(step)['files'].append(entry)
+
+    def to_dict(self):
+        with self._lock:
+            steps = []
+            for step in sorted(self.steps):
+                record = dict(self.steps[step])
+                stats = record['stats']
+                if stats is not None:
+                    record['stats'] = {k: [_number(v) for v in stats[k]] if k != 'nan' else stats[k].tolist()
+                                       for k in STATS}
+                    record['nan_total'] = int(stats['nan'].sum())
+                steps.append(record)
+            return {'init_time': str(self.init_time), 'freq_hours': self.freq, **self.meta,
+                    'channels': self.channels, 'steps': steps, 'products': list(self.products)}
+
+    def to_frame(self):
+        """每个 (时效, 通道) 一行的长表，文件信息按时效重复；非单步的结果各占一行，step 为空"""
+        rows = []
+        with self._lock:
+            for step in sorted(self.steps):
+                record = self.steps[step]
+                files = record['files'] or [{}]
+                stats = record['stats']
+                for file in files:
+                    for c, channel in enumerate(self.channels):
+                        row = {'step': record['step'], 'lead_hours': record['lead_hours'],
+                               'valid_time': record['valid_time'], 'channel': channel,
+                               's3_path': file.get('s3_path'), 'bytes': file.get('bytes'),
+                               'etag': file.get('etag')}
+                        if stats is not None:
+                            row.update({k: stats[k][c] for k in STATS})
+                        rows.append(row)
+            rows += [dict(product) for product in self.products]
+        frame = pd.DataFrame(rows)
+        frame['valid_time'] = pd.to_datetime(frame['valid_time'])
+        frame['init_time'] = self.init_time
+        return frame
+
+    def save(self, save_dir, name='catalog', fmt='json'):
+        """写出目录，返回文件路径；没有安装 pyarrow/fastparquet 时改写 JSON"""
+        if fmt not in FORMATS:
+            raise ValueError(f"不支持的目录格式: {fmt}，可选 {sorted(FORMATS)}")
+        if fmt == 'parquet' and not parquet_available():
+            print('catalog: 未安装 pyarrow/fastparquet，目录改为JSON')
+            fmt = 'json'
+
+        os.makedirs(save_dir, exist_ok=True)
+        save_name = os.path.join(save_dir, name + FORMATS[fmt])
+        if fmt == 'json':
+            with open(save_name, 'w') as f:
+                json.dump(self.to_dict(), f)
+        else:
+            self.to_frame().to_parquet(save_name, index=False)
+        return save_name
@@ -0,0 +1,134 @@
+"""
+CPU 推理：线程设置、内存上限和阶段流式加载
+
+没有GPU的实例可以作为批量任务的溢出层。CPU 上全球网格的状态（约 580MB）和
+单个阶段的权重都在主存中，三个阶段的权重同时常驻时内存需求成倍增加，
+因此设置了 FUXI_CPU_MEMORY_MB 时进入内存受限模式：
+
+- 同一时刻只加载一个级联阶段：不常驻会话，阶段结束后释放再加载下一个，
+  多记录请求逐条执行，不使用阶段流水线
+- ORT 使用环境中注册的有界 CPU arena（kSameAsRequested），
+  上限为总预算减去权重、状态缓冲区和请求处理时才分配的内存（解码输入的内存缓存、
+  编码进程池的共享内存槽和编码时的复制）
+- 启动时按权重、状态缓冲区和 arena 估算内存，并用最大的阶段预热一次，
+  测得的进程峰值内存超过上限时直接失败，而不是在数小时的预报中被OOM终止
+
+线程数默认使用进程可用的全部核（考虑 CPU 亲和性和 cgroup 配额），
+单个算子内并行（intra-op），算子之间顺序执行。
+"""
+import os
+import resource
+
+from lazy import lazy_module
+
+ort = lazy_module('onnxruntime')
+onnx = lazy_module('onnx')
+
+__all__ = ["available_cores", "memory_limit", "peak_rss", "configure_options", "memory_plan", "register_arena",
+           "state_bytes"]
+
+_arena_bytes = None
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def available_cores():
+    """进程可用的核数：CPU 亲和性与 cgroup 的 cpu.max 配额中较小者"""
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else (os.cpu_count() or 1)
+    quota = _read('/sys/fs/cgroup/cpu.max')
+    if quota and not quota.startswith('max'):
+        limit, period = quota.split()
+        cores = min(cores, max(1, int(int(limit) / int(period))))
+    return cores
+
+
+def memory_limit():
+    """物理内存与 cgroup 内存上限中较小者（字节）"""
+    limit = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    for path in ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes'):
+        value = _read(path)
+        if value and value.isdigit():
+            limit = min(limit, int(value))
+    return limit
+
+
+def peak_rss():
+    """进程的峰值常驻内存（字节）"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def register_arena(max_bytes):
+    """在 ORT 环境中注册有界的 CPU arena，进程内只注册一次，返回实际使用的上限"""
+    global _arena_bytes
+    if _arena_bytes is None:
+        info = ort.OrtMemoryInfo('Cpu', ort.OrtAllocatorType.ORT_ARENA_ALLOCATOR, 0, ort.OrtMemType.DEFAULT)
+        ort.create_and_register_allocator(info, ort.OrtArenaCfg({'max_mem': int(max_bytes),
+                                                                 'arena_extend_strategy': 1}))
+        _arena_bytes = int(max_bytes)
+    return _arena_bytes
+
+
+def configure_options(options, threads=None, inter_threads=None, arena_bytes=None):
+    """
+    设置 CPU 会话的线程和内存选项
+
+    Args:
+        threads: 算子内线程数，默认 FUXI_CPU_THREADS 或全部可用核
+        inter_threads: 算子间线程数，默认 FUXI_CPU_INTER_THREADS 或1（顺序执行）
+        arena_bytes: 有界 arena 的上限，None 时不使用 arena（与 GPU 路径的设置一致）
+    """
+    threads = threads or int(os.environ.get('FUXI_CPU_THREADS', '0')) or available_cores()
+    inter_threads = inter_threads or int(os.environ.get('FUXI_CPU_INTER_THREADS', '1'))
+    options.intra_op_num_threads = threads
+    options.inter_op_num_threads = inter_threads
+    # CPU 上中间结果的缓冲区复用可以显著降低峰值内存
+    options.enable_mem_reuse = True
+    options.execution_mode = (ort.ExecutionMode.ORT_PARALLEL if inter_threads > 1
+                              else ort.ExecutionMode.ORT_SEQUENTIAL)
+    if arena_bytes:
+        register_arena(arena_bytes)
+        options.enable_cpu_mem_arena = True
+        options.add_session_config_entry('session.use_env_allocators', '1')
+    return options
+
+
+def memory_plan(cap_bytes, weights_bytes, state_bytes, buffers, reserved=None):
+    """
+    内存受限模式的预算：cap = 单个阶段的权重 + 状态缓冲区 + 预留 + arena
+
+    Args:
+        weights_bytes: 最大的阶段的图和外部权重大小
+        state_bytes: 一份自回归状态 (1, 2, C, lat, lon) 的大小
+        buffers: 同时存在的状态份数（输入、输出和缓冲环）
+        reserved: {名称: 字节数}，预热时还不存在、处理请求时才分配的内存
+
+    Raises:
+        RuntimeError: 预算不足以容纳权重、状态和预留
+    """
+    reserved = reserved or {}
+    fixed = weights_bytes + state_bytes * buffers + sum(reserved.values())
+    arena = cap_bytes - fixed
+    plan = {'cap_mb': round(cap_bytes / 2**20), 'weights_mb': round(weights_bytes / 2**20),
+            'state_mb': round(state_bytes * buffers / 2**20)}
+    plan.update({f'{name}_mb': round(size / 2**20) for name, size in reserved.items()})
+    plan['arena_mb'] = round(arena / 2**20)
+    if arena <= 0:
+        raise RuntimeError(f'FUXI_CPU_MEMORY_MB 不足以容纳单个阶段的权重、状态缓冲区和请求处理的预留'
+                           f'（可减少 FUXI_SERIALIZER_WORKERS）: {plan}')
+    return plan
+
+
+def state_bytes(model_name):
+    """从图的输入形状（不读取外部权重）计算一份自回归状态的大小，符号维度按1计算"""
+    graph = onnx.load(model_name, load_external_data=False).graph
+    dims = [d.dim_value or 1 for d in graph.input[0].type.tensor_type.shape.dim]
+    size = 4
+    for dim in dims:
+        size *= dim
+    return size
@@ -0,0 +1,140 @@
+"""
+多设备调度：每个设备一套常驻的 short/medium/long 会话，
+整条预报按设备分发，多GPU实例上的吞吐随GPU数量线性增长。
+
+设备列表来自环境变量：
+  FUXI_DEVICES       逗号分隔的设备号，例如 "0,1,2,3"；未设置时根据
+                     CUDA_VISIBLE_DEVICES 或 nvidia-smi 自动探测
+  FUXI_DEVICE_TYPE   cuda（默认）或 cpu；cpu 时设备号只是逻辑槽位，
+                     用于在没有GPU的环境中测试调度逻辑
+"""
+import os
+import queue
+import subprocess
+import threading
+import time
+
+__all__ = ["get_device_type", "discover_devices", "DevicePool"]
+
+
+def get_device_type():
+    return os.environ.get('FUXI_DEVICE_TYPE', 'cuda').lower()
+
+
+def discover_devices():
+    """
+    返回可用的设备号列表
+
+    CUDA_VISIBLE_DEVICES 会对进程内的设备重新编号，因此这里返回的是
+    0..n-1 的逻辑编号，可直接作为 onnxruntime 的 device_id。
+    """
+    devices = os.environ.get('FUXI_DEVICES')
+    if devices:
+        return [int(d) for d in devices.split(',') if d.strip()]
+
+    if get_device_type() == 'cpu':
+        return [0]
+
+    visible = os.environ.get('CUDA_VISIBLE_DEVICES')
+    if visible:
+        return list(range(len([d for d in visible.split(',') if d.strip()])))
+
+    try:
+        output = subprocess.run(['nvidia-smi', '--list-gpus'], capture_output=True,
+                                text=True, timeout=10).stdout
+        count = len([line for line in output.splitlines() if line.startswith('GPU')])
+    except Exception as e:
+        print(f"探测GPU失败: {e}")
+        count = 0
+    return list(range(max(count, 1)))
+
+
+class DevicePool:
+    """
+    每个设备一套会话，按需加载后常驻
+
+    Args:
+        devices: 设备号列表
+        load_fn: 加载单个阶段会话的函数，参数为 (stage, device_id)
+        stages: 阶段名称列表
+    """
+
+    def __init__(self, devices, load_fn, stages):
+        self.devices = list(devices)
+        self.load_fn = load_fn
+        self.stages = list(stages)
+        self._sessions = {d: {} for d in self.devices}
+        # 每个设备一把锁：不同设备上的会话并行加载，同一设备上的阶段不重复加载
+        self._locks = {d: threading.Lock() for d in self.devices}
+        self.stats = {d: {'forecasts': 0, 'busy_sec': 0.0} for d in self.devices}
+
+    def sessions(self, device_id, stages=None):
+        """返回设备上的会话，stages 中尚未加载的阶段在这里加载，默认加载全部阶段"""
+        with self._locks[device_id]:
+            sessions = self._sessions[device_id]
+            missing = [s for s in (self.stages if stages is None else stages) if s not in sessions]
+            if missing:
+                print(f"在设备 {device_id} 上加载会话 {missing} ...")
+                for stage in missing:
+                    sessions[stage] = self.load_fn(stage, device_id)
+            return sessions
+
+    def map(self, forecast_fn, requests, stages=None):
+        """
+        将请求分发到各个设备并行执行，每个设备一个工作线程从共享队列取任务
+
+        Args:
+            forecast_fn: 执行单条预报的函数，参数为 (request, sessions)
+            requests: 请求列表
+            stages: 需要加载的阶段，默认全部阶段
+
+        Returns:
+            与 requests 一一对应的结果列表
+        """
+        tasks = queue.Queue()
+        for index, request in enumerate(requests):
+            tasks.put((index, request))
+        results = [None] * len(requests)
+        load_errors = {}
+
+        def worker(device_id):
+            try:
+                sessions = self.sessions(device_id, stages)
+            except Exception as e:
+                # 该设备不可用，队列中的请求由其他设备处理
+                print(f"设备 {device_id} 加载会话失败: {e}")
+                load_errors[device_id] = e
+                return
+            while True:
+                try:
+                    index, request = tasks.get_nowait()
+                except queue.Empty:
+                    return
+                start = time.perf_counter()
+                try:
+                    results[index] = forecast_fn(request, sessions)
+                except Exception as e:
+                    print(f"设备 {device_id} 处理请求 {index} 失败: {e}")
+                    results[index] = {'s3_paths': [], 'error': str(e)}
+                self.stats[device_id]['forecasts'] += 1
+                self.stats[device_id]['busy_sec'] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        threads = [threading.Thread(target=worker, args=(d,), name=f'fuxi-device-{d}', daemon=True)
+                   for d in self.devices[:len(requests)]]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+        # 所有设备都加载失败时没有人处理的请求
+        for index, result in enumerate(results):
+            if result is None:
+                error = '; '.join(f'设备 {d}: {e}' for d, e in load_errors.items()) or '没有可用的设备'
+                results[index] = {'s3_paths': [], 'error': f'会话加载失败: {error}'}
+
+        print(f"多设备推理总耗时: {elapsed:.2f} sec")
+        for d in self.devices:
+            s = self.stats[d]
+            print(f"  设备 {d}: 累计预报数 {s['forecasts']}, 累计耗时 {s['busy_sec']:.2f} sec")
+        return results
@@ -0,0 +1,70 @@
+"""
+集合预报：由确定性初始场生成 N 个扰动成员，作为一个批次通过各级联阶段
+
+成员0为不加扰动的控制预报，其余成员在初始场上叠加高斯噪声，噪声幅度
+按通道取初始场空间标准差的 scale 倍。模型的 batch 维固定为1时，
+BatchedSession 逐成员调用会话，结果与批量执行一致。
+"""
+import numpy as np
+
+__all__ = ["perturb_initial_conditions", "BatchedSession", "ensemble_stats"]
+
+
+def perturb_initial_conditions(input, members, scale=0.01, seed=0):
+    """
+    Args:
+        input: 初始状态，形状为 (1, T, C, H, W)
+        members: 成员数
+        scale: 噪声幅度，相对每个通道的空间标准差
+        seed: 随机种子，相同种子得到相同的集合
+
+    Returns:
+        形状为 (members, T, C, H, W) 的 float32 数组
+    """
+    rng = np.random.default_rng(seed)
+    std = input.std(axis=(-2, -1), keepdims=True, dtype=np.float64).astype(np.float32)
+    ensemble = np.empty((members,) + input.shape[1:], dtype=np.float32)
+    ensemble[0] = input[0]
+    for m in range(1, members):
+        noise = rng.standard_normal(input.shape[1:], dtype=np.float32)
+        noise *= scale * std[0]
+        np.add(input[0], noise, out=ensemble[m])
+    return ensemble
+
+
+class BatchedSession:
+    """
+    让 batch 维固定为1的模型也能接收多成员输入
+
+    模型的 batch 维是动态的（或等于成员数）时直接调用原会话，否则逐成员执行后拼接。
+    """
+
+    def __init__(self, session):
+        self.session = session
+        batch = session.get_inputs()[0].shape[0]
+        self.fixed_batch = batch if isinstance(batch, int) else None
+
+    def run(self, output_names, feeds):
+        input = feeds['input']
+        if self.fixed_batch is None or self.fixed_batch == input.shape[0]:
+            return self.session.run(output_names, feeds)
+        outputs = []
+        for m in range(input.shape[0]):
+            member_feeds = dict(feeds, input=input[m:m + 1])
+            outputs.append(self.session.run(output_names, member_feeds))
+        return [np.concatenate(parts, axis=0) for parts in zip(*outputs)]
+
+
+def ensemble_stats(output):
+    """
+    计算集合平均和离散度（成员间标准差）
+
+    Args:
+        output: 形状为 (members, C, H, W)
+
+    Returns:
+        (mean, spread)，形状均为 (1, C, H, W)
+    """
+    mean = output.mean(axis=0, keepdims=True, dtype=np.float64)
+    spread = output.std(axis=0, keepdims=True, ddof=1 if output.shape[0] > 1 else 0, dtype=np.float64)
+    return mean.astype(np.float32), spread.astype(np.float32)
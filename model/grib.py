@@ -0,0 +1,155 @@
+"""
+直接输出 GRIB2
+
+下游数值预报工具链使用 GRIB2，过去需要在单独的任务中把每个时效的 NetCDF 再转换一遍。
+save_grib 与 util.save_like 参数相同，按 util.pl_names/sfc_names/levels 的通道
+划分把每个通道编码成一条 GRIB2 消息，一个时效写一个文件。
+
+每个通道的 eccodes 模板（网格、参数、层次、打包方式）按网格预先生成并缓存，
+每一步只需要克隆模板、设置时间和数值。默认使用 CCSDS 压缩（grid_ccsds），
+bitsPerValue 按变量的取值范围和所需精度设置。
+"""
+import os
+import re
+import threading
+
+import numpy as np
+
+from lazy import lazy_module
+from util import levels, pl_names, sfc_names
+
+eccodes = lazy_module('eccodes')
+pd = lazy_module('pandas')
+
+__all__ = ["save_grib", "grib_templates", "PACKING", "BITS_PER_VALUE"]
+
+# 等压面变量 -> paramId，层次为 util.levels 中的 hPa
+PL_PARAMS = {'z': 129, 't': 130, 'u': 131, 'v': 132, 'r': 157}
+# 地面变量 -> (paramId, typeOfLevel, level)
+SFC_PARAMS = {
+    't2m': (167, 'heightAboveGround', 2),
+    'u10': (165, 'heightAboveGround', 10),
+    'v10': (166, 'heightAboveGround', 10),
+    'msl': (151, 'meanSea', 0),
+    # 6小时累计降水，kg m-2（即mm）
+    'tp': (228228, 'surface', 0),
+}
+# 时段累计量，使用统计处理的产品模板
+ACCUMULATED = {'tp'}
+
+PACKING = os.environ.get('FUXI_GRIB_PACKING', 'grid_ccsds')
+# 每个变量的打包位数：z/msl 取值范围大，r 只需要 0.1% 的精度
+BITS_PER_VALUE = {'z': 16, 't': 12, 'u': 12, 'v': 12, 'r': 10,
+                  't2m': 12, 'u10': 12, 'v10': 12, 'msl': 16, 'tp': 16}
+
+assert set(PL_PARAMS) == set(pl_names) and set(SFC_PARAMS) == set(sfc_names)
+
+_templates = {}
+_templates_lock = threading.Lock()
+
+
+def parse_channel(name):
+    """通道名（例如 z500、t2m，大小写不敏感）-> (变量, paramId, typeOfLevel, level)，无法识别时返回 None"""
+    name = str(name).lower()
+    if name in SFC_PARAMS:
+        return (name,) + SFC_PARAMS[name]
+    match = re.fullmatch(r'([a-z]+)(\d+)', name)
+    if match and match.group(1) in PL_PARAMS and int(match.group(2)) in levels:
+        var = match.group(1)
+        return var, PL_PARAMS[var], 'isobaricInhPa', int(match.group(2))
+    return None
+
+
+def _grid_template(lat, lon):
+    handle = eccodes.codes_grib_new_from_samples('GRIB2')
+    eccodes.codes_set(handle, 'Ni', len(lon))
+    eccodes.codes_set(handle, 'Nj', len(lat))
+    eccodes.codes_set(handle, 'latitudeOfFirstGridPointInDegrees', float(lat[0]))
+    eccodes.codes_set(handle, 'latitudeOfLastGridPointInDegrees', float(lat[-1]))
+    eccodes.codes_set(handle, 'longitudeOfFirstGridPointInDegrees', float(lon[0]))
+    eccodes.codes_set(handle, 'longitudeOfLastGridPointInDegrees', float(lon[-1]))
+    eccodes.codes_set(handle, 'iDirectionIncrementInDegrees', abs(float(lon[1] - lon[0])))
+    eccodes.codes_set(handle, 'jDirectionIncrementInDegrees', abs(float(lat[1] - lat[0])))
+    # 纬度从北到南（与输入的 90 ~ -90 一致）
+    eccodes.codes_set(handle, 'jScansPositively', 0 if lat[0] > lat[-1] else 1)
+    eccodes.codes_set(handle, 'stepUnits', 'h')
+    return handle
+
+
+def grib_templates(names, lat, lon, members=False):
+    """
+    按通道生成 eccodes 模板并缓存，返回 [(通道序号, 变量, handle)]
+
+    同一个进程中网格和通道不变，模板只生成一次。members 为 True 时使用
+    集合成员的产品模板（PDT 1/11）。
+    """
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    key = (tuple(str(n) for n in names), lat.tobytes(), lon.tobytes(), members)
+    with _templates_lock:
+        if key in _templates:
+            return _templates[key]
+
+        base = _grid_template(lat, lon)
+        templates = []
+        for i, name in enumerate(names):
+            channel = parse_channel(name)
+            if channel is None:
+                print(f'GRIB2: 无法识别的通道 {name}，跳过')
+                continue
+            var, param_id, type_of_level, level = channel
+            handle = eccodes.codes_clone(base)
+            if var in ACCUMULATED:
+                eccodes.codes_set(handle, 'productDefinitionTemplateNumber', 11 if members else 8)
+            elif members:
+                eccodes.codes_set(handle, 'productDefinitionTemplateNumber', 1)
+            eccodes.codes_set(handle, 'typeOfLevel', type_of_level)
+            eccodes.codes_set(handle, 'level', level)
+            eccodes.codes_set(handle, 'paramId', param_id)
+            eccodes.codes_set(handle, 'bitsPerValue', BITS_PER_VALUE[var])
+            eccodes.codes_set(handle, 'packingType', PACKING)
+            templates.append((i, var, handle))
+        eccodes.codes_release(base)
+
+        # 只保留最近的几套模板（网格一般不变，集合成员另有一套）
+        while len(_templates) >= 4:
+            for _, _, handle in _templates.pop(next(iter(_templates))):
+                eccodes.codes_release(handle)
+        _templates[key] = templates
+        return templates
+
+
+def save_grib(output, input, step, save_dir="", freq=6, suffix="", members=False):
+    """
+    保存单步输出为 GRIB2，参数与 util.save_like 相同
+
+    output 形状为 (1, level, lat, lon)，members 为 True 时为 (member, level, lat, lon)，
+    每个成员写入带 perturbationNumber 的消息。
+    """
+    if save_dir:
+        os.makedirs(save_dir, exist_ok=True)
+        hours = (step + 1) * freq
+        init_time = pd.to_datetime(input.time.values[-1])
+        templates = grib_templates(input.level.values, input.lat.values, input.lon.values, members=members)
+
+        save_name = os.path.join(save_dir, f'{hours:03d}{suffix}.grib2')
+        with open(save_name, 'wb') as f:
+            for member in range(output.shape[0]):
+                for i, var, template in templates:
+                    handle = eccodes.codes_clone(template)
+                    try:
+                        eccodes.codes_set(handle, 'dataDate', int(init_time.strftime('%Y%m%d')))
+                        eccodes.codes_set(handle, 'dataTime', int(init_time.strftime('%H%M')))
+                        if var in ACCUMULATED:
+                            eccodes.codes_set(handle, 'startStep', hours - freq)
+                            eccodes.codes_set(handle, 'endStep', hours)
+                        else:
+                            eccodes.codes_set(handle, 'step', hours)
+                        if members:
+                            eccodes.codes_set(handle, 'perturbationNumber', member)
+                            eccodes.codes_set(handle, 'numberOfForecastsInEnsemble', output.shape[0])
+                        eccodes.codes_set_values(handle, np.asarray(output[member, i], dtype=np.float64).ravel())
+                        eccodes.codes_write(handle, f)
+                    finally:
+                        eccodes.codes_release(handle)
+        return save_name
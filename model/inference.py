@@ -1,19 +1,93 @@
+import contextlib
+import math
 import os
 import json
 import time
-import torch
+import shutil
+import tempfile
+import threading
 import numpy as np
-import xarray as xr
-import pandas as pd
-import onnxruntime as ort
 
-from util import save_like, test_rmse
+from lazy import lazy_module, preload
+from manifest import MODEL_MANIFEST, read_manifest, verify_files
+from util import save_aggregate, save_like, test_rmse
+from grib import save_grib
+from pipeline import ForecastState, PipelineScheduler, print_pipeline_report
+from prefetch import RecordLoader
+from devices import DevicePool, discover_devices, get_device_type
+from ensemble import BatchedSession, ensemble_stats, perturb_initial_conditions
+from buffers import BufferRing, RingSession, StepWriter
+from cache import InputCache
+from catalog import ForecastCatalog
+from inputs import CopyStats, input_tensor, normalize_input
+from cpu import configure_options, memory_limit, memory_plan, peak_rss, state_bytes
+from jobs import JobManager
+from warmup import warmup_session
+from reducers import StreamingReducer
+from s3local import LocalS3Client, parse_faults
+from serializer import ProcessSerializer, coords_template, default_workers
+from sites import SiteExtractor
+from transfer import S3Transfer, TransferError, make_client
+from variants import check_stages_accuracy, select_variant, variant_files, variant_model_name
 
-import boto3
 from urllib.parse import urlparse
 
+# 重量级模块延迟到第一次使用时导入，缩短工作进程的启动时间
+xr = lazy_module('xarray')
+pd = lazy_module('pandas')
+ort = lazy_module('onnxruntime')
+
 
 num_steps = [20, 20, 34]
+stages = ['short', 'medium', 'long']
+
+# 实时端点的异步预报任务
+job_manager = JobManager(max_workers=int(os.environ.get('FUXI_ASYNC_WORKERS', '1')),
+                         history=int(os.environ.get('FUXI_JOB_HISTORY', '100')))
+
+# 跨请求复用的输入文件（按ETag）和解码后数组的缓存
+input_cache = InputCache(
+    os.environ.get('FUXI_INPUT_CACHE_DIR', '/tmp/fuxi-input-cache'),
+    max_bytes=int(os.environ.get('FUXI_INPUT_CACHE_MB', '4096')) * 2**20,
+    head_fn=lambda s3_path: head_s3_file(s3_path),
+    download_fn=lambda s3_path, local_dir: download_s3_file(s3_path, local_dir=local_dir),
+    memory_bytes=int(os.environ.get('FUXI_INPUT_MEMORY_MB', '1024')) * 2**20)
+
+# 输入规范化（纬度方向、维度顺序、float32）的复制记录
+input_copies = CopyStats()
+
+# NetCDF 编码的进程池，由 model_fn 根据 FUXI_SERIALIZER_WORKERS 创建
+serializer = None
+
+# 每一步的预报时效（小时）
+step_hours = 6
+
+# model_fn 预热后常驻的各阶段会话，以及预热耗时
+resident_sessions = {}
+warmup_stats = {}
+
+# 内存受限的 CPU 模式下 ORT arena 的上限，由 warmup 按 FUXI_CPU_MEMORY_MB 的预算设置
+cpu_arena_bytes = None
+
+# 当前使用的模型精度变体，由 model_fn 根据 FUXI_MODEL_VARIANT 和精度校验结果设置
+model_variant = 'fp32'
+
+
+def make_s3_client():
+    """S3 客户端；设置了 FUXI_S3_LOCAL_ROOT 时使用本地目录代替（可按 FUXI_S3_FAULTS 注入故障）"""
+    root = os.environ.get('FUXI_S3_LOCAL_ROOT')
+    if root:
+        return LocalS3Client(root, faults=parse_faults(os.environ.get('FUXI_S3_FAULTS')))
+    return make_client(max_pool_connections=transfer.max_concurrency + 8)
+
+
+# 所有 S3 上传下载经过的传输层：重试、完整性校验、自适应并发和吞吐记录
+transfer = S3Transfer(
+    make_s3_client,
+    max_attempts=int(os.environ.get('FUXI_S3_MAX_ATTEMPTS', '5')),
+    concurrency=int(os.environ.get('FUXI_S3_CONCURRENCY', '4')),
+    max_concurrency=int(os.environ.get('FUXI_S3_MAX_CONCURRENCY', '16')),
+    verify=os.environ.get('FUXI_S3_VERIFY', 'md5'))
 
 
 def download_s3_file(s3_path, local_dir="/tmp"):
@@ -26,27 +100,19 @@ def download_s3_file(s3_path, local_dir="/tmp"):
     
     Returns:
         local_file_path: 下载后的本地文件路径
+
+    Raises:
+        TransferError: 重试用尽或不可重试的错误（例如对象不存在）
     """
-    # 解析S3路径
-    parsed_url = urlparse(s3_path)
-    bucket_name = parsed_url.netloc
-    s3_key = parsed_url.path.lstrip('/')
-    
-    # 获取文件名
-    file_name = os.path.basename(s3_key)
-    
     # 构建本地文件路径
-    local_file_path = os.path.join(local_dir, file_name)
-    
-    # 创建S3客户端
-    s3_client = boto3.client('s3', region_name='cn-northwest-1')
+    local_file_path = os.path.join(local_dir, os.path.basename(urlparse(s3_path).path))
     
     try:
         # 下载文件
         print(f"正在下载: {s3_path}")
         print(f"目标位置: {local_file_path}")
         
-        s3_client.download_file(bucket_name, s3_key, local_file_path)
+        transfer.download(s3_path, local_file_path)
         
         print(f"文件下载成功: {local_file_path}")
         return local_file_path
@@ -56,45 +122,39 @@ def download_s3_file(s3_path, local_dir="/tmp"):
         raise
 
 
+def head_s3_file(s3_path):
+    """返回S3对象的 (ETag, 大小)"""
+    return transfer.head(s3_path)
+
+
 def upload_file_to_s3(local_file_path, s3_path):
     """
-    上传本地文件到S3指定路径
+    上传本地文件到S3指定路径，上传后校验大小和ETag
     
     Args:
         local_file_path: 本地文件路径
         s3_path: S3目标路径，格式如 s3://bucket/key/to/file
     
     Returns:
-        bool: 上传成功返回True，失败返回False
+        dict: 对象的 bytes 和 etag
+
+    Raises:
+        TransferError: 重试用尽或不可重试的错误；本地文件不存在时为 FileNotFoundError
     """
-    # 检查本地文件是否存在
-    if not os.path.exists(local_file_path):
-        print(f"错误: 本地文件不存在: {local_file_path}")
-        return False
-    
-    # 解析S3路径
-    parsed_url = urlparse(s3_path)
-    bucket_name = parsed_url.netloc
-    s3_key = parsed_url.path.lstrip('/')
-    
-    # 创建S3客户端
-    s3_client = boto3.client('s3', region_name='cn-northwest-1')
-    
+    # 获取文件大小
+    file_size = os.path.getsize(local_file_path)
+    print(f"正在上传文件: {local_file_path} ({file_size:,} bytes)")
+    print(f"目标位置: {s3_path}")
+
     try:
-        # 获取文件大小
-        file_size = os.path.getsize(local_file_path)
-        print(f"正在上传文件: {local_file_path} ({file_size:,} bytes)")
-        print(f"目标位置: {s3_path}")
-        
         # 上传文件
-        s3_client.upload_file(local_file_path, bucket_name, s3_key)
-        
-        print(f"文件上传成功: {s3_path}")
-        return True
-        
+        info = transfer.upload(local_file_path, s3_path)
     except Exception as e:
         print(f"上传失败: {str(e)}")
-        return False
+        raise
+
+    print(f"文件上传成功: {s3_path}")
+    return info
 
 
 def remove_file(file_path):
@@ -126,7 +186,7 @@ def time_encoding(init_time, total_step, freq=6):
     return np.stack(tembs)
 
 
-def load_model(model_name):
+def load_model(model_name, device_id=0):
     # Set the behavier of onnxruntime
     options = ort.SessionOptions()
     options.enable_cpu_mem_arena=False
@@ -134,73 +194,889 @@ def load_model(model_name):
     options.enable_mem_reuse = False
     # Increase the number for faster inference and more memory consumption
     options.intra_op_num_threads = 1
-    cuda_provider_options = {'arena_extend_strategy':'kSameAsRequested',}
+    cuda_provider_options = {'arena_extend_strategy':'kSameAsRequested', 'device_id': device_id}
+
+    if get_device_type() == 'cpu':
+        # CPU 实例作为批量任务的溢出层：线程使用全部可用核，内存受限时使用有界 arena；
+        # 多设备调度中 device_id 只是逻辑槽位
+        configure_options(options, arena_bytes=cpu_arena_bytes)
+        providers = [('CPUExecutionProvider')]
+    else:
+        providers = [('CUDAExecutionProvider', cuda_provider_options)]
 
     session = ort.InferenceSession(
         model_name,  
         sess_options=options, 
-        providers=[('CUDAExecutionProvider', cuda_provider_options)]
-        # providers=[('CPUExecutionProvider')]
+        providers=providers
     )
     return session
 
 
-def run_inference(model_dir, data, num_steps, save_dir=""):
+def plan_steps(request, num_steps):
+    """
+    按请求的预报时效裁剪各阶段步数，只保留需要执行的阶段
+
+    请求中的 lead_hours（预报时效，小时）或 steps（步数）超出完整预报时
+    按完整预报处理，两者都没有时返回完整的 num_steps。
+    例如 lead_hours=120 时返回 [20]，只需要执行 short 阶段。
+    """
+    if request.get('steps') is not None:
+        total_step = int(request['steps'])
+    elif request.get('lead_hours') is not None:
+        total_step = math.ceil(float(request['lead_hours']) / step_hours)
+    else:
+        return list(num_steps)
+    if total_step <= 0:
+        raise ValueError(f"预报时效必须为正数: {request.get('lead_hours', request.get('steps'))}")
+
+    plan = []
+    for num_step in num_steps:
+        if total_step <= 0:
+            break
+        plan.append(min(num_step, total_step))
+        total_step -= plan[-1]
+    return plan
+
+
+def prepare_forecast(data, num_steps):
+    """
+    根据输入数据准备自回归推理的初始状态
 
+    Args:
+        data: prepare_input 规范化后的 xarray.DataArray，维度为 (time, level, lat, lon)
+        num_steps: 各阶段的推理步数列表
+
+    Returns:
+        input: 初始输入张量，形状为 (1, T, C, H, W)
+        tembs: 每一步的时间编码
+    """
     total_step = sum(num_steps)
     init_time = pd.to_datetime(data.time.values[-1])
     tembs = time_encoding(init_time, total_step)
 
     print(f'init_time: {init_time.strftime(("%Y%m%d-%H"))}')
     print(f'latitude: {data.lat.values[0]} ~ {data.lat.values[-1]}')
-    
-    assert data.lat.values[0] == 90
-    assert data.lat.values[-1] == -90
 
-    input = data.values[None]
+    input = input_tensor(data)
     print(f'input: {input.shape}, {input.min():.2f} ~ {input.max():.2f}')
     print(f'tembs: {tembs.shape}, {tembs.mean():.4f}')
+    return input, tembs
+
+
+def prepare_input(data):
+    """
+    规范化输入：纬度为升序时翻转、维度顺序调整为 (time, level, lat, lon)、数组转换为
+    C 连续 float32，已经规范化（例如 open_input 解码后缓存的输入）时不复制
+
+    Raises:
+        ValueError: 维度或纬度范围不符合要求
+    """
+    with netcdf_lock:
+        return normalize_input(data, input_copies)
+
+
+def run_stage(session, input, tembs, step, num_step, on_output, stage_idx=0):
+    """
+    使用单个阶段的会话执行 num_step 步自回归推理
+
+    Args:
+        session: 当前阶段的 onnxruntime 会话
+        input: 当前自回归状态
+        tembs: 全部时间编码
+        step: 起始步数（全局）
+        num_step: 本阶段推理步数
+        on_output: 每步输出的回调，参数为 (step, output)
+        stage_idx: 阶段序号，仅用于日志
+
+    Returns:
+        (input, step): 本阶段结束后的自回归状态和全局步数
+    """
+    for _ in range(0, num_step):
+        temb = tembs[step]
+        print(f'stage: {stage_idx}, step: {step+1:02d}')
+        new_input, = session.run(None, {'input': input, 'temb': temb})
+        output = new_input[:, -1] 
+        on_output(step, output)
+        input = new_input
+        step += 1
+    return input, step
+
+
+# HDF5/NetCDF 库不是线程安全的，多个线程同时读写会导致进程崩溃
+netcdf_lock = threading.Lock()
+
+
+def upload_result(save_name, save_dir, catalog=None, step=None):
+    """
+    上传并删除本地文件，返回S3路径；上传失败时保留本地文件并抛出 TransferError
+
+    catalog 不为空时把文件的大小和ETag记录到结果目录中，step 为对应的时效序号
+    （None 表示聚合产品等非单步的结果）。
+    """
+    s3_path = save_dir+'/'+save_name.split('/')[-1]
+    info = upload_file_to_s3(save_name, s3_path)
+    remove_file(save_name)
+    if catalog is not None:
+        catalog.add_file(step, s3_path, info)
+    return s3_path
+
+
+def upload_deferred(save_name, save_dir, failed=None, catalog=None, step=None):
+    """
+    上传结果文件；重试用尽仍失败时不中断预报，保留本地文件并记入 failed，
+    由 retry_failed 在预报结束后再上传一次。failed 为 None 时直接抛出 TransferError
+
+    Returns:
+        S3路径，推迟上传时为 None
+    """
+    if failed is None:
+        return upload_result(save_name, save_dir, catalog=catalog, step=step)
+    try:
+        return upload_result(save_name, save_dir, catalog=catalog, step=step)
+    except TransferError as e:
+        print(f'{os.path.basename(save_name)} 上传失败，预报结束后重试: {e}')
+        failed.append((step, save_name))
+        return None
+
+
+def retry_failed(failed, save_dir, on_uploaded, catalog=None):
+    """
+    再上传一次 failed 中的文件，成功的按时效顺序调用 on_uploaded(step, s3_path)，
+    聚合产品和站点表等非单步的结果 step 为 None
+
+    Returns:
+        仍然上传失败的文件名列表，为空表示全部上传成功
+    """
+    lost = []
+    for step, save_name in sorted(failed, key=lambda item: (item[0] is None, item[0] or 0)):
+        try:
+            on_uploaded(step, upload_result(save_name, save_dir, catalog=catalog, step=step))
+        except TransferError:
+            lost.append(os.path.basename(save_name))
+    failed.clear()
+    return lost
+
+
+# 全部结果上传后写出的完成标记，与输出格式、预报时效和产品无关，Lambda 按它（RESULT_MARKER）
+# 跳过已经完成的起报时间；不使用 _SUCCESS，以免触发 Lambda
+COMPLETE_MARKER = '_COMPLETE'
+
+
+def write_complete_marker(save_dir, result, local_dir):
+    """写出完成标记（模型变体、输出文件数和结果目录的S3路径）并上传到 save_dir，返回S3路径"""
+    save_name = os.path.join(local_dir, COMPLETE_MARKER)
+    with open(save_name, 'w') as f:
+        json.dump({'model_variant': model_variant, 'outputs': len(result['s3_paths']),
+                   'catalog': result.get('catalog'), 'completed_at': time.time()}, f)
+    return upload_result(save_name, save_dir)
+
+
+def make_catalog(data, fmt='json', **meta):
+    """
+    按请求中的 catalog 字段创建结果目录：json（默认）、parquet，或 none 表示不写出
+
+    Returns:
+        ForecastCatalog，不写出时为 None
+    """
+    fmt = fmt or 'json'
+    if fmt == 'none':
+        return None
+    if fmt not in ('json', 'parquet'):
+        raise ValueError(f"不支持的目录格式: {fmt}，可选 json/parquet/none")
+    return ForecastCatalog(data.level.values, pd.to_datetime(data.time.values[-1]), freq=step_hours,
+                           meta={'model_variant': model_variant, **meta})
+
+
+def record_stats(catalog, step, output):
+    """计算一步输出的按通道统计并记入目录，同时输出一行日志"""
+    if catalog is not None:
+        lo, hi, nan = catalog.add_stats(step, output)
+        print(f'step: {step+1:02d}, output: {lo:.2f} {hi:.2f}, NaN: {nan}')
+
+
+def save_catalog(catalog, fmt, save_dir, local_dir):
+    """写出结果目录并上传到 save_dir，返回S3路径"""
+    save_name = catalog.save(local_dir, fmt=fmt or 'json')
+    return upload_result(save_name, save_dir)
+
+
+# 请求中 format 字段对应的单步输出格式
+output_writers = {'netcdf': save_like, 'grib2': save_grib}
+
+
+def output_writer(output_format=None):
+    output_format = output_format or 'netcdf'
+    if output_format not in output_writers:
+        raise ValueError(f"不支持的输出格式: {output_format}，可选 {sorted(output_writers)}")
+    return output_writers[output_format]
+
+
+def encode_step(output, data, step, local_dir='/tmp', save_fn=save_like, **kwargs):
+    """把单步输出写成本地文件（默认NetCDF，save_fn 为 save_grib 时为GRIB2），返回文件路径"""
+    if serializer is not None:
+        return serializer.submit(output, coords_template(data), step, local_dir,
+                                 save_fn=save_fn, **kwargs).result()
+    with netcdf_lock if save_fn is save_like else contextlib.nullcontext():
+        return save_fn(output, data, step, save_dir=local_dir, **kwargs)
+
+
+def serializer_workers():
+    """FUXI_SERIALIZER_WORKERS 对应的编码进程数：auto（默认）按vCPU数确定，0 表示在写线程中编码"""
+    workers = os.environ.get('FUXI_SERIALIZER_WORKERS', 'auto')
+    return default_workers() if workers == 'auto' else int(workers)
+
+
+def start_serializer():
+    """
+    按 FUXI_SERIALIZER_WORKERS 创建编码进程池：auto（默认）按vCPU数确定进程数，
+    0 表示不使用进程池，在写线程中编码
+    """
+    global serializer
+    workers = serializer_workers()
+    if workers > 0 and serializer is None:
+        serializer = ProcessSerializer(workers)
+        serializer.warm()
+    return serializer
+
+
+def make_reducer(data, grid_shape, save_dir, local_dir, s3_paths, reduce, catalog=None, failed=None):
+    """
+    根据请求中的 reduce 配置创建流式统计器，聚合产品写出后上传到 save_dir
+
+    reduce 支持的字段: variables, stats, wind, tp（见 reducers.StreamingReducer）
+    failed 不为空时上传失败的聚合产品推迟重试（见 upload_deferred）
+    """
+    def emit(product, day, array, names):
+        with netcdf_lock:
+            save_name = save_aggregate(array, data, names, day, product, save_dir=local_dir)
+        s3_path = upload_deferred(save_name, save_dir, failed, catalog=catalog)
+        if s3_path is not None:
+            s3_paths.append(s3_path)
+
+    options = {k: v for k, v in reduce.items() if k in ('variables', 'stats', 'wind', 'tp')}
+    return StreamingReducer(data.level.values, grid_shape, emit, **options)
+
+
+def make_site_extractor(data, sites, total_step):
+    """
+    根据请求中的 sites 配置创建站点提取器
+
+    sites 支持的字段: points（站点列表）或 points_file（CSV，本地路径或S3路径）,
+    variables, hub_height, shear_exponent（见 sites.SiteExtractor）
+    """
+    options = {k: v for k, v in sites.items() if k in ('variables', 'hub_height', 'shear_exponent')}
+    points = sites.get('points')
+    if points is not None:
+        return SiteExtractor(data.level.values, data.lat.values, data.lon.values, points, total_step, **options)
+
+    points_file = sites['points_file']
+    local_file = input_cache.acquire(points_file) if points_file.startswith('s3://') else points_file
+    try:
+        return SiteExtractor(data.level.values, data.lat.values, data.lon.values, local_file, total_step,
+                             **options)
+    finally:
+        if local_file != points_file:
+            input_cache.release(local_file)
+
+
+def save_sites(extractor, data, sites, save_dir, local_dir, catalog=None, failed=None):
+    """写出站点表（默认 Parquet）并上传到 save_dir，返回S3路径；推迟上传时为 None（见 upload_deferred）"""
+    init_time = pd.to_datetime(data.time.values[-1])
+    fmt = sites.get('format', 'parquet')
+    # NetCDF 格式的站点表经 HDF5 写出，与其他线程的读写互斥
+    with netcdf_lock if fmt == 'netcdf' else contextlib.nullcontext():
+        save_name = extractor.save(init_time, local_dir, fmt=fmt)
+    return upload_deferred(save_name, save_dir, failed, catalog=catalog)
+
+
+def load_stage(model_dir, stage, device_id=0):
+    start = time.perf_counter()
+    model_name = variant_model_name(model_dir, stage, model_variant)
+    print(f'Load model from {model_name} on device {device_id} ...')        
+    session = load_model(model_name, device_id=device_id)
+    load_time = time.perf_counter() - start
+    print(f'Load model take {load_time:.2f} sec')
+    return session
+
+
+def get_stage_session(model_dir, stage, device_id=0):
+    """优先使用 model_fn 预热后常驻的会话（设备0），否则重新加载"""
+    if device_id == 0 and stage in resident_sessions:
+        return resident_sessions[stage]
+    return load_stage(model_dir, stage, device_id=device_id)
+
+
+def cpu_memory_cap():
+    """
+    内存受限的 CPU 模式的上限（字节），不是 CPU 设备或没有设置 FUXI_CPU_MEMORY_MB 时为 None
+
+    FUXI_CPU_MEMORY_MB=auto 时取物理内存和 cgroup 上限中较小者的 80%。
+    """
+    value = os.environ.get('FUXI_CPU_MEMORY_MB', '')
+    if get_device_type() != 'cpu' or not value:
+        return None
+    if value == 'auto':
+        return int(memory_limit() * 0.8)
+    return int(value) * 2**20 if int(value) > 0 else None
+
+
+def plan_cpu_memory(model_dir, cap, steps):
+    """
+    按最大的阶段规划内存并设置 arena 上限；steps > 0 时加载该阶段预热，
+    测得的进程峰值内存加上预留超过上限时抛出 RuntimeError。会话不常驻。
+
+    预留的是预热时还不存在、处理请求时才分配的内存：解码输入的内存缓存（限制为
+    一份初始场）、编码进程池的共享内存槽（每个进程两个时效），以及编码时每个并发的
+    编码各一份时效输出的复制。
+    """
+    global cpu_arena_bytes
+    # 权重内嵌在 .onnx 中的模型没有外部权重文件
+    weights = {stage: sum(os.path.getsize(path) for path in
+                          (os.path.join(model_dir, name) for name in variant_files([stage], model_variant))
+                          if os.path.exists(path))
+               for stage in stages}
+    stage = max(weights, key=weights.get)
+    state = state_bytes(variant_model_name(model_dir, stage, model_variant))
+    # 输入数据、当前状态和输出，以及缓冲环
+    buffers = max(int(os.environ.get('FUXI_BUFFER_RING', '4')), 2) + 3
+    # 初始场 (time, level, lat, lon) 与一份状态大小相同，单步输出为半份
+    input_cache.memory_bytes = min(input_cache.memory_bytes, state)
+    workers = serializer_workers()
+    reserved = {'input_cache': input_cache.memory_bytes,
+                'serializer': 2 * workers * state // 2,
+                'encode': max(workers, 1) * state // 2}
+    plan = memory_plan(cap, weights[stage], state, buffers, reserved=reserved)
+    cpu_arena_bytes = plan['arena_mb'] * 2**20
+    plan['stage'] = stage
+    plan['threads'] = configure_options(ort.SessionOptions()).intra_op_num_threads
+    print(f'CPU memory plan: {plan}')
+    warmup_stats['cpu'] = plan
+    if steps <= 0:
+        return plan
+
+    start = time.perf_counter()
+    session = load_stage(model_dir, stage)
+    stats = warmup_session(session, steps)
+    stats['load_sec'] = round(time.perf_counter() - start, 4)
+    del session
+    warmup_stats[stage] = stats
+    plan['peak_rss_mb'] = round(peak_rss() / 2**20)
+    print(f'Warmup {stage}: load {stats["load_sec"]:.2f} sec, steady run {stats["steady_run_sec"]} sec, '
+          f'peak RSS {plan["peak_rss_mb"]} MB')
+    if peak_rss() + sum(reserved.values()) > cap:
+        raise RuntimeError(f'预热时进程峰值内存 {plan["peak_rss_mb"]} MB 加上请求处理的预留超过 '
+                           f'FUXI_CPU_MEMORY_MB: {plan}')
+    return plan
+
+
+def warmup(model_dir):
+    """
+    加载各阶段会话并常驻，用全零的 input/temb 预热 FUXI_WARMUP_STEPS 步
+
+    第一次推理的CUDA内核选择、cuDNN自动调优和显存池扩展在启动时完成，
+    首个请求的延迟与稳态一致。FUXI_WARMUP_STEPS=0 时不预热，也不常驻会话，
+    每个请求按阶段加载、用完即释放。FUXI_RESIDENT_STAGES 限定常驻的阶段，
+    例如大多数请求只需要5天时效时设为 short，其余阶段在需要时才加载。
+    内存受限的 CPU 模式（FUXI_CPU_MEMORY_MB）下不常驻会话，只用最大的阶段检查内存预算。
+    """
+    steps = int(os.environ.get('FUXI_WARMUP_STEPS', '2'))
+    cap = cpu_memory_cap()
+    if cap is not None:
+        plan_cpu_memory(model_dir, cap, steps)
+        return warmup_stats
+    if steps <= 0:
+        return warmup_stats
+
+    resident = os.environ.get('FUXI_RESIDENT_STAGES', ','.join(stages))
+    for stage in [s.strip() for s in resident.split(',') if s.strip() in stages]:
+        start = time.perf_counter()
+        session = load_stage(model_dir, stage)
+        load_time = time.perf_counter() - start
+        stats = warmup_session(session, steps)
+        stats['load_sec'] = round(load_time, 4)
+        resident_sessions[stage] = session
+        warmup_stats[stage] = stats
+        print(f'Warmup {stage}: load {load_time:.2f} sec, first run {stats["first_run_sec"]:.2f} sec, '
+              f'steady run {stats["steady_run_sec"]} sec')
+    return warmup_stats
+
+
+def run_inference(model_dir, data, num_steps, save_dir="", sessions=None, on_step=None, reduce=None,
+                  output_format=None, sites=None, catalog=None, on_progress=None):
+    """
+    顺序执行 short/medium/long 三个阶段的级联推理
+
+    num_steps 只包含需要执行的阶段（见 plan_steps），之后的阶段不会加载。
+    sessions 为调用方传入的常驻会话（按阶段名索引），其中没有的阶段
+    按需加载、用完即释放。
+    on_step 在每个时效上传完成后调用，参数为 (step, s3_path)。
+    on_progress 在每个时效计算完成后调用，参数为 step，只输出聚合产品或站点表时也会调用。
+    reduce 不为空时在循环中流式计算按日聚合的产品；其中 outputs 为
+    aggregates（默认）时只输出聚合产品，为 both 时同时输出每个时效的完整场。
+    output_format 为每个时效的输出格式，netcdf（默认）或 grib2。
+    sites 不为空时在循环中提取站点时间序列，结束后写出一张站点表；其中
+    outputs 为 sites（默认）时只输出站点表，为 both 时同时输出完整场。
+    catalog 为结果目录的格式，json（默认）、parquet 或 none，目录的S3路径在结果的 catalog 字段中。
+    """
+    save_fn = output_writer(output_format)
+    data = prepare_input(data)
+    catalog_fmt = catalog
+    catalog = make_catalog(data, catalog_fmt, format=output_format or 'netcdf')
+    input, tembs = prepare_forecast(data, num_steps)
+    total_step = sum(num_steps)
+    local_dir = tempfile.mkdtemp(prefix='fuxi-')
 
-    stages = ['short', 'medium', 'long']
     step = 0
+    s3_paths = []
+    # 重试用尽仍上传失败的结果：不中断预报，保留本地文件，结束后再上传一次
+    failed = []
+
+    reducer = None
+    save_steps = True
+    if reduce:
+        reducer = make_reducer(data, input.shape[-2:], save_dir, local_dir, s3_paths, reduce, catalog=catalog,
+                               failed=failed)
+        save_steps = reduce.get('outputs', 'aggregates') == 'both'
 
+    extractor = None
+    if sites:
+        extractor = make_site_extractor(data, sites, total_step)
+        save_steps = save_steps and sites.get('outputs', 'sites') == 'both'
+
+    # 预分配的状态缓冲环：ORT 直接写入，后台线程序列化上传后归还
+    ring_size = int(os.environ.get('FUXI_BUFFER_RING', '4'))
+    ring = runner = writer = None
+    if ring_size > 0:
+        ring = BufferRing(input.shape, np.float32, size=max(ring_size, 2))
+        # 使用编码进程池时，写线程排队的任务数至少等于进程数，多个时效才能并行编码
+        pending = max(ring_size - 2, 1, serializer.workers if serializer is not None else 0)
+        writer = StepWriter(max_pending=pending)
+    template = coords_template(data) if serializer is not None else None
+
+    def uploaded(step, s3_path):
+        s3_paths.append(s3_path)
+        if on_step is not None and step is not None:
+            on_step(step, s3_path)
+
+    def deliver(step, save_name):
+        s3_path = upload_deferred(save_name, save_dir, failed, catalog=catalog, step=step)
+        if s3_path is not None:
+            uploaded(step, s3_path)
+
+    def write(step, output):
+        deliver(step, encode_step(output, data, step, local_dir=local_dir, save_fn=save_fn))
+
+    def on_output(step, output):
+        record_stats(catalog, step, output)
+        if reducer is not None:
+            reducer.update(output)
+        if extractor is not None:
+            extractor.update(step, output)
+        if on_progress is not None:
+            on_progress(step)
+        if not save_steps:
+            return
+        if writer is None:
+            write(step, output)
+            return
+        if serializer is not None:
+            # 输出已经复制到共享内存，缓冲区不需要保留；写线程按顺序等待编码完成并上传
+            future = serializer.submit(output, template, step, local_dir, save_fn=save_fn)
+            writer.submit(lambda: deliver(step, future.result()), lambda: None)
+            return
+        index = runner.last_index
+        ring.retain(index)
+        writer.submit(lambda: write(step, output), lambda: ring.release(index))
+
+    try:
+        for i, num_step in enumerate(num_steps):
+            stage = stages[i]
+            session = (sessions or {}).get(stage)
+            if session is None:
+                session = load_stage(model_dir, stage)
+            if ring is not None:
+                runner = runner.use(session) if runner is not None else RingSession(session, ring)
+
+            print(f'Inference {stage} ...')
+            start = time.perf_counter()
+            input, step = run_stage(runner or session, input, tembs, step, num_step, on_output, stage_idx=i)
+            run_time = time.perf_counter() - start
+            print(f'Inference {stage} take {run_time:.2f}, {run_time / max(num_step, 1):.2f} sec/step')
+            # 不常驻的会话在下一个阶段加载前释放，同一时刻只有一个阶段的权重在内存中
+            if runner is not None:
+                runner.detach()
+            del session
+
+            if step > total_step:
+                break
+    finally:
+        if writer is not None:
+            try:
+                writer.close()
+            finally:
+                # 第一个阶段加载失败时还没有 runner
+                if runner is not None:
+                    runner.close()
+            print(f'buffer ring: {ring.report()}, writer busy {writer.busy_time:.2f} sec')
+            if serializer is not None:
+                print(f'serializer: {serializer.report()}')
+    result = {'s3_paths': s3_paths}
+    try:
+        if reducer is not None:
+            reducer.finalize()
+        if extractor is not None:
+            s3_path = save_sites(extractor, data, sites, save_dir, local_dir, catalog=catalog, failed=failed)
+            if s3_path is not None:
+                s3_paths.append(s3_path)
+        lost = retry_failed(failed, save_dir, uploaded, catalog=catalog)
+        if catalog is not None:
+            result['catalog'] = save_catalog(catalog, catalog_fmt, save_dir, local_dir)
+        if not lost:
+            write_complete_marker(save_dir, result, local_dir)
+    finally:
+        shutil.rmtree(local_dir, ignore_errors=True)
+    if lost:
+        raise TransferError(f'{len(lost)} 个文件上传失败: {lost}')
+    return result
+
+
+def run_ensemble(model_dir, data, num_steps, save_dir="", members=8, scale=0.01, seed=0,
+                 output='stats', sessions=None, output_format=None, catalog=None, on_step=None, on_progress=None):
+    """
+    集合预报：N 个扰动成员作为一个批次执行级联推理
+
+    Args:
+        members: 成员数（含不加扰动的控制成员）
+        scale: 初始场扰动幅度，相对每个通道的空间标准差
+        seed: 扰动的随机种子
+        output: stats 只输出集合平均和离散度；members 输出全部成员；both 两者都输出
+        output_format: netcdf（默认）或 grib2
+        catalog: 结果目录的格式，json（默认）、parquet 或 none；统计量按集合平均计算，
+            只输出全部成员时按控制成员计算
+        on_step / on_progress: 同 run_inference，每个时效的每个输出文件上传后 / 每个时效计算完成后调用
+    """
+    save_fn = output_writer(output_format)
+    data = prepare_input(data)
+    catalog_fmt = catalog
+    catalog = make_catalog(data, catalog_fmt, format=output_format or 'netcdf', members=members, output=output)
+    input, tembs = prepare_forecast(data, num_steps)
+    input = perturb_initial_conditions(input, members, scale=scale, seed=seed)
+    print(f'ensemble: {members} members, scale {scale}, seed {seed}, input {input.shape}')
+
+    total_step = sum(num_steps)
+    local_dir = tempfile.mkdtemp(prefix='fuxi-')
     s3_paths = []
-    for i, num_step in enumerate(num_steps):
+    # 重试用尽仍上传失败的结果，结束后再上传一次
+    failed = []
+
+    output_mode = output
+
+    def uploaded(step, s3_path):
+        s3_paths.append(s3_path)
+        if on_step is not None and step is not None:
+            on_step(step, s3_path)
+
+    def save(output, step, **kwargs):
+        save_name = encode_step(output, data, step, local_dir=local_dir, save_fn=save_fn, **kwargs)
+        s3_path = upload_deferred(save_name, save_dir, failed, catalog=catalog, step=step)
+        if s3_path is not None:
+            uploaded(step, s3_path)
+
+    def on_output(step, output):
+        if output_mode in ('stats', 'both'):
+            mean, spread = ensemble_stats(output)
+            record_stats(catalog, step, mean)
+            save(mean, step, suffix='_mean')
+            save(spread, step, suffix='_spread')
+        else:
+            record_stats(catalog, step, output[:1])
+        if output_mode in ('members', 'both'):
+            save(output, step, suffix='_members', members=True)
+        if on_progress is not None:
+            on_progress(step)
+
+    try:
+        step = 0
+        for i, num_step in enumerate(num_steps):
+            stage = stages[i]
+            session = (sessions or {}).get(stage)
+            if session is None:
+                session = load_stage(model_dir, stage)
+
+            print(f'Inference {stage} (ensemble) ...')
+            start = time.perf_counter()
+            input, step = run_stage(BatchedSession(session), input, tembs, step, num_step, on_output, stage_idx=i)
+            print(f'Inference {stage} take {time.perf_counter() - start:.2f}')
+            del session
+
+            if step > total_step:
+                break
+        result = {'s3_paths': s3_paths, 'members': members}
+        lost = retry_failed(failed, save_dir, uploaded, catalog=catalog)
+        if catalog is not None:
+            result['catalog'] = save_catalog(catalog, catalog_fmt, save_dir, local_dir)
+        if not lost:
+            write_complete_marker(save_dir, result, local_dir)
+    finally:
+        shutil.rmtree(local_dir, ignore_errors=True)
+    if lost:
+        raise TransferError(f'{len(lost)} 个文件上传失败: {lost}')
+    return result
+
+
+ensemble_options = ('members', 'scale', 'seed', 'output')
+
+
+def check_request(request):
+    """检查请求中互斥的选项，集合预报不支持 reduce 和 sites"""
+    ensemble = request.get('ensemble')
+    if not ensemble:
+        return
+    if not isinstance(ensemble, dict):
+        raise ValueError(f'ensemble 必须是对象: {ensemble}')
+    unknown = sorted(set(ensemble) - set(ensemble_options))
+    if unknown:
+        raise ValueError(f'不支持的 ensemble 参数: {unknown}，可选 {list(ensemble_options)}')
+    for option in ('reduce', 'sites'):
+        if request.get(option):
+            raise ValueError(f'集合预报不支持 {option}，请只使用其中之一')
+
+
+def run_request(model_dir, data, request, num_steps, save_dir, sessions=None, on_step=None, on_progress=None):
+    """
+    按请求的选项执行一条预报：有 ensemble 时为集合预报，否则为单一预报
+
+    同步请求、多条记录的逐条和多设备执行以及异步任务都经过这里，选项在各条路径上含义相同。
+    """
+    check_request(request)
+    steps = plan_steps(request, num_steps)
+    if request.get('ensemble'):
+        return run_ensemble(model_dir, data, steps, save_dir=save_dir, sessions=sessions,
+                            output_format=request.get('format'), catalog=request.get('catalog'),
+                            on_step=on_step, on_progress=on_progress, **request['ensemble'])
+    return run_inference(model_dir, data, steps, save_dir=save_dir, sessions=sessions, on_step=on_step,
+                         reduce=request.get('reduce'), output_format=request.get('format'),
+                         sites=request.get('sites'), catalog=request.get('catalog'), on_progress=on_progress)
+
+
+def make_on_output(state, save_fn=save_like, extractor=None, save_steps=True, catalog=None, reducer=None):
+    def on_output(step, output):
+        record_stats(catalog, step, output)
+        if reducer is not None:
+            reducer.update(output)
+        if extractor is not None:
+            extractor.update(step, output)
+        if save_steps:
+            save_name = encode_step(output, state.data, step, local_dir=state.local_dir, save_fn=save_fn)
+            s3_path = upload_deferred(save_name, state.save_dir, state.failed, catalog=catalog, step=step)
+            if s3_path is not None:
+                state.s3_paths.append(s3_path)
+    return on_output
+
+
+def record_loader(requests, order=None):
+    """多条记录的输入在处理时才加载，后台预取 FUXI_PREFETCH_RECORDS 条；CPU 内存受限时不预取"""
+    depth = 0 if cpu_memory_cap() is not None else int(os.environ.get('FUXI_PREFETCH_RECORDS', '1'))
+    return RecordLoader(requests, load_request, release_request, depth=depth, order=order)
+
+
+def run_record(model_dir, loader, index, num_steps, sessions=None):
+    """
+    加载并执行多条记录中的一条，结束后立即归还输入
+
+    输入读取失败、请求参数错误和结果上传失败只影响这一条记录，返回带 error 的结果。
+    """
+    request = loader.requests[index]
+    try:
+        try:
+            input_data = loader.get(index)
+        except Exception as e:
+            return {'s3_paths': [], 'error': f'输入读取失败: {e}'}
+        return run_request(model_dir, input_data['data1'], request, num_steps, request['filename1'][:-3]+'/result',
+                           sessions=sessions)
+    except (ValueError, KeyError, TransferError) as e:
+        return {'s3_paths': [], 'error': str(e)}
+    finally:
+        loader.release(index)
+
+
+def run_pipeline(model_dir, requests, num_steps, devices=None):
+    """
+    多请求的流水线推理：三个阶段的会话常驻，每个阶段一个工作线程，
+    请求B的short阶段可以与请求A的medium阶段同时执行。
+
+    各记录的输入在进入第一个阶段时才加载（后台预取下一条），离开最后一个阶段、
+    汇总结果上传后立即归还，同一时刻驻留的输入数不随记录数增长。
+
+    Args:
+        model_dir: 模型目录
+        requests: input_fn 解析得到的请求列表（尚未加载输入）
+        num_steps: 各阶段的推理步数列表，每个请求按自己的预报时效裁剪
+        devices: 设备号列表，各阶段依次轮流分配到这些设备上，默认全部使用设备0
+
+    Returns:
+        与 requests 一一对应的结果列表
+    """
+    devices = devices or [0]
+
+    states = []
+    extractors = {}
+    reducers = {}
+    catalogs = {}
+    # 集合预报的成员作为一个批次通过各阶段，不进入流水线，流水线结束后逐条执行
+    ensembles = [index for index, request in enumerate(requests) if request.get('ensemble')]
+    for index, request in enumerate(requests):
+        if index in ensembles:
+            continue
+        state = ForecastState(index, None, None)
+        try:
+            state.save_dir = request['filename1'][:-3]+'/result'
+            state.num_steps = plan_steps(request, num_steps)
+        except (ValueError, KeyError) as e:
+            state.error = e
+            state.num_steps = []
+        states.append(state)
+
+    # 只加载最长的请求需要的阶段
+    num_stages = max((len(state.num_steps) for state in states), default=0)
+    sessions = {stage: get_stage_session(model_dir, stage, device_id=devices[i % len(devices)])
+                for i, stage in enumerate(stages[:num_stages])}
+
+    loader = record_loader(requests, order=[state.index for state in states if state.error is None] + ensembles)
+
+    def prepare(state):
+        """加载输入，准备产品、结果目录和每个时效的输出"""
+        request = requests[state.index]
+        sites = request.get('sites')
+        reduce = request.get('reduce')
+        output_format = request.get('format')
+        state.local_dir = tempfile.mkdtemp(prefix='fuxi-')
+        try:
+            input_data = loader.get(state.index)
+        except Exception as e:
+            raise RuntimeError(f'输入读取失败: {e}') from e
+        state.data = prepare_input(input_data['data1'])
+        save_fn = output_writer(output_format)
+        catalogs[state.index] = make_catalog(state.data, request.get('catalog'), format=output_format or 'netcdf')
+        if reduce:
+            reducers[state.index] = make_reducer(state.data, state.data.shape[-2:], state.save_dir, state.local_dir,
+                                                 state.s3_paths, reduce, catalog=catalogs[state.index],
+                                                 failed=state.failed)
+        if sites:
+            extractors[state.index] = make_site_extractor(state.data, sites, sum(state.num_steps))
+        save_steps = ((not reduce or reduce.get('outputs', 'aggregates') == 'both')
+                      and (not sites or sites.get('outputs', 'sites') == 'both'))
+        state.on_output = make_on_output(state, save_fn, extractor=extractors.get(state.index),
+                                         save_steps=save_steps, catalog=catalogs[state.index],
+                                         reducer=reducers.get(state.index))
+        state.input, state.tembs = prepare_forecast(state.data, state.num_steps)
+
+    def make_stage_fn(i):
         stage = stages[i]
-        start = time.perf_counter()
-        model_name = os.path.join(model_dir, f"{stage}.onnx")
-        print(f'Load model from {model_name} ...')        
-        session = load_model(model_name)
-        load_time = time.perf_counter() - start
-        print(f'Load model take {load_time:.2f} sec')
 
-        print(f'Inference {stage} ...')
-        start = time.perf_counter()
+        def stage_fn(state):
+            if i >= len(state.num_steps):
+                # 已经达到该请求的预报时效，直接交给下游
+                return
+            if state.input is None:
+                prepare(state)
+            state.input, state.step = run_stage(
+                sessions[stage], state.input, state.tembs, state.step, state.num_steps[i],
+                state.on_output, stage_idx=i)
+        return stage_fn
 
-        for _ in range(0, num_step):
-            temb = tembs[step]
-            print(f'stage: {i}, step: {step+1:02d}')
-            new_input, = session.run(None, {'input': input, 'temb': temb})
-            output = new_input[:, -1] 
-            print(f'stage: {i}, step: {step+1:02d}, output: {output.min():.2f} {output.max():.2f}')
-            save_name = save_like(output, data, step, save_dir='/tmp')
-            s3_path = save_dir+'/'+save_name.split('/')[-1]
-            upload_file_to_s3(save_name, s3_path)
-            remove_file(save_name)
-            s3_paths.append(s3_path)
-            # print(f'stage: {i}, step: {step+1:02d}, output: {output.min():.2f} {output.max():.2f}')
-            input = new_input
-            step += 1
+    results = [None] * len(requests)
 
-        run_time = time.perf_counter() - start
-        print(f'Inference {stage} take {run_time:.2f}')
+    def finish(state):
+        result = {'s3_paths': state.s3_paths}
+        catalog = catalogs.get(state.index)
+        try:
+            if state.error is None and state.index in reducers:
+                reducers.pop(state.index).finalize()
+            if state.error is None and state.index in extractors:
+                s3_path = save_sites(extractors.pop(state.index), state.data, requests[state.index]['sites'],
+                                     state.save_dir, state.local_dir, catalog=catalog, failed=state.failed)
+                if s3_path is not None:
+                    state.s3_paths.append(s3_path)
+            lost = retry_failed(state.failed, state.save_dir,
+                                lambda step, s3_path: state.s3_paths.append(s3_path), catalog=catalog)
+            if lost and state.error is None:
+                state.error = TransferError(f'{len(lost)} 个文件上传失败: {lost}')
+            if state.error is None and catalog is not None:
+                result['catalog'] = save_catalog(catalog, requests[state.index].get('catalog'),
+                                                 state.save_dir, state.local_dir)
+            if state.error is None:
+                write_complete_marker(state.save_dir, result, state.local_dir)
+        except TransferError as e:
+            # 结果目录上传失败只影响这一条记录
+            state.error = e
+        finally:
+            if state.local_dir is not None:
+                shutil.rmtree(state.local_dir, ignore_errors=True)
+            # 结果已经上传，归还输入，之后的记录不必与它同时驻留
+            loader.release(state.index)
+            state.input = state.data = None
+        if state.error is not None:
+            result['error'] = str(state.error)
+        results[state.index] = result
 
-        if step > total_step:
-            break
-    return {'s3_paths': s3_paths}
+    with loader:
+        queue_size = int(os.environ.get('FUXI_PIPELINE_QUEUE_SIZE', '1'))
+        scheduler = PipelineScheduler([make_stage_fn(i) for i in range(num_stages)],
+                                      names=stages[:num_stages], queue_size=queue_size)
+        scheduler.run(states, on_finished=finish)
+        print_pipeline_report(scheduler.report())
 
+        for index in ensembles:
+            results[index] = run_record(model_dir, loader, index, num_steps, sessions=sessions)
+    print(f'record loader: {loader.report()}')
+    # 结束处理本身失败的记录
+    for state in states:
+        if results[state.index] is None:
+            results[state.index] = {'s3_paths': state.s3_paths, 'error': str(state.error)}
+    return results
 
-def model_fn(model_dir):
+
+_device_pool = None
+
+
+def get_device_pool(model_dir, devices):
+    global _device_pool
+    if _device_pool is None or _device_pool.devices != devices:
+        # 设备0使用 model_fn 预热后常驻的会话，不再加载第二份
+        _device_pool = DevicePool(
+            devices, lambda stage, device_id: get_stage_session(model_dir, stage, device_id=device_id), stages)
+    return _device_pool
+
+
+def run_on_devices(model_dir, requests, num_steps, devices):
+    """多设备推理：每条预报完整地在一个设备上运行，各设备并行处理不同的预报，输入在设备取到记录时才加载"""
+    pool = get_device_pool(model_dir, devices)
+
+    # 只在各设备上加载最长的请求需要的阶段
+    num_stages = 0
+    for request in requests:
+        try:
+            num_stages = max(num_stages, len(plan_steps(request, num_steps)))
+        except ValueError:
+            pass
+    with record_loader(requests) as loader:
+        results = pool.map(lambda index, sessions: run_record(model_dir, loader, index, num_steps, sessions),
+                           list(range(len(requests))), stages=stages[:num_stages])
+    print(f'record loader: {loader.report()}')
+    return results
+
+
+def run_sequential(model_dir, requests, num_steps):
+    """逐条执行多条记录，输入逐条加载和归还；读取失败或请求参数错误的记录返回 error，不影响其他记录"""
+    with record_loader(requests) as loader:
+        results = [run_record(model_dir, loader, index, num_steps, sessions=resident_sessions)
+                   for index in range(len(requests))]
+    print(f'record loader: {loader.report()}')
+    return results
+
+
+def print_environment():
     print("="*50)
     print("所有环境变量:")
     print("="*50)
@@ -243,6 +1119,13 @@ def model_fn(model_dir):
     for k, v in sorted(cuda_vars.items()):
         print(f"  {k}: {v}")
 
+
+def model_fn(model_dir):
+    start = time.perf_counter()
+    # 环境变量诊断信息仅在需要时输出
+    if os.environ.get('FUXI_DEBUG_ENV', '').lower() in ('1', 'true', 'yes'):
+        print_environment()
+
     # 从环境变量获取S3配置，如果没有则使用默认值
     s3_bucket = os.environ.get('FUXI_MODEL_BUCKET', 'sagemaker-cn-northwest-1-YOUR_ACCOUNT_ID')
     s3_prefix = os.environ.get('FUXI_MODEL_PREFIX', 'sagemaker/fuxi')
@@ -251,71 +1134,269 @@ def model_fn(model_dir):
     print(f"  存储桶: {s3_bucket}")
     print(f"  前缀: {s3_prefix}")
     
-    model_dir = '/tmp'
-    
-    # 下载模型文件列表
-    model_files = ['short', 'short.onnx', 'medium', 'medium.onnx', 'long', 'long.onnx']
-    
-    for model_file in model_files:
-        s3_file_path = f's3://{s3_bucket}/{s3_prefix}/{model_file}'
+    model_dir = stage_model_files(model_dir, f's3://{s3_bucket}/{s3_prefix}')
+
+    setup_variant(model_dir, f's3://{s3_bucket}/{s3_prefix}')
+    # 请求处理需要的模块在后台提前导入，不阻塞 model_fn 返回
+    preload(xr, pd, ort)
+    warmup(model_dir)
+    start_serializer()
+    print(f"model_fn 耗时 {time.perf_counter() - start:.2f} sec")
+    return model_dir
+
+
+def stage_model_files(model_dir, s3_model_path, fallback_dir='/tmp'):
+    """
+    确定模型文件所在的目录
+
+    scripts/package_model.py 打包的模型数据（model.tar.gz 或不压缩的S3前缀）由
+    SageMaker 在容器启动前放到 model_dir（/opt/ml/model），按其中的
+    model_manifest.json 检查 FP32 模型文件齐全、大小一致（FUXI_MODEL_VERIFY=sha256
+    时再比较校验和）后直接使用。检查不通过时退回到从 s3_model_path 下载到
+    fallback_dir，fallback_dir 中已有的完整文件（同一容器中工作进程重启）不再下载。
+
+    Returns:
+        模型文件所在的目录
+    """
+    required = variant_files(stages, 'fp32')
+    checksum = os.environ.get('FUXI_MODEL_VERIFY', 'size').lower() == 'sha256'
+
+    start = time.perf_counter()
+    problems = verify_files(model_dir, required, read_manifest(model_dir), checksum=checksum)
+    if not problems:
+        print(f"使用预置的模型文件: {model_dir}（校验 {'sha256' if checksum else 'size'}，"
+              f"{time.perf_counter() - start:.2f} sec）")
+        return model_dir
+    print(f"{model_dir} 中的模型文件不可用，从S3下载: {problems}")
+
+    os.makedirs(fallback_dir, exist_ok=True)
+    try:
+        download_s3_file(f'{s3_model_path}/{MODEL_MANIFEST}', local_dir=fallback_dir)
+    except Exception as e:
+        print(f"没有找到模型文件清单 {MODEL_MANIFEST}，只检查文件是否存在: {str(e)}")
+    manifest = read_manifest(fallback_dir)
+
+    for model_file in required:
+        if not verify_files(fallback_dir, [model_file], manifest):
+            print(f"已有完整的模型文件: {os.path.join(fallback_dir, model_file)}")
+            continue
         try:
-            # 下载文件
-            local_path = download_s3_file(s3_file_path, local_dir=model_dir)
-            # 验证文件是否存在
-            if os.path.exists(local_path):
-                file_size = os.path.getsize(local_path)
-                print(f"文件已保存到: {local_path}")
-                print(f"文件大小: {file_size:,} bytes")
+            local_path = download_s3_file(f'{s3_model_path}/{model_file}', local_dir=fallback_dir)
+            print(f"文件大小: {os.path.getsize(local_path):,} bytes")
         except Exception as e:
             print(f"下载模型文件 {model_file} 失败: {str(e)}")
-            # 如果是关键的.onnx文件下载失败，抛出异常
-            if model_file.endswith('.onnx'):
-                raise Exception(f"关键模型文件 {model_file} 下载失败，无法继续推理")
 
-    return model_dir
+    problems = verify_files(fallback_dir, required, manifest, checksum=checksum)
+    if problems:
+        raise Exception(f"关键模型文件不可用，无法继续推理: {problems}")
+    return fallback_dir
+
+
+def setup_variant(model_dir, s3_model_path):
+    """
+    按 FUXI_MODEL_VARIANT 选择模型精度变体（fp32/fp16/int8）
+
+    变体必须有通过的精度校验记录（variants.json），或在设置了
+    FUXI_VARIANT_CHECK_SAMPLE 时现场与 FP32 做一次短时效滚动比较；
+    误差超过 FUXI_VARIANT_TOLERANCE 的变体会被拒绝并回退到 fp32。
+    """
+    global model_variant
+    requested = os.environ.get('FUXI_MODEL_VARIANT', 'fp32').lower()
+    tolerance = float(os.environ.get('FUXI_VARIANT_TOLERANCE', '0.05'))
+    model_variant = 'fp32'
+    if requested == 'fp32':
+        return model_variant
+
+    manifest = read_manifest(model_dir)
+    try:
+        for model_file in variant_files(stages, requested):
+            if verify_files(model_dir, [model_file], manifest):
+                download_s3_file(f'{s3_model_path}/{model_file}', local_dir=model_dir)
+    except Exception as e:
+        print(f"下载模型变体 {requested} 失败: {str(e)}，使用 fp32")
+        return model_variant
+
+    if not os.path.exists(os.path.join(model_dir, 'variants.json')):
+        try:
+            download_s3_file(f'{s3_model_path}/variants.json', local_dir=model_dir)
+        except Exception as e:
+            print(f"没有找到模型变体校验记录 variants.json: {str(e)}")
+
+    check_fn = None
+    sample = os.environ.get('FUXI_VARIANT_CHECK_SAMPLE')
+    if sample:
+        def check_fn(variant):
+            local_sample = download_s3_file(sample) if sample.startswith('s3://') else sample
+            data = prepare_input(xr.open_dataarray(local_sample))
+            input, tembs = prepare_forecast(data, num_steps)
+            num_step = int(os.environ.get('FUXI_VARIANT_CHECK_STEPS', '4'))
+            return check_stages_accuracy(model_dir, variant, stages, num_steps, load_model,
+                                         data, input, tembs, num_step=num_step, tolerance=tolerance)
+
+    model_variant = select_variant(model_dir, requested, tolerance, check_fn=check_fn, stages=stages)
+    return model_variant
+
+
+def open_input(local_filename):
+    """读取初始场到内存并规范化，结果由 input_cache 在请求之间共享"""
+    with netcdf_lock:
+        with xr.open_dataarray(local_filename) as data:
+            return normalize_input(data.load(), input_copies)
+
+
+def load_request(request):
+    filename1 = request['filename1']
+    filename2 = request['filename2']
+    
+    local_filename1 = input_cache.acquire(filename1)
+    # 验证文件是否存在
+    if os.path.exists(local_filename1):
+        file_size = os.path.getsize(local_filename1)
+        print(f"文件已保存到: {local_filename1}")
+        print(f"文件大小: {file_size:,} bytes")
+
+    try:
+        local_filename2 = input_cache.acquire(filename2)
+    except Exception:
+        input_cache.release(local_filename1)
+        raise
+    # 验证文件是否存在
+    if os.path.exists(local_filename2):
+        file_size = os.path.getsize(local_filename2)
+        print(f"文件已保存到: {local_filename2}")
+        print(f"文件大小: {file_size:,} bytes")
+
+    try:
+        data1 = input_cache.load(local_filename1, open_input)  # , engine='cfgrib'
+        with netcdf_lock:
+            data2 = xr.open_dataset(local_filename2)  # , engine='cfgrib'
+    except Exception:
+        input_cache.release(local_filename1)
+        input_cache.release(local_filename2)
+        raise
+    
+    return {'filename1': filename1, 'filename2': filename2, 'local_filename1': local_filename1, 'local_filename2': local_filename2, 'data1': data1, 'data2': data2, 'request': request}
+
+
+def release_request(input_data):
+    """请求处理完后归还缓存中的输入文件"""
+    with netcdf_lock:
+        input_data['data2'].close()
+    input_cache.release(input_data['local_filename1'])
+    input_cache.release(input_data['local_filename2'])
+
+
+def parse_request_body(request_body):
+    """
+    解析请求体：单个JSON对象，或批量转换 MultiRecord 模式下按行拼接的多条JSON记录
+    """
+    try:
+        return json.loads(request_body)
+    except json.JSONDecodeError:
+        return [json.loads(line) for line in request_body.splitlines() if line.strip()]
 
 
 def input_fn(request_body, request_content_type):
-    if request_content_type == 'application/json':
-        request = json.loads(request_body)
-        filename1 = request['filename1']
-        filename2 = request['filename2']
-        
-        local_filename1 = download_s3_file(filename1)
-        # 验证文件是否存在
-        if os.path.exists(local_filename1):
-            file_size = os.path.getsize(local_filename1)
-            print(f"文件已保存到: {local_filename1}")
-            print(f"文件大小: {file_size:,} bytes")
-
-        local_filename2 = download_s3_file(filename2)
-        # 验证文件是否存在
-        if os.path.exists(local_filename2):
-            file_size = os.path.getsize(local_filename2)
-            print(f"文件已保存到: {local_filename2}")
-            print(f"文件大小: {file_size:,} bytes")
-            
-        data1 = xr.open_dataarray(local_filename1)  # , engine='cfgrib'
-        data2 = xr.open_dataset(local_filename2)  # , engine='cfgrib'
-        
-        return {'filename1': filename1, 'filename2': filename2, 'local_filename1': local_filename1, 'local_filename2': local_filename2, 'data1': data1, 'data2': data2}
+    if request_content_type in ('application/json', 'application/jsonlines'):
+        request = parse_request_body(request_body)
+        if isinstance(request, list):
+            # 多条记录：只解析请求，各记录的输入在处理到时才加载（见 RecordLoader）
+            return request
+        if request.get('action') in ('submit', 'status', 'list', 'info'):
+            # 异步任务接口：下载输入放到后台任务中执行，立即返回
+            return {'action': request['action'], 'request': request}
+        return load_request(request)
     else:
         # Handle other content-types here or raise an Exception
         # if the content type is not supported.  
         return request_body
 
     
+def run_forecast_job(model_dir, request, on_step, on_progress=None):
+    input_data = load_request(request)
+    try:
+        return run_request(model_dir, input_data['data1'], request, num_steps, request['filename1'][:-3]+'/result',
+                           sessions=resident_sessions, on_step=on_step, on_progress=on_progress)
+    finally:
+        release_request(input_data)
+
+
+def handle_job_action(action, request, model):
+    """
+    异步任务接口
+
+    submit: 提交预报，立即返回 job_id；请求不完整或预报时效无效时不排队，返回 rejected 和原因
+    status: 查询进度和已经写出的各时效路径，可用 since_seq（上次返回的 last_seq）只返回新增的输出
+    list:   列出进程内的全部任务
+    info:   当前模型变体、常驻会话、启动预热耗时、输入缓存和输入规范化的复制统计
+    """
+    if action == 'submit':
+        # 在排队前检查请求，无效的请求作为客户端错误返回，而不是让整个调用失败
+        try:
+            missing = [key for key in ('filename1', 'filename2') if not request.get(key)]
+            if missing:
+                raise ValueError(f'缺少输入文件: {", ".join(missing)}')
+            check_request(request)
+            total_step = sum(plan_steps(request, num_steps))
+        except (ValueError, TypeError) as e:
+            return {'status': 'rejected', 'error': str(e)}
+        job = job_manager.submit(request, total_step,
+                                 lambda r, on_step, on_progress: run_forecast_job(model, r, on_step, on_progress))
+        return {'job_id': job.job_id, 'status': job.status}
+    if action == 'status':
+        job = job_manager.get(request.get('job_id'))
+        if job is None:
+            return {'job_id': request.get('job_id'), 'status': 'not_found'}
+        return job.to_dict(since_seq=int(request.get('since_seq', 0)))
+    if action == 'info':
+        return {'model_variant': model_variant, 'resident_stages': sorted(resident_sessions),
+                'warmup': warmup_stats, 'input_cache': input_cache.report(), 'input_copies': input_copies.report(),
+                's3_transfer': transfer.report()}
+    return {'jobs': job_manager.summary()}
+
+
 def predict_fn(input_data, model):
     print('[DEBUG] input_data:', input_data)
+    if isinstance(input_data, dict) and 'action' in input_data:
+        return handle_job_action(input_data['action'], input_data['request'], model)
+
+    if isinstance(input_data, list):
+        # 各条路径按需加载记录的输入，处理完逐条归还（请求失败时也会归还）
+        devices = discover_devices()
+        if cpu_memory_cap() is not None:
+            # 内存受限的 CPU 模式：逐条执行，不使用需要三个阶段同时常驻的流水线
+            result = run_sequential(model, input_data, num_steps)
+        elif len(devices) > 1 and os.environ.get('FUXI_DEVICE_MODE', 'forecast') == 'forecast':
+            # 多条记录 + 多设备：整条预报分发到不同设备
+            result = run_on_devices(model, input_data, num_steps, devices)
+        else:
+            # 多条记录：三个阶段流水线并行，阶段按设备轮流分配
+            result = run_pipeline(model, input_data, num_steps, devices=devices)
+        print(f'input cache: {input_cache.report()}, input copies: {input_copies.report()}')
+        print(f's3 transfer: {transfer.report()}')
+        print('[DEBUG] result:', result)
+        return result
+
     data = input_data['data1']  # TODO 如果这里是两个文件，就传2个文件
-    result = run_inference(model, data, num_steps, save_dir=input_data['filename1'][:-3]+'/result')
-    remove_file(input_data['local_filename1'])
-    remove_file(input_data['local_filename2'])
+    try:
+        result = run_request(model, data, input_data['request'], num_steps, input_data['filename1'][:-3]+'/result',
+                             sessions=resident_sessions)
+    finally:
+        release_request(input_data)
+    print(f'input cache: {input_cache.report()}, input copies: {input_copies.report()}')
+    print(f's3 transfer: {transfer.report()}')
     print('[DEBUG] result:', result)
     
     return result
 
 
+def output_fn(prediction, accept):
+    # 多条记录的结果按行输出，与批量转换的 AssembleWith=Line 对应
+    if isinstance(prediction, list):
+        return '\n'.join(json.dumps(p) for p in prediction)
+    return json.dumps(prediction)
+
+
 if __name__ == '__main__':
     model = model_fn('./')
     request_body = '{"filename1": "s3://datalab/goldwind/Sample_data/20231012-06_input_netcdf.nc", "filename2": "s3://datalab/goldwind/Sample_data/20231012-06_input_grib.nc"}'
@@ -0,0 +1,99 @@
+"""
+模型输入的规范化
+
+模型要求初始场为 (1, T, C, H, W) 的 C 连续 float32 数组，纬度从 90 到 -90。
+过去 prepare_forecast 用 assert 检查纬度方向后取 data.values[None]：纬度为升序的
+输入直接失败，文件中的类型或维度顺序不同时，转换发生在推理时的隐式复制中。
+
+normalize_input 在解码后一次完成维度顺序 (time, level, lat, lon)、纬度翻转和
+C 连续 float32 转换：需要时只复制一次（翻转、转置和类型转换在同一次复制中完成），
+已经符合要求时不复制。open_input 解码后即规范化，结果由 InputCache 按 ETag 缓存，
+重复请求直接使用；input_tensor 得到的模型输入只是加一个维度的视图。
+每次复制的原因、字节数和耗时记录在 CopyStats 中。
+"""
+import collections
+import threading
+import time
+
+import numpy as np
+
+__all__ = ["CopyStats", "input_tensor", "normalize_input"]
+
+DIMS = ('time', 'level', 'lat', 'lon')
+
+
+class CopyStats:
+    """输入规范化的复制记录"""
+
+    def __init__(self):
+        self.counts = collections.Counter()
+        self._lock = threading.Lock()
+
+    def record(self, reasons, nbytes, seconds):
+        with self._lock:
+            self.counts['copies'] += 1
+            self.counts['copy_bytes'] += nbytes
+            self.counts['copy_sec'] += seconds
+            for reason in reasons:
+                self.counts[reason] += 1
+
+    def skip(self):
+        with self._lock:
+            self.counts['zero_copy'] += 1
+
+    def report(self):
+        with self._lock:
+            report = dict(self.counts)
+        report['copy_mb'] = round(report.pop('copy_bytes', 0) / 2**20, 1)
+        report['copy_sec'] = round(report.get('copy_sec', 0.0), 4)
+        return report
+
+
+def _needs_flip(lat):
+    """纬度从 -90 到 90 时需要翻转；不是从一极到另一极时抛出 ValueError"""
+    if lat[0] == 90 and lat[-1] == -90:
+        return False
+    if lat[0] == -90 and lat[-1] == 90:
+        return True
+    raise ValueError(f'输入的纬度范围必须为 90 ~ -90（或 -90 ~ 90）: {lat[0]} ~ {lat[-1]}')
+
+
+def normalize_input(data, stats=None):
+    """
+    返回维度为 (time, level, lat, lon)、纬度从 90 到 -90、数组为 C 连续 float32 的 DataArray
+
+    已经符合要求时不复制，返回的 DataArray 与 data 共享数组；否则复制一次。
+    数组来自延迟读取的文件时，读取由调用方加 netcdf_lock。
+
+    Raises:
+        ValueError: 维度或纬度范围不符合要求
+    """
+    if set(data.dims) != set(DIMS):
+        raise ValueError(f'输入的维度必须为 {DIMS}: {data.dims}')
+    flip = _needs_flip(data.lat.values)
+    view = data.transpose(*DIMS)
+    if flip:
+        view = view.isel(lat=slice(None, None, -1))
+    values = view.values
+    if values.dtype == np.float32 and values.flags.c_contiguous:
+        if stats is not None:
+            stats.skip()
+        return view.copy(deep=False, data=values)
+
+    reasons = [reason for reason, needed in (('flip', flip), ('transpose', data.dims != DIMS),
+                                             ('dtype', values.dtype != np.float32)) if needed]
+    start = time.perf_counter()
+    normalized = np.empty(values.shape, dtype=np.float32)
+    np.copyto(normalized, values, casting='same_kind')
+    if stats is not None:
+        stats.record(reasons or ['contiguous'], normalized.nbytes, time.perf_counter() - start)
+    print(f'input: normalized {"/".join(reasons or ["contiguous"])}, {normalized.nbytes / 2**20:.1f} MB')
+    return view.copy(deep=False, data=normalized)
+
+
+def input_tensor(data):
+    """规范化后的 DataArray -> 模型输入 (1, T, C, H, W)，不复制"""
+    values = data.values
+    if values.dtype != np.float32 or not values.flags.c_contiguous or data.lat.values[0] != 90:
+        raise ValueError('输入没有经过 normalize_input 规范化')
+    return values[None]
@@ -0,0 +1,135 @@
+"""
+实时推理端点的异步任务管理
+
+提交预报请求后立即返回任务ID，预报在后台线程中执行；每写完一个时效，
+该时效的输出路径马上可以通过状态查询拿到，下游不必等整个预报结束。
+
+任务状态保存在模型服务器进程内，端点需要使用单个工作进程
+（SAGEMAKER_MODEL_SERVER_WORKERS=1），否则查询可能落到其他进程上。
+"""
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+__all__ = ["ForecastJob", "JobManager"]
+
+
+class ForecastJob:
+
+    def __init__(self, request, total_step, freq=6):
+        self.job_id = uuid.uuid4().hex
+        self.request = request
+        self.total_step = total_step
+        self.freq = freq
+        self.status = 'queued'
+        self.outputs = []
+        # 已经计算完成的时效数，与输出无关：只输出聚合产品或站点表的任务也有进度
+        self.steps_done = 0
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    def on_step(self, step, s3_path):
+        """
+        每个时效写入S3后调用
+
+        上传失败后推迟重试的时效会晚于后面的时效写出，因此每个输出按写出顺序
+        编号（seq），客户端用 since_seq 而不是时效序号获取新增的输出。
+        """
+        with self._lock:
+            self.outputs.append({
+                'seq': len(self.outputs) + 1,
+                'step': step + 1,
+                'lead_time_hours': (step + 1) * self.freq,
+                's3_path': s3_path,
+                'written_at': time.time(),
+            })
+
+    def on_progress(self, step):
+        """每个时效计算完成后调用，不论该时效是否写出文件"""
+        with self._lock:
+            self.steps_done = max(self.steps_done, step + 1)
+
+    def to_dict(self, since_seq=0):
+        with self._lock:
+            outputs = self.outputs[since_seq:]
+            return {
+                'job_id': self.job_id,
+                'status': self.status,
+                'filename1': self.request.get('filename1'),
+                'steps_done': self.steps_done,
+                'steps_total': self.total_step,
+                'progress': round(self.steps_done / self.total_step, 4) if self.total_step else 0,
+                'outputs': outputs,
+                'last_seq': len(self.outputs),
+                'error': self.error,
+                'created_at': self.created_at,
+                'started_at': self.started_at,
+                'finished_at': self.finished_at,
+            }
+
+
+class JobManager:
+    """
+    Args:
+        max_workers: 同时执行的预报数，单GPU时为1，其余任务排队
+        history: 保留的任务数，超出后丢弃最早结束的任务
+    """
+
+    def __init__(self, max_workers=1, history=100):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='fuxi-job')
+        self.history = history
+        self.jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, request, total_step, run_fn):
+        """
+        提交预报任务
+
+        Args:
+            request: 请求内容（filename1/filename2 等）
+            total_step: 预报总步数
+            run_fn: 执行预报的函数，参数为 (request, on_step, on_progress)，返回最终结果
+
+        Returns:
+            ForecastJob
+        """
+        job = ForecastJob(request, total_step)
+        with self._lock:
+            self.jobs[job.job_id] = job
+            self._trim()
+        self.executor.submit(self._run, job, run_fn)
+        print(f"任务已提交: {job.job_id}")
+        return job
+
+    def _run(self, job, run_fn):
+        job.status = 'running'
+        job.started_at = time.time()
+        try:
+            job.result = run_fn(job.request, job.on_step, job.on_progress)
+            job.status = 'completed'
+        except Exception as e:
+            print(f"任务 {job.job_id} 失败: {e}")
+            job.error = str(e)
+            job.status = 'failed'
+        job.finished_at = time.time()
+        print(f"任务 {job.job_id} 结束: {job.status}, 耗时 {job.finished_at - job.started_at:.2f} sec")
+
+    def _trim(self):
+        finished = [k for k, j in self.jobs.items() if j.status in ('completed', 'failed')]
+        while len(self.jobs) > self.history and finished:
+            del self.jobs[finished.pop(0)]
+
+    def get(self, job_id):
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def summary(self):
+        with self._lock:
+            return [{'job_id': j.job_id, 'status': j.status, 'steps_done': j.steps_done,
+                     'steps_total': j.total_step} for j in self.jobs.values()]
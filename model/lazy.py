@@ -0,0 +1,66 @@
+"""
+延迟导入重量级模块
+
+xarray/pandas/onnxruntime/boto3 的导入需要数秒，工作进程启动时并不都用得到。
+lazy_module 返回一个代理对象，第一次访问属性时才真正导入；preload 可在后台
+线程中提前导入，使第一个请求不再承担导入开销。
+"""
+import importlib
+import threading
+import time
+
+__all__ = ["lazy_module", "preload"]
+
+
+class _LazyModule:
+
+    def __init__(self, name):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+        self.__dict__['_lock'] = threading.Lock()
+
+    def _load(self):
+        module = self.__dict__['_module']
+        if module is None:
+            with self.__dict__['_lock']:
+                module = self.__dict__['_module']
+                if module is None:
+                    module = importlib.import_module(self.__dict__['_name'])
+                    self.__dict__['_module'] = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._load(), attr, value)
+
+    def __repr__(self):
+        state = 'loaded' if self.__dict__['_module'] is not None else 'not loaded'
+        return f"<lazy module '{self.__dict__['_name']}' ({state})>"
+
+
+def lazy_module(name):
+    return _LazyModule(name)
+
+
+def preload(*modules, background=True):
+    """
+    提前导入延迟模块
+
+    Args:
+        modules: lazy_module 返回的代理对象
+        background: 为 True 时在守护线程中导入，立即返回
+    """
+    def load():
+        for module in modules:
+            start = time.perf_counter()
+            module._load()
+            print(f"预加载模块 {module.__dict__['_name']} 耗时 {time.perf_counter() - start:.2f} sec")
+
+    if not background:
+        load()
+        return None
+    thread = threading.Thread(target=load, name='fuxi-preload', daemon=True)
+    thread.start()
+    return thread
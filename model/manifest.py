@@ -0,0 +1,72 @@
+"""
+模型文件清单和完整性校验
+
+scripts/package_model.py 把 ONNX 图和外部权重打进 model.tar.gz（或上传为不压缩的
+S3 前缀），并写入 model_manifest.json，记录每个文件的大小和 SHA-256。
+SageMaker 在容器启动前把模型数据解压/同步到 /opt/ml/model，model_fn 按清单检查
+文件是否齐全、是否完整，只有检查不通过时才退回到从 S3 下载。
+"""
+import hashlib
+import json
+import os
+
+__all__ = ["MODEL_MANIFEST", "build_manifest", "file_sha256", "read_manifest", "verify_files"]
+
+MODEL_MANIFEST = 'model_manifest.json'
+
+
+def file_sha256(path, chunk_size=16 * 2**20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def build_manifest(model_dir, files, save_dir=None):
+    """计算 files（相对 model_dir 的路径）的大小和 SHA-256，写入 save_dir（默认 model_dir）中的清单并返回"""
+    manifest = {'files': {}}
+    for name in files:
+        path = os.path.join(model_dir, name)
+        manifest['files'][name] = {'size': os.path.getsize(path), 'sha256': file_sha256(path)}
+    with open(os.path.join(save_dir or model_dir, MODEL_MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def read_manifest(model_dir):
+    path = os.path.join(model_dir, MODEL_MANIFEST)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def verify_files(model_dir, files, manifest=None, checksum=False):
+    """
+    检查 model_dir 中的 files 是否齐全且与清单一致
+
+    清单中有记录的文件检查大小，checksum 为 True 时再比较 SHA-256
+    （数GB的权重需要数秒到数十秒）；清单中没有记录的文件只检查是否存在且非空。
+
+    Returns:
+        list: 问题列表，为空表示全部通过
+    """
+    entries = (manifest or {}).get('files', {})
+    problems = []
+    for name in files:
+        path = os.path.join(model_dir, name)
+        if not os.path.isfile(path):
+            problems.append(f'{name}: 不存在')
+            continue
+        size = os.path.getsize(path)
+        entry = entries.get(name)
+        if entry is None:
+            if size == 0:
+                problems.append(f'{name}: 文件为空')
+            continue
+        if size != entry['size']:
+            problems.append(f"{name}: 大小 {size} 与清单 {entry['size']} 不一致")
+        elif checksum and file_sha256(path) != entry['sha256']:
+            problems.append(f'{name}: SHA-256 与清单不一致')
+    return problems
@@ -0,0 +1,154 @@
+"""
+short/medium/long 级联的多请求流水线调度
+
+每个阶段一个工作线程，阶段之间用有界队列传递自回归状态。
+onnxruntime 在 session.run 期间会释放GIL，因此请求B的short阶段
+可以和请求A的medium阶段在同一实例上重叠执行。
+"""
+import queue
+import threading
+import time
+
+__all__ = ["ForecastState", "PipelineScheduler", "print_pipeline_report"]
+
+_STOP = object()
+
+
+class ForecastState:
+    """在阶段之间传递的单个预报请求的状态"""
+
+    def __init__(self, index, data, save_dir):
+        self.index = index
+        self.data = data
+        self.save_dir = save_dir
+        self.local_dir = None
+        self.on_output = None
+        self.input = None
+        self.tembs = None
+        # 按请求的预报时效裁剪后的各阶段步数
+        self.num_steps = None
+        self.step = 0
+        self.s3_paths = []
+        # 重试用尽仍上传失败的 (step, 本地文件)，预报结束后再上传一次
+        self.failed = []
+        self.error = None
+
+
+class StageWorker(threading.Thread):
+
+    def __init__(self, name, stage_fn, in_queue, out_queue):
+        super().__init__(name=f'fuxi-stage-{name}', daemon=True)
+        self.stage_name = name
+        self.stage_fn = stage_fn
+        self.in_queue = in_queue
+        self.out_queue = out_queue
+        self.busy_time = 0.0
+        # 等待上游交付的时间（饥饿）和等待下游接收的时间（阻塞）
+        self.wait_in_time = 0.0
+        self.wait_out_time = 0.0
+        self.processed = 0
+
+    def run(self):
+        while True:
+            start = time.perf_counter()
+            state = self.in_queue.get()
+            self.wait_in_time += time.perf_counter() - start
+
+            if state is _STOP:
+                self.out_queue.put(_STOP)
+                break
+
+            if state.error is None:
+                start = time.perf_counter()
+                try:
+                    self.stage_fn(state)
+                except Exception as e:
+                    print(f"阶段 {self.stage_name} 处理请求 {state.index} 失败: {e}")
+                    state.error = e
+                self.busy_time += time.perf_counter() - start
+                self.processed += 1
+
+            start = time.perf_counter()
+            self.out_queue.put(state)
+            self.wait_out_time += time.perf_counter() - start
+
+
+class PipelineScheduler:
+    """
+    按阶段流水线执行多个预报请求
+
+    Args:
+        stage_fns: 每个阶段的处理函数，参数为 ForecastState，原地更新状态
+        names: 阶段名称，用于统计报告
+        queue_size: 阶段之间交接队列的容量，限制同时驻留的自回归状态数量
+    """
+
+    def __init__(self, stage_fns, names=None, queue_size=1):
+        self.names = names or [str(i) for i in range(len(stage_fns))]
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in stage_fns]
+        # 最后一个队列收集结果，不设上限，避免主线程投递时死锁
+        self.queues.append(queue.Queue())
+        self.workers = [
+            StageWorker(self.names[i], fn, self.queues[i], self.queues[i + 1])
+            for i, fn in enumerate(stage_fns)
+        ]
+        self.elapsed = 0.0
+
+    def _feed(self, states):
+        for state in states:
+            self.queues[0].put(state)
+        self.queues[0].put(_STOP)
+
+    def run(self, states, on_finished=None):
+        """
+        Args:
+            states: 按顺序进入流水线的请求状态
+            on_finished: 可选，每个请求离开最后一个阶段时在调用线程中调用，参数为 ForecastState，
+                用于逐条上传汇总结果、归还输入，不必等所有请求结束；抛出的异常记在该请求的 error 中
+        """
+        start = time.perf_counter()
+        for worker in self.workers:
+            worker.start()
+        # 投递在单独的线程中进行，调用线程可以同时处理已经结束的请求
+        feeder = threading.Thread(target=self._feed, args=(states,), name='fuxi-stage-feed', daemon=True)
+        feeder.start()
+
+        finished = []
+        while True:
+            state = self.queues[-1].get()
+            if state is _STOP:
+                break
+            finished.append(state)
+            if on_finished is not None:
+                try:
+                    on_finished(state)
+                except Exception as e:
+                    print(f"请求 {state.index} 结束处理失败: {e}")
+                    state.error = e
+        feeder.join()
+        for worker in self.workers:
+            worker.join()
+        self.elapsed = time.perf_counter() - start
+        return sorted(finished, key=lambda s: s.index)
+
+    def report(self):
+        """每个阶段的利用率和在队列上的等待时间"""
+        elapsed = self.elapsed or 1e-9
+        stages = []
+        for worker in self.workers:
+            stages.append({
+                'stage': worker.stage_name,
+                'processed': worker.processed,
+                'busy_sec': round(worker.busy_time, 3),
+                'utilization': round(worker.busy_time / elapsed, 3),
+                'wait_upstream_sec': round(worker.wait_in_time, 3),
+                'wait_downstream_sec': round(worker.wait_out_time, 3),
+            })
+        return {'elapsed_sec': round(self.elapsed, 3), 'stages': stages}
+
+
+def print_pipeline_report(report):
+    print(f"流水线总耗时: {report['elapsed_sec']:.2f} sec")
+    for s in report['stages']:
+        print(f"  阶段 {s['stage']}: 请求数 {s['processed']}, 利用率 {s['utilization']:.1%}, "
+              f"等待上游 {s['wait_upstream_sec']:.2f} sec, 等待下游 {s['wait_downstream_sec']:.2f} sec")
@@ -0,0 +1,98 @@
+"""
+多条记录的按需加载和有界预取
+
+MultiRecord 请求过去在 input_fn 中一次下载并解码全部记录的输入：记录数多时
+所有初始场同时驻留内存，缓存中的文件因为被引用而无法淘汰，第一条预报也要等
+最后一条记录下载完才开始，其中任何一条读取失败整个请求都会失败。
+
+RecordLoader 在记录开始处理时才加载它，后台线程按处理顺序最多提前加载 depth 条，
+下载和解码与前一条记录的推理重叠；记录处理完（结果上传后）立即归还。
+加载失败只影响这一条记录，异常在 get 时抛出。
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+__all__ = ["RecordLoader"]
+
+
+class RecordLoader:
+    """
+    Args:
+        requests: 请求列表
+        load_fn: 加载一条记录的函数，参数为请求，返回加载结果
+        release_fn: 归还加载结果的函数
+        depth: 后台提前加载的记录数，0 表示不预取
+        order: 记录的处理顺序（请求下标列表），默认按请求顺序，预取按这个顺序进行
+    """
+
+    def __init__(self, requests, load_fn, release_fn, depth=1, order=None):
+        self.requests = requests
+        self.load_fn = load_fn
+        self.release_fn = release_fn
+        self.depth = max(depth, 0)
+        self.order = list(order) if order is not None else list(range(len(requests)))
+        self._position = {index: pos for pos, index in enumerate(self.order)}
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='fuxi-prefetch')
+        self._futures = {}
+        self._released = set()
+        self._lock = threading.Lock()
+        self.loaded = 0
+        self.peak_loaded = 0
+        self.wait_time = 0.0
+
+    def _load(self, request):
+        result = self.load_fn(request)
+        with self._lock:
+            self.loaded += 1
+            self.peak_loaded = max(self.peak_loaded, self.loaded)
+        return result
+
+    def get(self, index):
+        """第 index 条记录的加载结果，同时在后台预取之后的 depth 条记录"""
+        with self._lock:
+            pos = self._position[index]
+            for i in [index] + self.order[pos + 1:pos + 1 + self.depth]:
+                if i not in self._futures and i not in self._released:
+                    self._futures[i] = self._executor.submit(self._load, self.requests[i])
+            future = self._futures[index]
+        start = time.perf_counter()
+        try:
+            return future.result()
+        finally:
+            self.wait_time += time.perf_counter() - start
+
+    def release(self, index):
+        """归还第 index 条记录；没有加载或加载失败的记录直接跳过，重复归还无效"""
+        with self._lock:
+            if index in self._released:
+                return
+            self._released.add(index)
+            future = self._futures.pop(index, None)
+        if future is None or future.cancel():
+            return
+        try:
+            result = future.result()
+        except Exception:
+            return
+        try:
+            self.release_fn(result)
+        finally:
+            with self._lock:
+                self.loaded -= 1
+
+    def close(self):
+        """归还全部尚未归还的记录（包括预取了但没有用到的），停止后台线程"""
+        for index in list(self._futures):
+            self.release(index)
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def report(self):
+        return {'records': len(self.requests), 'depth': self.depth, 'peak_loaded': self.peak_loaded,
+                'wait_sec': round(self.wait_time, 3)}
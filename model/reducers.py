@@ -0,0 +1,110 @@
+"""
+在自回归循环中按时效流式累计统计量，只输出聚合产品
+
+每一步的输出只被读取一次，累计到预先分配的缓冲区里；按预报日（每天
+steps_per_day 步）输出日平均/最大/最小、日降水和累计降水，以及由 u/v
+分量导出的风速。缓冲区大小只与选择的变量数和网格有关，与步数无关。
+"""
+import numpy as np
+
+__all__ = ["StreamingReducer"]
+
+DEFAULT_VARIABLES = ['t2m', 'u10', 'v10', 'msl']
+DEFAULT_STATS = ['mean', 'max', 'min']
+DEFAULT_WIND = ['10']
+
+
+class StreamingReducer:
+    """
+    Args:
+        level_names: 输出通道名称（data.level），大小写不敏感
+        grid_shape: (lat, lon)
+        emit: 输出聚合产品的回调，参数为 (product, day, array, names)，
+            array 形状为 (len(names), lat, lon)，回调返回后缓冲区会被复用
+        variables: 计算日统计的通道
+        stats: 日统计量，mean/max/min 的子集
+        wind: 导出风速的层次，例如 ['10', '850'] 表示 u10/v10 和 u850/v850
+        tp: 是否输出日降水和累计降水
+        steps_per_day: 每个预报日的步数，6小时步长时为4
+    """
+
+    def __init__(self, level_names, grid_shape, emit, variables=None, stats=None, wind=None,
+                 tp=True, steps_per_day=4):
+        index = {str(name).lower(): i for i, name in enumerate(level_names)}
+        variables = DEFAULT_VARIABLES if variables is None else variables
+        wind = DEFAULT_WIND if wind is None else wind
+
+        self.emit = emit
+        self.stats = DEFAULT_STATS if stats is None else stats
+        self.steps_per_day = steps_per_day
+        self.indices = np.array([index[v.lower()] for v in variables], dtype=np.int64)
+        self.wind_indices = [(index[f'u{level}'], index[f'v{level}']) for level in wind]
+        self.names = [v.lower() for v in variables] + [f'ws{level}' for level in wind]
+        self.tp_index = index.get('tp') if tp else None
+
+        k = len(self.names)
+        h, w = grid_shape
+        self.work = np.empty((k, h, w), dtype=np.float32)
+        self.out = np.empty((k, h, w), dtype=np.float32)
+        self.sum = np.zeros((k, h, w), dtype=np.float32) if 'mean' in self.stats else None
+        self.max = np.full((k, h, w), -np.inf, dtype=np.float32) if 'max' in self.stats else None
+        self.min = np.full((k, h, w), np.inf, dtype=np.float32) if 'min' in self.stats else None
+        if self.tp_index is not None:
+            self.tp_day = np.zeros((1, h, w), dtype=np.float32)
+            self.tp_total = np.zeros((1, h, w), dtype=np.float32)
+        self.count = 0
+        self.day = 0
+        print(f'reducer: {self.names}, stats {self.stats}, tp {self.tp_index is not None}, '
+              f'buffers {self.nbytes / 2**20:.1f} MB')
+
+    @property
+    def nbytes(self):
+        buffers = [self.work, self.out, self.sum, self.max, self.min]
+        if self.tp_index is not None:
+            buffers += [self.tp_day, self.tp_total]
+        return sum(b.nbytes for b in buffers if b is not None)
+
+    def update(self, output):
+        """累计一步输出，output 形状为 (1, C, lat, lon)"""
+        x = output[0]
+        k = len(self.indices)
+        np.take(x, self.indices, axis=0, out=self.work[:k])
+        for j, (iu, iv) in enumerate(self.wind_indices):
+            np.hypot(x[iu], x[iv], out=self.work[k + j])
+
+        if self.sum is not None:
+            self.sum += self.work
+        if self.max is not None:
+            np.maximum(self.max, self.work, out=self.max)
+        if self.min is not None:
+            np.minimum(self.min, self.work, out=self.min)
+        if self.tp_index is not None:
+            self.tp_day[0] += x[self.tp_index]
+            self.tp_total[0] += x[self.tp_index]
+
+        self.count += 1
+        if self.count == self.steps_per_day:
+            self._flush()
+
+    def finalize(self):
+        """输出最后一个不完整的预报日"""
+        if self.count:
+            self._flush()
+
+    def _flush(self):
+        self.day += 1
+        if self.sum is not None:
+            np.divide(self.sum, self.count, out=self.out)
+            self.emit('daily_mean', self.day, self.out, self.names)
+            self.sum.fill(0)
+        if self.max is not None:
+            self.emit('daily_max', self.day, self.max, self.names)
+            self.max.fill(-np.inf)
+        if self.min is not None:
+            self.emit('daily_min', self.day, self.min, self.names)
+            self.min.fill(np.inf)
+        if self.tp_index is not None:
+            self.emit('tp_daily', self.day, self.tp_day, ['tp'])
+            self.emit('tp_accum', self.day, self.tp_total, ['tp'])
+            self.tp_day.fill(0)
+        self.count = 0
@@ -0,0 +1,164 @@
+"""
+本地目录代替 S3 的客户端，可注入故障
+
+实现 S3Transfer 用到的 upload_file/download_file/head_object 接口，对象保存在
+root/bucket/key。用于没有 AWS 环境时运行推理（FUXI_S3_LOCAL_ROOT），以及检验
+重试、完整性校验和自适应并发：
+
+- faults: 每次传输按概率注入的故障，throttle（503 SlowDown）、error（500 InternalError）、
+  reset（连接中断）、corrupt（传输的数据被截断，由完整性校验发现）
+- fail_next: 按顺序注入确定的故障
+- stream_mbps / max_streams: 模拟带宽，吞吐为 stream_mbps × min(并发数, max_streams)
+- throttle_above: 并发数超过它时返回 SlowDown
+"""
+import collections
+import hashlib
+import os
+import random
+import shutil
+import threading
+import time
+
+__all__ = ["ClientError", "LocalS3Client", "parse_faults"]
+
+try:
+    from botocore.exceptions import ClientError
+except ImportError:
+    class ClientError(Exception):
+        def __init__(self, error_response, operation_name):
+            super().__init__(f"An error occurred ({error_response['Error']['Code']}) when calling "
+                             f"the {operation_name} operation: {error_response['Error']['Message']}")
+            self.response = error_response
+            self.operation_name = operation_name
+
+FAULTS = {
+    'throttle': ('SlowDown', 503, 'Please reduce your request rate.'),
+    'error': ('InternalError', 500, 'We encountered an internal error. Please try again.'),
+    'notfound': ('404', 404, 'Not Found'),
+}
+
+
+def parse_faults(spec):
+    """'throttle=0.1,error=0.05' -> {'throttle': 0.1, 'error': 0.05}"""
+    faults = {}
+    for item in filter(None, (spec or '').split(',')):
+        kind, _, p = item.partition('=')
+        faults[kind.strip()] = float(p)
+    return faults
+
+
+def _client_error(kind, operation):
+    code, status, message = FAULTS[kind]
+    return ClientError({'Error': {'Code': code, 'Message': message},
+                        'ResponseMetadata': {'HTTPStatusCode': status}}, operation)
+
+
+class LocalS3Client:
+    """
+    Args:
+        root: 保存对象的本地目录
+        faults: {故障类型: 概率}，见模块说明
+        seed: 故障的随机种子
+        stream_mbps: 每个并发流的带宽（MB/s），None 表示不限速
+        max_streams: 超过该并发数后吞吐不再增加
+        throttle_above: 并发数超过它时返回 SlowDown
+    """
+
+    def __init__(self, root, faults=None, seed=None, stream_mbps=None, max_streams=None, throttle_above=None):
+        self.root = root
+        self.faults = dict(faults or {})
+        self.random = random.Random(seed)
+        self.stream_mbps = stream_mbps
+        self.max_streams = max_streams
+        self.throttle_above = throttle_above
+        self.injected = collections.Counter()
+        self.calls = collections.Counter()
+        self._scheduled = collections.deque()
+        self._etags = {}
+        self._lock = threading.Lock()
+
+    def path(self, bucket, key):
+        return os.path.join(self.root, bucket, key)
+
+    def fail_next(self, kind, n=1, operation=None):
+        """接下来的 n 次 operation（None 表示任意传输）注入 kind 故障"""
+        with self._lock:
+            self._scheduled.extend([(kind, operation)] * n)
+
+    def _fault(self, operation, concurrency):
+        with self._lock:
+            self.calls[operation] += 1
+            for i, (kind, op) in enumerate(self._scheduled):
+                if op is None or op == operation:
+                    del self._scheduled[i]
+                    break
+            else:
+                kind = None
+                if self.throttle_above is not None and concurrency > self.throttle_above:
+                    kind = 'throttle'
+                else:
+                    for name, p in self.faults.items():
+                        if self.random.random() < p:
+                            kind = name
+                            break
+            if kind is not None:
+                self.injected[kind] += 1
+        if kind in FAULTS:
+            raise _client_error(kind, operation)
+        if kind == 'reset':
+            raise ConnectionResetError('Connection reset by peer')
+        return kind
+
+    def _throttle(self, nbytes, concurrency):
+        if self.stream_mbps:
+            streams = min(concurrency, self.max_streams or concurrency)
+            time.sleep(nbytes / 2**20 / (self.stream_mbps * streams))
+
+    def _copy(self, source, target, corrupt):
+        os.makedirs(os.path.dirname(os.path.abspath(target)), exist_ok=True)
+        if corrupt:
+            size = os.path.getsize(source)
+            with open(source, 'rb') as src, open(target, 'wb') as dst:
+                dst.write(src.read(max(size - 1, 0)))
+        else:
+            shutil.copyfile(source, target)
+
+    def upload_file(self, Filename, Bucket, Key, ExtraArgs=None, Callback=None, Config=None):
+        concurrency = getattr(Config, 'max_concurrency', 1)
+        corrupt = self._fault('PutObject', concurrency) == 'corrupt'
+        chunk_size = getattr(Config, 'multipart_chunksize', 8 * 2**20)
+        threshold = getattr(Config, 'multipart_threshold', chunk_size)
+        self._throttle(os.path.getsize(Filename), concurrency)
+        target = self.path(Bucket, Key)
+        self._copy(Filename, target, corrupt)
+
+        from transfer import etag_of
+        with self._lock:
+            self._etags[(Bucket, Key)] = (os.path.getmtime(target), etag_of(target, chunk_size, threshold))
+
+    def download_file(self, Bucket, Key, Filename, ExtraArgs=None, Callback=None, Config=None):
+        concurrency = getattr(Config, 'max_concurrency', 1)
+        source = self.path(Bucket, Key)
+        if not os.path.isfile(source):
+            raise _client_error('notfound', 'HeadObject')
+        corrupt = self._fault('GetObject', concurrency) == 'corrupt'
+        self._throttle(os.path.getsize(source), concurrency)
+        self._copy(source, Filename, corrupt)
+
+    def head_object(self, Bucket, Key):
+        source = self.path(Bucket, Key)
+        if not os.path.isfile(source):
+            raise _client_error('notfound', 'HeadObject')
+        mtime = os.path.getmtime(source)
+        with self._lock:
+            cached = self._etags.get((Bucket, Key))
+        if cached is not None and cached[0] == mtime:
+            etag = cached[1]
+        else:
+            # 直接放进目录的文件视为单段上传
+            digest = hashlib.md5()
+            with open(source, 'rb') as f:
+                for chunk in iter(lambda: f.read(16 * 2**20), b''):
+                    digest.update(chunk)
+            etag = digest.hexdigest()
+        return {'ETag': f'"{etag}"', 'ContentLength': os.path.getsize(source)}
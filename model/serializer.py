@@ -0,0 +1,183 @@
+"""
+多进程并行的 NetCDF 序列化
+
+to_netcdf 的编码是CPU密集的，而且 HDF5 不是线程安全的（见 inference.netcdf_lock），
+在线程中写出时同一时刻只能编码一个时效。ProcessSerializer 把编码交给进程池：
+每一步的输出复制到共享内存槽（multiprocessing.shared_memory）中，工作进程直接
+映射这块内存，数组不经过 pickle；多个时效在不同进程中并行编码，推理循环只承担
+一次内存复制。共享内存槽的数量有上限，全部占用时 submit 阻塞，起到反压作用。
+"""
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from lazy import lazy_module
+
+xr = lazy_module('xarray')
+
+__all__ = ["ProcessSerializer", "coords_template", "default_workers"]
+
+
+def default_workers():
+    """
+    为推理循环和上传线程保留2个vCPU，其余用于编码，最多8个进程
+
+    vCPU 不超过2个时返回0：没有空闲的核，进程间传递的开销得不到回报。
+    """
+    return min(8, max(0, (os.cpu_count() or 1) - 2))
+
+
+def coords_template(data):
+    """
+    只包含坐标的模板，代替完整的输入场传给工作进程
+
+    save_like 只用到输入的 time/level/lat/lon 坐标，传递完整的 DataArray
+    会把整个初始场 pickle 到每个任务里。
+    """
+    return xr.Dataset(coords={
+        'time': data.time.values[-1:],
+        'level': data.level.values,
+        'lat': data.lat.values,
+        'lon': data.lon.values,
+    })
+
+
+def _encode(save_fn, shm_name, shape, dtype, template, step, save_dir, kwargs):
+    """在工作进程中执行：映射共享内存并用 save_fn（默认 util.save_like）写出，返回文件路径"""
+    if save_fn is None:
+        from util import save_like as save_fn
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        output = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        save_name = save_fn(output, template, step, save_dir=save_dir, **kwargs)
+        del output
+        return save_name
+    finally:
+        shm.close()
+
+
+def _ready():
+    """编码一个很小的场，完成 xarray/netCDF 后端的导入和初始化"""
+    import pandas as pd
+    from util import save_like
+
+    save_dir = tempfile.mkdtemp(prefix='fuxi-warm-')
+    try:
+        template = xr.Dataset(coords={'time': [pd.Timestamp(0)], 'level': ['z'], 'lat': [0.0], 'lon': [0.0]})
+        save_like(np.zeros((1, 1, 1, 1), dtype=np.float32), template, 0, save_dir=save_dir)
+    finally:
+        shutil.rmtree(save_dir, ignore_errors=True)
+    return os.getpid()
+
+
+class ProcessSerializer:
+    """
+    Args:
+        workers: 编码进程数
+        slots: 共享内存槽数量上限，默认为 workers 的两倍
+    """
+
+    def __init__(self, workers, slots=None):
+        self.workers = workers
+        self.max_slots = slots or 2 * workers
+        # 推理进程已经初始化了CUDA和onnxruntime，fork 出来的子进程不安全
+        self.executor = ProcessPoolExecutor(max_workers=workers,
+                                            mp_context=multiprocessing.get_context('spawn'))
+        self._free = []
+        self._count = 0
+        self._cond = threading.Condition()
+        self.submitted = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.copy_time = 0.0
+
+    def warm(self):
+        """启动全部工作进程并导入编码需要的模块，避免第一个请求承担进程启动开销"""
+        start = time.perf_counter()
+        pids = set(f.result() for f in [self.executor.submit(_ready) for _ in range(self.workers)])
+        print(f'serializer: {len(pids)} worker processes ready in {time.perf_counter() - start:.2f} sec')
+
+    def _acquire(self, nbytes):
+        with self._cond:
+            start = time.perf_counter()
+            waited = False
+            while True:
+                for shm in self._free:
+                    if shm.size >= nbytes:
+                        self._free.remove(shm)
+                        break
+                else:
+                    shm = None
+                if shm is not None:
+                    break
+                if self._free and self._count >= self.max_slots:
+                    # 空闲的槽都太小（例如集合预报的全部成员），换成更大的
+                    self._destroy(self._free.pop(0))
+                if self._count < self.max_slots:
+                    shm = shared_memory.SharedMemory(create=True, size=nbytes)
+                    self._count += 1
+                    break
+                waited = True
+                self._cond.wait()
+            if waited:
+                self.waits += 1
+                self.wait_time += time.perf_counter() - start
+            return shm
+
+    def _release(self, shm):
+        with self._cond:
+            self._free.append(shm)
+            self._cond.notify_all()
+
+    def _destroy(self, shm):
+        shm.close()
+        shm.unlink()
+        self._count -= 1
+
+    def submit(self, output, template, step, save_dir, save_fn=None, **kwargs):
+        """
+        复制 output 到共享内存后提交编码任务，立即返回 Future（结果为本地文件路径）
+
+        save_fn 为模块级的写出函数（按引用传给工作进程），默认 util.save_like。
+        output 在 submit 返回后即可被复用。
+        """
+        output = np.asarray(output)
+        shm = self._acquire(output.nbytes)
+        start = time.perf_counter()
+        np.ndarray(output.shape, dtype=output.dtype, buffer=shm.buf)[...] = output
+        self.copy_time += time.perf_counter() - start
+
+        try:
+            future = self.executor.submit(_encode, save_fn, shm.name, output.shape, output.dtype.str,
+                                          template, step, save_dir, kwargs)
+        except Exception:
+            self._release(shm)
+            raise
+        future.add_done_callback(lambda _: self._release(shm))
+        self.submitted += 1
+        return future
+
+    def report(self):
+        return {
+            'workers': self.workers,
+            'slots': self._count,
+            'submitted': self.submitted,
+            'slot_waits': self.waits,
+            'slot_wait_sec': round(self.wait_time, 3),
+            'copy_sec': round(self.copy_time, 3),
+        }
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        with self._cond:
+            for shm in self._free:
+                self._destroy(shm)
+            self._free = []
@@ -0,0 +1,115 @@
+"""
+合成模型和初始场
+
+没有真实模型权重和输入数据时，用于基准测试和本地服务模拟（scripts/bench_cpu.py、
+scripts/serve_local.py）。文件布局与真实模型相同：每个阶段一个 .onnx 图和同名的
+外部权重文件，并写入 model_manifest.json；初始场为 (time=2, level, lat, lon) 的
+DataArray，纬度从 90 到 -90。
+
+合成模型的结构与 FuXi 类似但小得多：(1, 2, C, H, W) 的状态经分块嵌入、若干 MLP 块
+和反卷积得到增量，加到最后一个时刻上作为下一时刻的场。
+"""
+import os
+
+import numpy as np
+
+from lazy import lazy_module
+from manifest import build_manifest
+from variants import variant_files
+
+onnx = lazy_module('onnx')
+pd = lazy_module('pandas')
+xr = lazy_module('xarray')
+
+__all__ = ["CHANNELS", "synthetic_input", "synthetic_model", "synthetic_models"]
+
+# 与 FuXi 输入相同的 70 个通道：5 个变量 × 13 层，以及 5 个地面变量
+CHANNELS = [f'{v}{level}' for v in 'ztuvr'
+            for level in (50, 100, 150, 200, 250, 300, 400, 500, 600, 700, 850, 925, 1000)]
+CHANNELS += ['t2m', 'u10', 'v10', 'msl', 'tp']
+
+
+def synthetic_model(path, channels=70, lat=181, lon=360, dim=192, depth=4, patch=4, seed=0,
+                    external_data=None):
+    """
+    生成合成模型并保存到 path
+
+    Args:
+        lat, lon: 网格大小，不是 patch 的倍数时在图中补齐后再裁剪
+        dim, depth: 嵌入维度和 MLP 块数，决定计算量和权重大小
+        external_data: 外部权重文件名（与 path 在同一目录），None 时权重内嵌在图中
+    """
+    from onnx import TensorProto, helper, numpy_helper
+
+    rng = np.random.default_rng(seed)
+    pad_lat, pad_lon = -lat % patch, -lon % patch
+    grid = ((lat + pad_lat) // patch, (lon + pad_lon) // patch)
+
+    def weight(name, *shape, scale=0.02):
+        return numpy_helper.from_array((rng.standard_normal(shape) * scale).astype(np.float32), name)
+
+    def const(name, values):
+        return numpy_helper.from_array(np.array(values, dtype=np.int64), name)
+
+    inits = [weight('embed', dim, 2 * channels, patch, patch), weight('unembed', dim, channels, patch, patch),
+             const('state_shape', [1, 2 * channels, lat, lon]), const('pads', [0, 0, 0, 0, 0, 0, pad_lat, pad_lon]),
+             const('token_shape', [grid[0] * grid[1], dim]), const('grid_shape', [1, *grid, dim]),
+             const('zeros', [0, 0]), const('grid_end', [lat, lon]), const('axes23', [2, 3]),
+             const('last_start', [1]), const('last_end', [2]), const('axis1', [1]),
+             numpy_helper.from_array(np.array(0.01, dtype=np.float32), 'step_scale')]
+    nodes = [helper.make_node('Reshape', ['input', 'state_shape'], ['x0']),
+             helper.make_node('Pad', ['x0', 'pads'], ['x1']),
+             helper.make_node('Conv', ['x1', 'embed'], ['x2'], strides=[patch, patch]),
+             helper.make_node('Transpose', ['x2'], ['x3'], perm=[0, 2, 3, 1]),
+             helper.make_node('Reshape', ['x3', 'token_shape'], ['h0'])]
+    for i in range(depth):
+        inits += [weight(f'w{i}a', dim, 4 * dim), weight(f'w{i}b', 4 * dim, dim)]
+        nodes += [helper.make_node('MatMul', [f'h{i}', f'w{i}a'], [f'h{i}a']),
+                  helper.make_node('Relu', [f'h{i}a'], [f'h{i}r']),
+                  helper.make_node('MatMul', [f'h{i}r', f'w{i}b'], [f'h{i}b']),
+                  helper.make_node('Add', [f'h{i}', f'h{i}b'], [f'h{i + 1}'])]
+    nodes += [helper.make_node('Reshape', [f'h{depth}', 'grid_shape'], ['y0']),
+              helper.make_node('Transpose', ['y0'], ['y1'], perm=[0, 3, 1, 2]),
+              helper.make_node('ConvTranspose', ['y1', 'unembed'], ['y2'], strides=[patch, patch]),
+              helper.make_node('Slice', ['y2', 'zeros', 'grid_end', 'axes23'], ['y3']),
+              helper.make_node('Tanh', ['y3'], ['y4']),
+              helper.make_node('Mul', ['y4', 'step_scale'], ['y5']),
+              helper.make_node('Unsqueeze', ['y5', 'axis1'], ['y6']),
+              helper.make_node('Slice', ['input', 'last_start', 'last_end', 'axis1'], ['last']),
+              helper.make_node('Add', ['last', 'y6'], ['next']),
+              helper.make_node('Concat', ['last', 'next'], ['output'], axis=1)]
+    graph = helper.make_graph(
+        nodes, 'synthetic_fuxi',
+        [helper.make_tensor_value_info('input', TensorProto.FLOAT, [1, 2, channels, lat, lon]),
+         helper.make_tensor_value_info('temb', TensorProto.FLOAT, [1, 12])],
+        [helper.make_tensor_value_info('output', TensorProto.FLOAT, [1, 2, channels, lat, lon])],
+        inits)
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid('', 17)], ir_version=8)
+    if external_data:
+        onnx.save(model, path, save_as_external_data=True, all_tensors_to_one_file=True,
+                  location=external_data)
+    else:
+        onnx.save(model, path)
+    return path
+
+
+def synthetic_models(model_dir, stages=('short', 'medium', 'long'), **kwargs):
+    """在 model_dir 中生成各阶段的合成模型（.onnx + 外部权重）和 model_manifest.json"""
+    os.makedirs(model_dir, exist_ok=True)
+    for seed, stage in enumerate(stages):
+        synthetic_model(os.path.join(model_dir, f'{stage}.onnx'), seed=seed, external_data=stage, **kwargs)
+    build_manifest(model_dir, variant_files(stages, 'fp32'))
+    return model_dir
+
+
+def synthetic_input(path, init_time, lat=181, lon=360, seed=0):
+    """写出 init_time 起报的合成初始场（init_time - 6h 和 init_time 两个时刻）"""
+    rng = np.random.default_rng(seed)
+    init_time = pd.Timestamp(init_time)
+    data = xr.DataArray(
+        rng.standard_normal((2, len(CHANNELS), lat, lon), dtype=np.float32),
+        dims=['time', 'level', 'lat', 'lon'],
+        coords={'time': [init_time - pd.Timedelta(hours=6), init_time], 'level': CHANNELS,
+                'lat': np.linspace(90, -90, lat), 'lon': np.linspace(0, 360, lon, endpoint=False)})
+    data.to_netcdf(path)
+    return path
@@ -0,0 +1,261 @@
+"""
+带重试、完整性校验和自适应并发的 S3 传输
+
+一次预报要连续运行数小时并上传数十个时效，单次的 S3 瞬时错误（503 SlowDown、
+500、连接中断）不应该让整个预报失败或者悄悄丢掉一个时效。S3Transfer 负责：
+
+- 重试：可重试的错误按带抖动的指数退避（full jitter）重试，404/403 等立即失败；
+  客户端自身的重试关闭，由这里统一处理，限流也因此可以被观察到
+- 完整性：上传后用 head_object 比较大小和 ETag（按分片大小在本地计算
+  单段/多段 MD5），下载后比较大小，单段对象再比较 MD5；不一致视为可重试的错误
+- 自适应并发：每个传输的分片并发数在 [min_concurrency, max_concurrency] 内按
+  观察到的吞吐爬山调整，遇到限流时减半
+- 记录每次传输的字节数、耗时、MB/s、重试次数和并发数
+"""
+import collections
+import hashlib
+import os
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+from lazy import lazy_module
+
+boto3 = lazy_module('boto3')
+
+__all__ = ["S3Transfer", "TransferError", "etag_of", "make_client", "parse_s3_path"]
+
+# 限流错误码：并发减半后重试
+THROTTLE_CODES = {'SlowDown', 'Throttling', 'ThrottlingException', 'RequestLimitExceeded',
+                  'TooManyRequests', 'RequestThrottled', '503'}
+# 其他可重试的错误码；没有错误码的连接类异常同样重试
+RETRYABLE_CODES = {'InternalError', 'ServiceUnavailable', 'RequestTimeout', 'RequestTimeTooSkewed',
+                   '500', '502', '504', 'BadDigest', 'IncompleteBody'}
+# 本地文件问题，重试没有意义
+LOCAL_ERRORS = (FileNotFoundError, IsADirectoryError, PermissionError)
+
+
+class TransferError(Exception):
+    """重试用尽或不可重试的传输失败"""
+
+
+class IntegrityError(Exception):
+    """传输后大小或校验和不一致，按可重试的错误处理"""
+
+
+def parse_s3_path(s3_path):
+    parsed_url = urlparse(s3_path)
+    return parsed_url.netloc, parsed_url.path.lstrip('/')
+
+
+def error_code(e):
+    response = getattr(e, 'response', None) or {}
+    code = response.get('Error', {}).get('Code')
+    if code is None and 'ResponseMetadata' in response:
+        code = str(response['ResponseMetadata'].get('HTTPStatusCode'))
+    return code
+
+
+def etag_of(path, chunk_size, threshold=None):
+    """
+    按 S3 的规则在本地计算 ETag：小于 threshold 的单段上传为文件的 MD5，
+    否则为各分片 MD5 拼接后的 MD5 加 -分片数
+    """
+    threshold = chunk_size if threshold is None else threshold
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        if size < threshold:
+            digest = hashlib.md5()
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                digest.update(chunk)
+            return digest.hexdigest()
+        parts = [hashlib.md5(chunk).digest() for chunk in iter(lambda: f.read(chunk_size), b'')]
+    return f'{hashlib.md5(b"".join(parts)).hexdigest()}-{len(parts)}'
+
+
+class S3Transfer:
+    """
+    Args:
+        client_factory: 返回 S3 客户端的函数（boto3 或 s3local.LocalS3Client），首次使用时调用一次
+        max_attempts: 每次传输的最大尝试次数
+        base_delay, max_delay: 退避的初始和最大等待时间（秒）
+        concurrency, min_concurrency, max_concurrency: 分片并发数的初始值和范围
+        chunk_size: 分片大小，同时是分段上传的阈值
+        verify: size 只比较大小，md5（默认）再比较 ETag
+        history: 保留的传输记录数
+    """
+
+    def __init__(self, client_factory, max_attempts=5, base_delay=0.5, max_delay=20.0, concurrency=4,
+                 min_concurrency=1, max_concurrency=16, chunk_size=16 * 2**20, verify='md5', history=256):
+        self.client_factory = client_factory
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.concurrency = max(min_concurrency, min(concurrency, max_concurrency))
+        self.chunk_size = chunk_size
+        self.verify = verify
+        self.records = collections.deque(maxlen=history)
+
+        self._client = None
+        self._lock = threading.Lock()
+        # 爬山法：各并发数下吞吐的指数平均，以及当前调整方向
+        self._rates = {}
+        self._direction = 1
+        self.counts = collections.Counter()
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                self._client = self.client_factory()
+            return self._client
+
+    def _config(self, concurrency):
+        from boto3.s3.transfer import TransferConfig
+        return TransferConfig(multipart_threshold=self.chunk_size, multipart_chunksize=self.chunk_size,
+                              max_concurrency=concurrency, use_threads=concurrency > 1)
+
+    def _backoff(self, attempt):
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _on_throttle(self):
+        with self._lock:
+            self.counts['throttles'] += 1
+            self.concurrency = max(self.min_concurrency, self.concurrency // 2)
+            self._direction = 1
+
+    def _on_success(self, concurrency, nbytes, seconds):
+        """
+        按本次吞吐调整下一次传输的并发数
+
+        只用不小于两个分片的传输判断吞吐：小文件的耗时主要是请求延迟，与并发无关。
+        当前并发下的吞吐不如上一个并发数时反向调整。
+        """
+        if nbytes < 2 * self.chunk_size or seconds <= 0:
+            return
+        rate = nbytes / seconds
+        with self._lock:
+            previous = self._rates.get(concurrency)
+            self._rates[concurrency] = rate if previous is None else 0.7 * previous + 0.3 * rate
+            if concurrency != self.concurrency:
+                return
+            neighbour = self._rates.get(concurrency - self._direction)
+            if neighbour is not None and self._rates[concurrency] < neighbour:
+                self._direction = -self._direction
+            self.concurrency = max(self.min_concurrency,
+                                   min(self.max_concurrency, concurrency + self._direction))
+
+    def _retry(self, op, s3_path, fn):
+        """执行 fn(concurrency)，按错误类型重试，返回 (结果, 并发数, 耗时, 尝试次数)"""
+        attempt = 0
+        while True:
+            concurrency = self.concurrency
+            start = time.perf_counter()
+            try:
+                return fn(concurrency), concurrency, time.perf_counter() - start, attempt + 1
+            except LOCAL_ERRORS:
+                self.counts[f'{op}_failures'] += 1
+                raise
+            except Exception as e:
+                code = error_code(e)
+                throttled = code in THROTTLE_CODES
+                retryable = throttled or code in RETRYABLE_CODES or code is None
+                if throttled:
+                    self._on_throttle()
+                attempt += 1
+                if not retryable or attempt >= self.max_attempts:
+                    self.counts[f'{op}_failures'] += 1
+                    raise TransferError(f'{op} {s3_path} 失败（{attempt} 次尝试）: {e}') from e
+                delay = self._backoff(attempt)
+                self.counts['retries'] += 1
+                print(f'{op} {s3_path} 第 {attempt} 次失败（{code or type(e).__name__}），'
+                      f'{delay:.2f} sec 后重试: {e}')
+                time.sleep(delay)
+
+    def _run(self, op, s3_path, fn):
+        """执行一次传输 fn(concurrency)（返回包含 bytes 的对象信息），记录吞吐并调整并发"""
+        info, concurrency, seconds, attempts = self._retry(op, s3_path, fn)
+        nbytes = info['bytes']
+        self._on_success(concurrency, nbytes, seconds)
+        mbps = nbytes / 2**20 / seconds if seconds > 0 else 0.0
+        self.counts[f'{op}s'] += 1
+        self.counts[f'{op}_bytes'] += nbytes
+        self.records.append({'op': op, 's3_path': s3_path, 'bytes': nbytes, 'seconds': round(seconds, 3),
+                             'mbps': round(mbps, 1), 'attempts': attempts, 'concurrency': concurrency})
+        print(f'{op} {s3_path}: {nbytes / 2**20:.1f} MB, {seconds:.2f} sec, {mbps:.1f} MB/s, '
+              f'concurrency {concurrency}, attempts {attempts}')
+        return info
+
+    def head(self, s3_path):
+        """返回对象的 (ETag, 大小)"""
+        bucket, key = parse_s3_path(s3_path)
+
+        def attempt(concurrency):
+            head = self.client.head_object(Bucket=bucket, Key=key)
+            return head['ETag'].strip('"'), head['ContentLength']
+
+        return self._retry('head', s3_path, attempt)[0]
+
+    def upload(self, local_path, s3_path):
+        """上传并校验，返回对象的 {'bytes', 'etag'}"""
+        bucket, key = parse_s3_path(s3_path)
+        size = os.path.getsize(local_path)
+        expected = etag_of(local_path, self.chunk_size) if self.verify == 'md5' else None
+
+        def attempt(concurrency):
+            self.client.upload_file(local_path, bucket, key, Config=self._config(concurrency))
+            head = self.client.head_object(Bucket=bucket, Key=key)
+            if head['ContentLength'] != size:
+                raise IntegrityError(f"大小 {head['ContentLength']} 与本地 {size} 不一致")
+            etag = head['ETag'].strip('"')
+            # SSE-KMS 加密对象的 ETag 不是 MD5，只能比较大小
+            if expected is not None and head.get('ServerSideEncryption') != 'aws:kms' and etag != expected:
+                raise IntegrityError(f"ETag {etag} 与本地 {expected} 不一致")
+            return {'bytes': size, 'etag': etag}
+
+        return self._run('upload', s3_path, attempt)
+
+    def download(self, s3_path, local_path):
+        """下载到 local_path 并校验，返回对象的 {'bytes', 'etag'}；失败时不留下不完整的文件"""
+        bucket, key = parse_s3_path(s3_path)
+        partial = f'{local_path}.partial'
+
+        def attempt(concurrency):
+            head = self.client.head_object(Bucket=bucket, Key=key)
+            self.client.download_file(bucket, key, partial, Config=self._config(concurrency))
+            size = os.path.getsize(partial)
+            if size != head['ContentLength']:
+                raise IntegrityError(f"大小 {size} 与对象 {head['ContentLength']} 不一致")
+            etag = head['ETag'].strip('"')
+            # 多段上传的对象不知道原始分片大小，只比较大小
+            if self.verify == 'md5' and '-' not in etag and head.get('ServerSideEncryption') != 'aws:kms':
+                local = etag_of(partial, self.chunk_size, threshold=size + 1)
+                if local != etag:
+                    raise IntegrityError(f"MD5 {local} 与对象 ETag {etag} 不一致")
+            os.replace(partial, local_path)
+            return {'bytes': size, 'etag': etag}
+
+        try:
+            return self._run('download', s3_path, attempt)
+        finally:
+            if os.path.exists(partial):
+                os.remove(partial)
+
+    def report(self):
+        rates = [r['mbps'] for r in self.records]
+        return {
+            **dict(self.counts),
+            'concurrency': self.concurrency,
+            'mean_mbps': round(sum(rates) / len(rates), 1) if rates else 0.0,
+            'recent': list(self.records)[-5:],
+        }
+
+
+def make_client(region_name='cn-northwest-1', max_pool_connections=32):
+    """关闭 botocore 自身重试的 S3 客户端：重试、退避和限流处理都由 S3Transfer 负责"""
+    from botocore.config import Config
+    return boto3.client('s3', region_name=region_name, config=Config(
+        retries={'mode': 'standard', 'max_attempts': 1}, max_pool_connections=max_pool_connections))
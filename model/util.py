@@ -1,16 +1,31 @@
+import importlib
 import os
 
 import numpy as np
-import pandas as pd
-import xarray as xr
 
-__all__ = ["save_like"]
+from lazy import lazy_module
+
+pd = lazy_module('pandas')
+xr = lazy_module('xarray')
+
+__all__ = ["save_like", "save_aggregate", "parquet_available"]
 
 pl_names = ['z', 't', 'u', 'v', 'r']
 sfc_names = ['t2m', 'u10', 'v10', 'msl', 'tp']
 levels = [50, 100, 150, 200, 250, 300, 400, 500, 600, 700, 850, 925, 1000]
 
 
+def parquet_available():
+    """是否安装了写 Parquet 需要的 pyarrow 或 fastparquet"""
+    for module in ('pyarrow', 'fastparquet'):
+        try:
+            importlib.import_module(module)
+            return True
+        except ImportError:
+            continue
+    return False
+
+
 def weighted_rmse(out, tgt):
     wlat = np.cos(np.deg2rad(tgt.lat))
     wlat /= wlat.mean()
@@ -32,23 +47,33 @@ def split_variable(ds, name):
     return v
 
 
-def save_like(output, input, step, save_dir="", freq=6, split=False):
+def save_like(output, input, step, save_dir="", freq=6, split=False, suffix="", members=False):
     if save_dir:
         os.makedirs(save_dir, exist_ok=True)
         step = (step+1) * freq
         init_time = pd.to_datetime(input.time.values[-1])
 
-        ds = xr.DataArray(
-            output[None],
-            dims=['time', 'step', 'level', 'lat', 'lon'],
-            coords=dict(
-                time=[init_time],
-                step=[step],
-                level=input.level,
-                lat=input.lat.values,
-                lon=input.lon.values,
-            )
-        ).astype(np.float32)
+        coords = dict(
+            time=[init_time],
+            step=[step],
+            level=input.level,
+            lat=input.lat.values,
+            lon=input.lon.values,
+        )
+        if members:
+            # 集合预报的全部成员，output 形状为 (member, level, lat, lon)
+            coords['member'] = np.arange(output.shape[0])
+            ds = xr.DataArray(
+                output[:, None, None],
+                dims=['member', 'time', 'step', 'level', 'lat', 'lon'],
+                coords=coords
+            ).astype(np.float32, copy=False)
+        else:
+            ds = xr.DataArray(
+                output[None],
+                dims=['time', 'step', 'level', 'lat', 'lon'],
+                coords=coords
+            ).astype(np.float32, copy=False)
 
         if split:
             def rename(name):
@@ -65,12 +90,35 @@ def save_like(output, input, step, save_dir="", freq=6, split=False):
                 new_ds.append(v)
             ds = xr.merge(new_ds, compat="no_conflicts")
 
-        save_name = os.path.join(save_dir, f'{step:03d}.nc')
+        save_name = os.path.join(save_dir, f'{step:03d}{suffix}.nc')
         # print(f'Save to {save_name} ...')
         ds.to_netcdf(save_name)
         return save_name
 
 
+def save_aggregate(output, input, names, day, product, save_dir=""):
+    """保存按预报日聚合的产品，output 形状为 (len(names), lat, lon)"""
+    if save_dir:
+        os.makedirs(save_dir, exist_ok=True)
+        init_time = pd.to_datetime(input.time.values[-1])
+
+        ds = xr.DataArray(
+            output[None, None],
+            dims=['time', 'day', 'level', 'lat', 'lon'],
+            coords=dict(
+                time=[init_time],
+                day=[day],
+                level=list(names),
+                lat=input.lat.values,
+                lon=input.lon.values,
+            )
+        ).astype(np.float32, copy=False)
+
+        save_name = os.path.join(save_dir, f'{product}_day{day:02d}.nc')
+        ds.to_netcdf(save_name)
+        return save_name
+
+
 def visualize(save_name, vars=[], titles=[], vmin=None, vmax=None):
     import cartopy.crs as ccrs
     import matplotlib.pyplot as plt
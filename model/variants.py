@@ -0,0 +1,192 @@
+"""
+低精度（FP16/INT8）模型变体的命名、精度校验与选择
+
+变体文件与原始模型放在同一目录下：
+  short.onnx + short                 FP32 原始模型及外部权重
+  short_fp16.onnx + short_fp16       FP16 变体（输入输出保持 float32）
+  short_int8.onnx + short_int8       动态量化 INT8 变体
+
+scripts/convert_precision.py 生成变体时对每个阶段做一次短时效滚动预报，与 FP32
+逐步比较 weighted_rmse，结果写入 variants.json。model_fn 只会选用
+各阶段都校验通过且误差在容差内的变体，否则回退到 FP32。
+"""
+import json
+import os
+
+import numpy as np
+
+from lazy import lazy_module
+from util import weighted_rmse
+
+xr = lazy_module('xarray')
+
+__all__ = ["VARIANTS", "variant_model_name", "variant_files", "check_variant_accuracy",
+           "check_stages_accuracy", "load_manifest", "save_manifest", "select_variant"]
+
+VARIANTS = ['fp32', 'fp16', 'int8']
+MANIFEST_NAME = 'variants.json'
+
+
+def variant_model_name(model_dir, stage, variant='fp32'):
+    if variant == 'fp32':
+        return os.path.join(model_dir, f'{stage}.onnx')
+    return os.path.join(model_dir, f'{stage}_{variant}.onnx')
+
+
+def variant_files(stages, variant='fp32'):
+    """某个变体需要的文件列表：每个阶段的 .onnx 图和同名的外部权重文件"""
+    files = []
+    for stage in stages:
+        name = stage if variant == 'fp32' else f'{stage}_{variant}'
+        files += [name, f'{name}.onnx']
+    return files
+
+
+def rollout(session, input, tembs, num_step, start=0):
+    outputs = []
+    for step in range(start, start + num_step):
+        input, = session.run(None, {'input': input, 'temb': tembs[step]})
+        outputs.append(input[:, -1])
+    return outputs
+
+
+def check_variant_accuracy(ref_session, session, data, input, tembs, num_step=4, tolerance=0.05, start=0):
+    """
+    比较变体与 FP32 的短时效滚动预报
+
+    每一步按通道计算纬度加权的 weighted_rmse，并用 FP32 输出的空间标准差归一化，
+    以便不同量纲的变量（位势、温度、降水等）使用同一个容差。
+
+    Args:
+        ref_session: FP32 会话
+        session: 待校验的变体会话
+        data: 初始场 xarray.DataArray，提供 lat/lon/level 坐标
+        input, tembs: 由 prepare_forecast 得到的初始状态和时间编码
+        num_step: 滚动预报步数
+        tolerance: 允许的最大归一化RMSE
+        start: 时间编码的起始步，校验 medium/long 时为该阶段在级联中的起点
+
+    Returns:
+        dict: 每步的最大归一化RMSE、出现最大误差的通道以及是否通过
+    """
+    ref_outputs = rollout(ref_session, input, tembs, num_step, start=start)
+    outputs = rollout(session, input, tembs, num_step, start=start)
+
+    coords = dict(level=data.level.values, lat=data.lat.values, lon=data.lon.values)
+    per_step = []
+    worst_level = None
+    max_nrmse = 0.0
+    for step, (out, ref) in enumerate(zip(outputs, ref_outputs)):
+        out = xr.DataArray(out[0], dims=['level', 'lat', 'lon'], coords=coords)
+        ref = xr.DataArray(ref[0], dims=['level', 'lat', 'lon'], coords=coords)
+        rmse = weighted_rmse(out, ref).values
+        scale = ref.std(('lat', 'lon')).values
+        nrmse = rmse / np.maximum(scale, 1e-12)
+        i = int(np.nanargmax(nrmse))
+        per_step.append(round(float(nrmse[i]), 6))
+        if worst_level is None or nrmse[i] > max_nrmse:
+            max_nrmse = float(nrmse[i])
+            worst_level = str(coords['level'][i])
+        print(f'step: {step+1:02d}, max nrmse: {nrmse[i]:.6f} ({coords["level"][i]})')
+
+    return {
+        'num_step': num_step,
+        'tolerance': tolerance,
+        'max_nrmse': round(max_nrmse, 6),
+        'worst_level': worst_level,
+        'per_step': per_step,
+        'accepted': bool(max_nrmse <= tolerance),
+    }
+
+
+def check_stages_accuracy(model_dir, variant, stages, num_steps, load_fn, data, input, tembs, num_step=4,
+                          tolerance=0.05):
+    """
+    逐个阶段比较变体与 FP32（check_variant_accuracy）
+
+    每个阶段从同一初始状态出发，按该阶段在级联中的时间编码滚动 num_step 步（不超过该阶段的步数）；
+    两个会话用完即释放，同一时刻只有一个阶段的 FP32 和变体在内存中。
+
+    Args:
+        stages, num_steps: 阶段名称和各阶段的步数，用于确定时间编码的起点
+        load_fn: 按模型文件路径加载会话的函数
+
+    Returns:
+        dict: 各阶段中最大的归一化RMSE及其阶段和通道、各阶段的报告（stages），
+            任一阶段超出容差即不通过
+    """
+    reports = {}
+    start = 0
+    for stage, stage_steps in zip(stages, num_steps):
+        print(f'--- {stage} ({variant} vs fp32)')
+        reports[stage] = check_variant_accuracy(
+            load_fn(variant_model_name(model_dir, stage, 'fp32')),
+            load_fn(variant_model_name(model_dir, stage, variant)),
+            data, input, tembs, num_step=min(num_step, stage_steps), tolerance=tolerance, start=start)
+        start += stage_steps
+
+    worst = max(reports, key=lambda stage: reports[stage]['max_nrmse'])
+    return {
+        'num_step': num_step,
+        'tolerance': tolerance,
+        'max_nrmse': reports[worst]['max_nrmse'],
+        'worst_stage': worst,
+        'worst_level': reports[worst]['worst_level'],
+        'per_step': reports[worst]['per_step'],
+        'accepted': all(report['accepted'] for report in reports.values()),
+        'stages': reports,
+    }
+
+
+def load_manifest(model_dir):
+    path = os.path.join(model_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(model_dir, manifest):
+    path = os.path.join(model_dir, MANIFEST_NAME)
+    with open(path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return path
+
+
+def select_variant(model_dir, requested, tolerance, check_fn=None, stages=None):
+    """
+    根据校验结果决定实际使用的模型变体
+
+    Args:
+        model_dir: 模型目录
+        requested: 请求的变体名称
+        tolerance: 允许的最大归一化RMSE
+        check_fn: 可选，现场执行精度校验的函数，返回 check_stages_accuracy 的结果
+        stages: 可选，必须都有校验结果的阶段；只校验了部分阶段的记录不被接受
+
+    Returns:
+        实际使用的变体名称，未通过校验时回退为 fp32
+    """
+    if requested == 'fp32':
+        return 'fp32'
+    if requested not in VARIANTS:
+        print(f"未知的模型变体 {requested}，使用 fp32")
+        return 'fp32'
+
+    report = load_manifest(model_dir).get(requested)
+    if check_fn is not None:
+        report = check_fn(requested)
+
+    if report is None:
+        print(f"模型变体 {requested} 没有精度校验记录，拒绝使用，回退到 fp32")
+        return 'fp32'
+    missing = [stage for stage in stages or [] if stage not in report.get('stages', {})]
+    if missing:
+        print(f"模型变体 {requested} 的阶段 {missing} 没有精度校验记录，拒绝使用，回退到 fp32")
+        return 'fp32'
+    if not report.get('accepted') or report.get('max_nrmse', float('inf')) > tolerance:
+        print(f"模型变体 {requested} 精度不达标 (max nrmse {report.get('max_nrmse')} > {tolerance})，回退到 fp32")
+        return 'fp32'
+
+    print(f"使用模型变体 {requested} (max nrmse {report['max_nrmse']})")
+    return requested
@@ -0,0 +1,51 @@
+"""
+model_fn 阶段的模型预热
+
+每个阶段的第一次 session.run 需要选择CUDA内核、cuDNN自动调优并扩展显存池，
+这部分开销如果落在第一个请求里，首个请求会明显慢于稳态。预热按模型元数据
+中的输入形状构造全零的 input/temb，在启动时执行若干步并记录耗时。
+"""
+import time
+
+import numpy as np
+
+__all__ = ["dummy_feeds", "warmup_session"]
+
+_DTYPES = {
+    'tensor(float)': np.float32,
+    'tensor(float16)': np.float16,
+    'tensor(double)': np.float64,
+    'tensor(int64)': np.int64,
+    'tensor(int32)': np.int32,
+}
+
+
+def dummy_feeds(session, batch=1):
+    """按会话的输入元数据构造全零输入，动态维度取 batch（第0维）或1"""
+    feeds = {}
+    for meta in session.get_inputs():
+        shape = [d if isinstance(d, int) and d > 0 else (batch if i == 0 else 1)
+                 for i, d in enumerate(meta.shape)]
+        feeds[meta.name] = np.zeros(shape, dtype=_DTYPES.get(meta.type, np.float32))
+    return feeds
+
+
+def warmup_session(session, steps=1):
+    """
+    用全零输入执行 steps 次推理
+
+    Returns:
+        dict: 输入形状、第一次和之后各次推理的耗时
+    """
+    feeds = dummy_feeds(session)
+    timings = []
+    for _ in range(steps):
+        start = time.perf_counter()
+        session.run(None, feeds)
+        timings.append(time.perf_counter() - start)
+    return {
+        'input_shapes': {name: list(value.shape) for name, value in feeds.items()},
+        'first_run_sec': round(timings[0], 4),
+        'steady_run_sec': round(sum(timings[1:]) / (len(timings) - 1), 4) if len(timings) > 1 else None,
+        'steps': steps,
+    }
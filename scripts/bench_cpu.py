@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+FuXi Weather Model - CPU 推理吞吐基准
+
+按线程数和 arena 上限扫描 CPU 会话的单步耗时、每小时步数和进程峰值内存，
+评估无GPU实例作为批量任务溢出层的容量。每个配置在新的Python进程中测量
+（ORT 环境中的 arena 只能注册一次，峰值内存也按进程统计），会话选项与
+推理时相同（cpu.configure_options）。
+
+没有真实模型时用 --synthetic 生成一个结构类似的模型：
+(1, 2, C, H, W) 的状态经 4x4 分块嵌入、若干 MLP 块后还原为下一时刻的场（model/synthetic.py）。
+
+示例:
+    python bench_cpu.py --model ../fuxi_models/short.onnx --threads 1,4,8,all --steps 5
+    python bench_cpu.py --synthetic --channels 70 --lat 181 --lon 360 --threads 1,all --arena-mb 0,512
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'model')
+
+# 在子进程中执行：加载会话、预热一步后计时 steps 步自回归推理
+CHILD = """
+import json, sys, time
+sys.path.insert(0, {model_dir!r})
+import numpy as np
+import onnxruntime as ort
+from cpu import configure_options, peak_rss
+
+options = configure_options(ort.SessionOptions(), threads={threads}, arena_bytes={arena_bytes})
+options.enable_mem_pattern = False
+start = time.perf_counter()
+session = ort.InferenceSession({model!r}, sess_options=options, providers=['CPUExecutionProvider'])
+load_sec = time.perf_counter() - start
+shape = [d if isinstance(d, int) else 1 for d in session.get_inputs()[0].shape]
+temb_shape = [d if isinstance(d, int) else 1 for d in session.get_inputs()[1].shape]
+state = np.zeros(shape, dtype=np.float32)
+temb = np.zeros(temb_shape, dtype=np.float32)
+state, = session.run(None, {{'input': state, 'temb': temb}})
+start = time.perf_counter()
+for _ in range({steps}):
+    state, = session.run(None, {{'input': state, 'temb': temb}})
+run_sec = time.perf_counter() - start
+print(json.dumps({{'threads': options.intra_op_num_threads, 'load_sec': load_sec,
+                  'sec_per_step': run_sec / {steps}, 'peak_rss_mb': peak_rss() / 2**20}}))
+"""
+
+
+def measure(model, threads, arena_mb, steps):
+    script = CHILD.format(model_dir=MODEL_DIR, model=model, threads=threads or None,
+                          arena_bytes=arena_mb * 2**20 or None, steps=steps)
+    result = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True)
+    if result.returncode != 0:
+        error = result.stderr.strip().splitlines()[-1] if result.stderr.strip() else 'unknown error'
+        return None, error
+    return json.loads(result.stdout.strip().splitlines()[-1]), None
+
+
+def parse_threads(spec):
+    """'1,4,all' -> [1, 4, 0]，0 表示全部可用核"""
+    return [0 if t.strip() == 'all' else int(t) for t in spec.split(',')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='CPU 推理吞吐基准')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--model', help='ONNX 模型文件（外部权重放在同一目录）')
+    source.add_argument('--synthetic', action='store_true', help='生成合成模型')
+    parser.add_argument('--channels', type=int, default=70, help='合成模型的通道数')
+    parser.add_argument('--lat', type=int, default=181, help='合成模型的纬向格点数')
+    parser.add_argument('--lon', type=int, default=360, help='合成模型的经向格点数')
+    parser.add_argument('--dim', type=int, default=192, help='合成模型的嵌入维度')
+    parser.add_argument('--depth', type=int, default=4, help='合成模型的 MLP 块数')
+    parser.add_argument('--threads', default='1,all', help='算子内线程数，逗号分隔，all 表示全部可用核')
+    parser.add_argument('--arena-mb', default='0', help='arena 上限（MB），逗号分隔，0 表示不使用 arena')
+    parser.add_argument('--steps', type=int, default=5, help='每个配置计时的推理步数')
+    args = parser.parse_args()
+
+    sys.path.insert(0, MODEL_DIR)
+    from cpu import available_cores
+    from synthetic import synthetic_model
+
+    with tempfile.TemporaryDirectory() as tmp:
+        model = args.model
+        if args.synthetic:
+            model = synthetic_model(os.path.join(tmp, 'synthetic.onnx'), args.channels, args.lat, args.lon,
+                                    args.dim, args.depth)
+        size = sum(os.path.getsize(os.path.join(os.path.dirname(os.path.abspath(model)), f))
+                   for f in {os.path.basename(model), os.path.splitext(os.path.basename(model))[0]}
+                   if os.path.exists(os.path.join(os.path.dirname(os.path.abspath(model)), f)))
+
+        print(f"🚀 CPU 推理基准: {model} ({size / 2**20:.1f} MB)，可用核 {available_cores()}，"
+              f"每个配置 {args.steps} 步")
+        print("=" * 72)
+        print(f"  {'threads':>7} {'arena MB':>9} {'load sec':>9} {'sec/step':>9} {'steps/h':>9} "
+              f"{'peak RSS MB':>12}")
+        for threads in parse_threads(args.threads):
+            for arena_mb in [int(a) for a in args.arena_mb.split(',')]:
+                stats, error = measure(model, threads, arena_mb, args.steps)
+                if stats is None:
+                    print(f"⚠️  threads {threads or 'all'}, arena {arena_mb} MB: 无法测量 ({error})")
+                    continue
+                print(f"  {stats['threads']:>7} {arena_mb or '-':>9} {stats['load_sec']:>9.2f} "
+                      f"{stats['sec_per_step']:>9.3f} {3600 / stats['sec_per_step']:>9.0f} "
+                      f"{stats['peak_rss_mb']:>12.0f}")
+    print()
+    print("完整预报为 74 步（short/medium/long 各 20/20/34 步），单条预报的推理时间约为 74 × sec/step，"
+          "加上每个阶段的一次加载")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
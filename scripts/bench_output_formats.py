@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+FuXi Weather Model - 单步输出格式基准
+
+比较每个时效写出 NetCDF（save_like）和 GRIB2（save_grib，CCSDS/simple 打包）
+的编码耗时和文件大小。默认使用平滑的合成场（随机噪声无法压缩，不能代表真实数据），
+也可以用 --sample 指定真实的输入文件，以其中的初始场作为输出。
+
+示例:
+    python bench_output_formats.py --steps 4
+    python bench_output_formats.py --sample 20231012-06_input_netcdf.nc
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'model'))
+
+import grib  # noqa: E402
+from util import levels, pl_names, save_like, sfc_names  # noqa: E402
+
+
+def synthetic(lat, lon):
+    """与 FuXi 通道一致的平滑合成场，数值范围接近真实变量"""
+    import pandas as pd
+    import xarray as xr
+    names = [f'{v}{l}' for v in pl_names for l in levels] + sfc_names
+    scale = {'z': (1e5, 5e4), 't': (250, 30), 'u': (0, 20), 'v': (0, 20), 'r': (50, 40),
+             't2m': (280, 30), 'u10': (0, 10), 'v10': (0, 10), 'msl': (101000, 2000), 'tp': (1, 1)}
+    lats = np.linspace(90, -90, lat)
+    lons = np.linspace(0, 360, lon, endpoint=False)
+    y, x = np.meshgrid(np.deg2rad(lats), np.deg2rad(lons), indexing='ij')
+    rng = np.random.default_rng(0)
+    fields = []
+    for i, name in enumerate(names):
+        var = name if name in sfc_names else name.rstrip('0123456789')
+        mean, amp = scale[var]
+        field = mean + amp * (np.cos(y) * np.sin(2 * x + i) + 0.3 * np.sin(5 * y + 3 * x))
+        field += amp * 0.01 * rng.standard_normal(field.shape)
+        fields.append(np.maximum(field, 0) if var in ('tp', 'r') else field)
+    output = np.stack(fields)[None].astype(np.float32)
+    data = xr.Dataset(coords=dict(time=[pd.Timestamp('2023-10-12 06:00')], level=names, lat=lats, lon=lons))
+    return output, data
+
+
+def from_sample(path):
+    import xarray as xr
+    data = xr.open_dataarray(path)
+    return data.values[-1:].astype(np.float32), data
+
+
+def bench(save_fn, output, data, steps, save_dir):
+    sizes = []
+    start = time.perf_counter()
+    for step in range(steps):
+        save_name = save_fn(output, data, step, save_dir=save_dir)
+        sizes.append(os.path.getsize(save_name))
+    return (time.perf_counter() - start) / steps, sum(sizes) / steps
+
+
+def main():
+    parser = argparse.ArgumentParser(description='单步输出格式基准')
+    parser.add_argument('--steps', type=int, default=4, help='写出的时效数')
+    parser.add_argument('--lat', type=int, default=721)
+    parser.add_argument('--lon', type=int, default=1440)
+    parser.add_argument('--sample', help='可选，真实的输入文件')
+    args = parser.parse_args()
+
+    output, data = from_sample(args.sample) if args.sample else synthetic(args.lat, args.lon)
+    print(f"🚀 输出格式基准：{args.steps} 个时效，每个 {output.nbytes / 2**20:.1f} MB（float32）")
+    print("=" * 40)
+
+    cases = [('netcdf', save_like, None), ('grib2 ccsds', grib.save_grib, 'grid_ccsds'),
+             ('grib2 simple', grib.save_grib, 'grid_simple')]
+    save_dir = tempfile.mkdtemp(prefix='fuxi-bench-')
+    baseline = None
+    try:
+        for name, save_fn, packing in cases:
+            if packing is not None:
+                grib.PACKING = packing
+                grib._templates.clear()
+                save_fn(output, data, 0, save_dir=save_dir)  # 生成模板
+            try:
+                seconds, size = bench(save_fn, output, data, args.steps, save_dir)
+            except Exception as e:
+                print(f"⚠️  {name}: 无法测量 ({e})")
+                continue
+            baseline = baseline or (seconds, size)
+            print(f"  {name:<14} {seconds:7.3f} sec/step  {size / 2**20:8.2f} MB/step  "
+                  f"(size {size / baseline[1]:.2f}x, time {seconds / baseline[0]:.2f}x)")
+    finally:
+        shutil.rmtree(save_dir, ignore_errors=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+FuXi Weather Model - NetCDF 序列化吞吐基准
+
+用随机生成的时效输出比较：
+  - thread: 单个写线程在 netcdf_lock 下逐个编码（FUXI_SERIALIZER_WORKERS=0）
+  - process N: ProcessSerializer 使用 N 个编码进程
+
+示例:
+    python bench_serializer.py --steps 16 --workers 1 2 4 8
+    python bench_serializer.py --lat 721 --lon 1440   # 0.25° 全球网格
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'model'))
+
+from serializer import ProcessSerializer, coords_template  # noqa: E402
+from util import save_like  # noqa: E402
+
+
+def make_template(channels, lat, lon):
+    """只有坐标的输入场，save_like 只用到 time/level/lat/lon"""
+    import pandas as pd
+    import xarray as xr
+    return xr.Dataset(coords=dict(
+        time=[pd.Timestamp('2023-10-12 06:00')],
+        level=[f'c{i}' for i in range(channels)],
+        lat=np.linspace(90, -90, lat),
+        lon=np.linspace(0, 360, lon, endpoint=False),
+    ))
+
+
+def bench_thread(outputs, data, save_dir):
+    start = time.perf_counter()
+    for step, output in enumerate(outputs):
+        save_like(output, data, step, save_dir=save_dir)
+    return time.perf_counter() - start
+
+
+def bench_process(outputs, data, save_dir, workers):
+    serializer = ProcessSerializer(workers)
+    serializer.warm()
+    template = coords_template(data)
+    try:
+        start = time.perf_counter()
+        futures = [serializer.submit(output, template, step, save_dir) for step, output in enumerate(outputs)]
+        for future in futures:
+            future.result()
+        return time.perf_counter() - start
+    finally:
+        serializer.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='NetCDF 序列化吞吐基准')
+    parser.add_argument('--steps', type=int, default=16, help='编码的时效数')
+    parser.add_argument('--channels', type=int, default=70)
+    parser.add_argument('--lat', type=int, default=181)
+    parser.add_argument('--lon', type=int, default=360)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4], help='编码进程数')
+    args = parser.parse_args()
+
+    data = make_template(args.channels, args.lat, args.lon)
+    rng = np.random.default_rng(0)
+    outputs = [rng.standard_normal((1, args.channels, args.lat, args.lon), dtype=np.float32)
+               for _ in range(min(args.steps, 4))]
+    outputs = [outputs[i % len(outputs)] for i in range(args.steps)]
+    step_mb = outputs[0].nbytes / 2**20
+
+    print(f"🚀 NetCDF 序列化基准：{args.steps} 个时效，每个 {step_mb:.1f} MB，{os.cpu_count()} vCPU")
+    print("=" * 40)
+    save_dir = tempfile.mkdtemp(prefix='fuxi-bench-')
+    try:
+        elapsed = bench_thread(outputs, data, save_dir)
+        baseline = elapsed
+        print(f"  {'thread':<12} {elapsed:8.2f} sec  {args.steps / elapsed:6.2f} steps/s")
+        for workers in args.workers:
+            elapsed = bench_process(outputs, data, save_dir, workers)
+            print(f"  {f'process {workers}':<12} {elapsed:8.2f} sec  {args.steps / elapsed:6.2f} steps/s  "
+                  f"({baseline / elapsed:.1f}x)")
+    finally:
+        shutil.rmtree(save_dir, ignore_errors=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
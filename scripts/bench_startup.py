@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+FuXi Weather Model - 推理入口启动时间基准
+
+每次在新的Python进程中测量，比较：
+  - eager: 旧版入口在模块加载时导入的全部重量级模块（torch/xarray/pandas/onnxruntime/boto3）
+  - lazy:  当前 inference.py 的导入时间（重量级模块延迟导入）
+  - lazy + first request modules: 导入 inference 后再加载处理请求需要的模块
+  - print_environment: 旧版 model_fn 每次启动都会执行的环境变量诊断输出
+
+示例:
+    python bench_startup.py --repeat 5
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'model')
+
+# (准备代码, 计时代码)
+CASES = {
+    'eager': ("", "import torch, numpy, xarray, pandas, onnxruntime, boto3"),
+    'eager (without torch)': ("", "import numpy, xarray, pandas, onnxruntime, boto3"),
+    'lazy': ("", "import inference"),
+    'lazy + first request modules': ("", "import inference; inference.xr.DataArray; inference.pd.Timestamp; "
+                                         "inference.ort.SessionOptions"),
+    'print_environment': ("import inference, contextlib, io",
+                          "with contextlib.redirect_stdout(io.StringIO()): inference.print_environment()"),
+}
+
+TIMER = """
+import sys, time
+sys.path.insert(0, {model_dir!r})
+{setup}
+start = time.perf_counter()
+{code}
+print(time.perf_counter() - start)
+"""
+
+
+def measure(setup, code, repeat):
+    timings = []
+    for _ in range(repeat):
+        script = TIMER.format(model_dir=MODEL_DIR, setup=setup, code=code)
+        result = subprocess.run([sys.executable, '-c', script],
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            error = result.stderr.strip().splitlines()[-1] if result.stderr.strip() else 'unknown error'
+            return None, error
+        timings.append(float(result.stdout.strip().splitlines()[-1]))
+    return timings, None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='推理入口启动时间基准')
+    parser.add_argument('--repeat', '-n', type=int, default=5, help='每项测量的次数')
+    args = parser.parse_args()
+
+    print(f"🚀 启动时间基准（每项 {args.repeat} 次，取中位数）")
+    print("=" * 40)
+    results = {}
+    for name, (setup, code) in CASES.items():
+        timings, error = measure(setup, code, args.repeat)
+        if timings is None:
+            print(f"⚠️  {name}: 无法测量 ({error})")
+            continue
+        results[name] = statistics.median(timings)
+        print(f"  {name:<32} {results[name]:8.3f} sec  (min {min(timings):.3f}, max {max(timings):.3f})")
+
+    baseline = results.get('eager', results.get('eager (without torch)'))
+    if baseline is not None and 'lazy' in results:
+        print()
+        print(f"✅ 导入阶段节省 {baseline - results['lazy']:.3f} sec "
+              f"({baseline / max(results['lazy'], 1e-9):.1f}x)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+FuXi Weather Model - 低精度模型变体转换脚本
+
+将 short/medium/long.onnx 转换为 FP16（以及可选的动态量化 INT8）版本，
+并用一个初始场样本对每个阶段与 FP32 做短时效滚动比较，结果写入 variants.json。
+model_fn 只会使用各阶段都校验通过的变体。
+
+依赖: onnx, onnxruntime, onnxconverter-common (FP16)
+
+示例:
+    python convert_precision.py --model-dir ../fuxi_models --sample 20231012-06_input_netcdf.nc --int8
+    aws s3 sync ../fuxi_models s3://YOUR_BUCKET_NAME/sagemaker/fuxi/
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import onnx
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'model'))
+
+STAGES = ['short', 'medium', 'long']
+
+
+def save_with_external_data(model, model_dir, name):
+    """保存为 {name}.onnx + 外部权重文件 {name}，与原始模型布局一致"""
+    model_path = os.path.join(model_dir, f'{name}.onnx')
+    weight_path = os.path.join(model_dir, name)
+    if os.path.exists(weight_path):
+        os.remove(weight_path)
+    onnx.save_model(model, model_path, save_as_external_data=True,
+                    all_tensors_to_one_file=True, location=name)
+    return model_path
+
+
+def model_size(model_dir, name):
+    """模型图与外部权重文件的总大小"""
+    paths = [os.path.join(model_dir, f'{name}.onnx'), os.path.join(model_dir, name)]
+    return sum(os.path.getsize(p) for p in paths if os.path.exists(p))
+
+
+def convert_fp16(model_dir, stage):
+    from onnxconverter_common import float16
+
+    print(f"🔄 转换 {stage} -> FP16")
+    model = onnx.load(os.path.join(model_dir, f'{stage}.onnx'))
+    # 保持输入输出为 float32，推理代码无需改动
+    model = float16.convert_float_to_float16(model, keep_io_types=True, disable_shape_infer=True)
+    return save_with_external_data(model, model_dir, f'{stage}_fp16')
+
+
+def convert_int8(model_dir, stage):
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    print(f"🔄 转换 {stage} -> INT8 (动态量化)")
+    tmp_path = os.path.join(model_dir, f'{stage}_int8.tmp.onnx')
+    quantize_dynamic(os.path.join(model_dir, f'{stage}.onnx'), tmp_path,
+                     weight_type=QuantType.QInt8, use_external_data_format=True)
+    model = onnx.load(tmp_path)
+    path = save_with_external_data(model, model_dir, f'{stage}_int8')
+    for leftover in [tmp_path, tmp_path + '.data', os.path.join(model_dir, f'{stage}_int8.tmp.onnx.data')]:
+        if os.path.exists(leftover):
+            os.remove(leftover)
+    return path
+
+
+def check_accuracy(model_dir, variant, sample, num_step, tolerance):
+    import xarray as xr
+    from inference import load_model, num_steps, prepare_forecast, prepare_input
+    from variants import check_stages_accuracy
+
+    print(f"🔍 精度校验 {variant}: 各阶段 {num_step} 步滚动预报 vs FP32")
+    # 与推理时相同：维度顺序、纬度方向和类型规范化后再作为模型输入
+    data = prepare_input(xr.open_dataarray(sample))
+    input, tembs = prepare_forecast(data, num_steps)
+    return check_stages_accuracy(model_dir, variant, STAGES, num_steps, load_model,
+                                 data, input, tembs, num_step=num_step, tolerance=tolerance)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='FuXi 低精度模型变体转换')
+    parser.add_argument('--model-dir', '-m', default='../fuxi_models', help='模型目录')
+    parser.add_argument('--sample', '-s', help='用于精度校验的初始场NetCDF文件')
+    parser.add_argument('--int8', action='store_true', help='同时生成动态量化INT8变体')
+    parser.add_argument('--skip-fp16', action='store_true', help='不生成FP16变体')
+    parser.add_argument('--check-steps', type=int, default=4, help='精度校验的滚动步数')
+    parser.add_argument('--tolerance', type=float, default=0.05, help='允许的最大归一化RMSE')
+
+    args = parser.parse_args()
+
+    from variants import load_manifest, save_manifest
+
+    variants = ([] if args.skip_fp16 else ['fp16']) + (['int8'] if args.int8 else [])
+    converters = {'fp16': convert_fp16, 'int8': convert_int8}
+    manifest = load_manifest(args.model_dir)
+
+    for variant in variants:
+        for stage in STAGES:
+            start = time.perf_counter()
+            path = converters[variant](args.model_dir, stage)
+            src_size = model_size(args.model_dir, stage)
+            dst_size = model_size(args.model_dir, os.path.basename(path)[:-5])
+            print(f"✅ {path}: {src_size:,} -> {dst_size:,} bytes "
+                  f"({time.perf_counter() - start:.1f} sec)")
+
+        if args.sample:
+            report = check_accuracy(args.model_dir, variant, args.sample, args.check_steps, args.tolerance)
+            status = "✅ 通过" if report['accepted'] else "❌ 未通过，model_fn 将拒绝使用"
+            print(f"{status}: max nrmse {report['max_nrmse']} ({report['worst_stage']} {report['worst_level']}), "
+                  f"容差 {args.tolerance}")
+            manifest[variant] = report
+        else:
+            print(f"⚠️  未提供 --sample，{variant} 没有精度校验记录，model_fn 将拒绝使用")
+            manifest.pop(variant, None)
+
+    path = save_manifest(args.model_dir, manifest)
+    print(f"📝 校验结果已写入: {path}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -170,11 +170,13 @@ def check_ecr_image(image_uri, region):
         return False
 
 def check_s3_model(model_data_url, region):
-    """检查S3模型文件是否存在"""
+    """检查S3模型文件是否存在；不压缩的模型数据（以 / 结尾的前缀）检查其中的 model_manifest.json"""
     s3 = boto3.client('s3', region_name=region)
     
     try:
         # 解析S3 URL
+        if model_data_url.endswith('/'):
+            model_data_url += 'model_manifest.json'
         parts = model_data_url.replace('s3://', '').split('/')
         bucket_name = parts[0]
         key = '/'.join(parts[1:])
@@ -187,7 +189,7 @@ def check_s3_model(model_data_url, region):
     except ClientError as e:
         if e.response['Error']['Code'] == '404':
             print(f"❌ S3模型文件不存在: {model_data_url}")
-            print("💡 请先运行: ./scripts/setup_models.sh")
+            print("💡 请先运行: ./scripts/setup_models.sh 或 python scripts/package_model.py")
         else:
             print(f"❌ 检查S3模型文件失败: {e}")
         return False
@@ -215,13 +217,25 @@ def create_sagemaker_model(model_name, execution_role_arn, image_uri, model_data
         'PYTHONUNBUFFERED': 'TRUE'
     }
     
+    container = {
+        'Image': image_uri,
+        'Environment': environment
+    }
+    if model_data_url.endswith('/'):
+        # 不压缩的模型数据：SageMaker 把前缀下的文件直接同步到 /opt/ml/model，不需要解压
+        container['ModelDataSource'] = {
+            'S3DataSource': {
+                'S3Uri': model_data_url,
+                'S3DataType': 'S3Prefix',
+                'CompressionType': 'None'
+            }
+        }
+    else:
+        container['ModelDataUrl'] = model_data_url
+    
     response = sagemaker.create_model(
         ModelName=model_name,
-        PrimaryContainer={
-            'Image': image_uri,
-            'ModelDataUrl': model_data_url,
-            'Environment': environment
-        },
+        PrimaryContainer=container,
         ExecutionRoleArn=execution_role_arn
     )
     
@@ -235,7 +249,8 @@ def create_lambda_function(function_name, role_arn, bucket_name, model_name, reg
     print(f"⚡ 创建Lambda函数: {function_name}")
     
     # 读取Lambda代码
-    lambda_file = os.path.join(os.path.dirname(__file__), '../lambda/function.py')
+    lambda_dir = os.path.join(os.path.dirname(__file__), '../lambda')
+    lambda_file = os.path.join(lambda_dir, 'function.py')
     if not os.path.exists(lambda_file):
         print(f"❌ Lambda代码文件不存在: {lambda_file}")
         return None
@@ -250,6 +265,10 @@ def create_lambda_function(function_name, role_arn, bucket_name, model_name, reg
     zip_buffer = io.BytesIO()
     with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
         zip_file.writestr('lambda_function.py', lambda_code)
+        # 辅助模块（本地测试替身 local_stub.py 不打包）
+        for name in sorted(os.listdir(lambda_dir)):
+            if name.endswith('.py') and name not in ('function.py', 'local_stub.py'):
+                zip_file.write(os.path.join(lambda_dir, name), name)
     
     zip_buffer.seek(0)
     zip_content = zip_buffer.read()
@@ -266,7 +285,9 @@ def create_lambda_function(function_name, role_arn, bucket_name, model_name, reg
         'MODEL_BUCKET': bucket_name,
         'SAGEMAKER_ROLE': role_arn.replace('Lambda', 'SageMaker'),
         'MODEL_NAME': model_name,
-        'INSTANCE_TYPE': 'ml.g4dn.2xlarge'
+        'INSTANCE_TYPE': 'ml.g4dn.2xlarge',
+        # 已提交的文件对记录在模型存储桶中，之后的触发只提交新的文件对
+        'STATE_STORE': f's3://{bucket_name}/sagemaker/fuxi/state/'
     }
     
     response = lambda_client.create_function(
@@ -280,6 +301,9 @@ def create_lambda_function(function_name, role_arn, bucket_name, model_name, reg
         Environment={'Variables': env_vars}
     )
     
+    # S3 状态记录没有原子的认领，同一时刻只运行一个实例，避免并发的触发重复提交同一文件对
+    lambda_client.put_function_concurrency(FunctionName=function_name, ReservedConcurrentExecutions=1)
+    
     print(f"✅ Lambda函数创建成功")
     return response['FunctionArn']
 
@@ -367,6 +391,8 @@ def main():
     parser.add_argument('--region', '-r', default='cn-northwest-1', help='AWS区域')
     parser.add_argument('--environment', '-e', default='prod', help='环境')
     parser.add_argument('--skip-checks', action='store_true', help='跳过预检查')
+    parser.add_argument('--uncompressed-model', action='store_true',
+                        help='使用 package_model.py --format directory 上传的不压缩模型数据（sagemaker/fuxi/model/）')
     
     args = parser.parse_args()
     
@@ -381,7 +407,10 @@ def main():
     
     # 镜像和模型URL
     image_uri = f'{account_id}.dkr.ecr.{region}.amazonaws.com.cn/fuxi-weather-inference:latest'
-    model_data_url = f's3://{bucket_name}/sagemaker/fuxi/model.tar.gz'
+    if args.uncompressed_model:
+        model_data_url = f's3://{bucket_name}/sagemaker/fuxi/model/'
+    else:
+        model_data_url = f's3://{bucket_name}/sagemaker/fuxi/model.tar.gz'
     
     print("🚀 FuXi Weather Model 部署开始")
     print("=" * 40)
@@ -390,6 +419,7 @@ def main():
     print(f"环境: {environment}")
     print(f"存储桶: {bucket_name}")
     print(f"镜像: {image_uri}")
+    print(f"模型数据: {model_data_url}")
     print()
     
     try:
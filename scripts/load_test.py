@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+FuXi Weather Model - 推理服务压测
+
+按 lambda_handler 生成的 JSONL 清单（每行一个起报时间的文件对）向推理服务的
+/invocations 并发发送请求，报告延迟分位数、吞吐、错误，以及服务端各工作进程的
+请求数、忙碌时间和内存（GET /metrics，由 scripts/serve_local.py 提供）。
+
+--records-per-request 大于1时按行拼接多条记录，与批量转换的 MultiRecord 请求相同。
+
+示例:
+    python serve_local.py --synthetic /tmp/fuxi-sim --workers 2 &
+    python load_test.py --manifest /tmp/fuxi-sim/manifest.jsonl --concurrency 4 --requests 16 \\
+        --extra '{"lead_hours": 24}'
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+
+def read_manifest(paths):
+    """读取 JSONL 清单，目录按 lambda_handler 的分片文件名（part-*.jsonl）读取"""
+    records = []
+    for path in paths:
+        files = sorted(glob.glob(os.path.join(path, '*.jsonl'))) if os.path.isdir(path) else [path]
+        for name in files:
+            with open(name) as f:
+                records += [json.loads(line) for line in f if line.strip()]
+    return records
+
+
+def percentile(values, q):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    k = (len(values) - 1) * q / 100
+    lo, hi = int(k), min(int(k) + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+def get_json(url, timeout=10):
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+def invoke(url, records, timeout):
+    """发送一个请求，返回 (状态码, 延迟, 服务端处理耗时, 响应)"""
+    multi = len(records) > 1
+    body = '\n'.join(json.dumps(r) for r in records) if multi else json.dumps(records[0])
+    request = urllib.request.Request(
+        f'{url}/invocations', data=body.encode('utf-8'), method='POST',
+        headers={'Content-Type': 'application/jsonlines' if multi else 'application/json'})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            status, data, headers = response.status, response.read().decode('utf-8'), response.headers
+    except urllib.error.HTTPError as e:
+        status, data, headers = e.code, e.read().decode('utf-8'), e.headers
+    except OSError as e:
+        return None, time.perf_counter() - start, None, str(e)
+    latency = time.perf_counter() - start
+    service = headers.get('X-Fuxi-Service-Sec')
+    return status, latency, float(service) if service else None, data
+
+
+def main():
+    parser = argparse.ArgumentParser(description='推理服务压测')
+    parser.add_argument('--url', default='http://127.0.0.1:8080', help='推理服务地址')
+    parser.add_argument('--manifest', action='append', required=True,
+                        help='JSONL 清单文件或包含 part-*.jsonl 的目录，可重复')
+    parser.add_argument('--requests', type=int, help='请求数，默认每条记录一次，超过记录数时循环使用')
+    parser.add_argument('--concurrency', type=int, default=1, help='同时在途的请求数')
+    parser.add_argument('--records-per-request', type=int, default=1, help='每个请求的记录数（MultiRecord）')
+    parser.add_argument('--extra', default='{}', help='合并到每条记录的请求参数（JSON），例如 {"lead_hours": 24}')
+    parser.add_argument('--timeout', type=float, default=3600, help='单个请求的超时（秒）')
+    parser.add_argument('--output', help='把完整报告写入 JSON 文件')
+    args = parser.parse_args()
+
+    extra = json.loads(args.extra)
+    records = [dict(r, **extra) for r in read_manifest(args.manifest)]
+    if not records:
+        parser.error('清单中没有记录')
+    per_request = max(1, args.records_per_request)
+    total = args.requests or -(-len(records) // per_request)
+    batches = [[records[(i * per_request + j) % len(records)] for j in range(per_request)] for i in range(total)]
+
+    try:
+        before = get_json(f'{args.url}/metrics')
+    except (OSError, ValueError):
+        before = None
+
+    print(f"🚀 {total} 个请求（每个 {per_request} 条记录），并发 {args.concurrency}: {args.url}")
+    results = []
+    lock = threading.Lock()
+    start = time.perf_counter()
+
+    def run(batch):
+        result = invoke(args.url, batch, args.timeout)
+        with lock:
+            results.append(result)
+            if result[0] != 200:
+                print(f"⚠️  请求失败 ({result[0]}): {result[3][:200]}")
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(run, batches))
+    elapsed = time.perf_counter() - start
+
+    ok = [r for r in results if r[0] == 200]
+    latencies = [r[1] for r in ok]
+    queued = [r[1] - r[2] for r in ok if r[2] is not None]
+    report = {
+        'requests': total, 'records_per_request': per_request, 'concurrency': args.concurrency,
+        'ok': len(ok), 'errors': total - len(ok), 'elapsed_sec': round(elapsed, 3),
+        'throughput_rps': round(len(ok) / elapsed, 4),
+        'records_per_hour': round(len(ok) * per_request * 3600 / elapsed, 1),
+        'latency_sec': {f'p{q}': round(percentile(latencies, q), 3) for q in (50, 90, 99)},
+        'queue_sec': {f'p{q}': round(percentile(queued, q), 3) for q in (50, 90, 99)},
+    }
+    report['latency_sec']['max'] = round(max(latencies), 3) if latencies else 0.0
+
+    print("=" * 60)
+    print(f"  成功 {report['ok']} / {total}，耗时 {elapsed:.2f} sec")
+    print(f"  吞吐 {report['throughput_rps']:.3f} req/s，{report['records_per_hour']:.0f} 条预报/小时")
+    print(f"  延迟 p50 {report['latency_sec']['p50']:.2f} / p90 {report['latency_sec']['p90']:.2f} / "
+          f"p99 {report['latency_sec']['p99']:.2f} / max {report['latency_sec']['max']:.2f} sec")
+    print(f"  排队 p50 {report['queue_sec']['p50']:.2f} / p99 {report['queue_sec']['p99']:.2f} sec")
+
+    try:
+        after = get_json(f'{args.url}/metrics')
+    except (OSError, ValueError):
+        after = None
+    if after is not None:
+        previous = {w['worker']: w for w in (before or {}).get('workers', [])}
+        report['workers'] = []
+        for worker in after['workers']:
+            prev = previous.get(worker['worker'], {})
+            requests = worker['requests'] - prev.get('requests', 0)
+            busy = worker['busy_sec'] - prev.get('busy_sec', 0.0)
+            report['workers'].append(dict(worker, requests=requests, busy_sec=round(busy, 3),
+                                          utilization=round(busy / elapsed, 3)))
+            print(f"  worker {worker['worker']}: {requests} 个请求，忙碌 {busy:.2f} sec "
+                  f"({busy / elapsed:.0%})，RSS {worker['rss_mb']:.0f} MB，峰值 {worker['peak_rss_mb']:.0f} MB")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 0 if report['errors'] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
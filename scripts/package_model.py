@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+FuXi Weather Model - 模型数据打包脚本
+
+把推理代码、ONNX 图和外部权重（以及可选的低精度变体和 variants.json）打包成
+SageMaker 的模型数据，并生成 model_manifest.json（每个文件的大小和 SHA-256）。
+SageMaker 在容器启动前把模型数据放到 /opt/ml/model，model_fn 按清单校验后直接加载，
+不再在每个工作进程启动时从 S3 拉取权重。
+
+两种布局:
+  --format tar        model.tar.gz（权重已经是压缩不了的浮点数，默认使用最低的压缩级别）
+  --format directory  不压缩的目录，上传到S3前缀后用 deploy.py --uncompressed-model 部署，
+                      SageMaker 直接同步文件，省去下载后解压数GB归档的时间
+
+示例:
+    python package_model.py --models-dir ../fuxi_models --output ../model.tar.gz \
+        --upload s3://YOUR_BUCKET_NAME/sagemaker/fuxi/model.tar.gz
+    python package_model.py --models-dir ../fuxi_models --format directory --output ../model_data \
+        --upload s3://YOUR_BUCKET_NAME/sagemaker/fuxi/model/
+"""
+
+import argparse
+import glob
+import os
+import shutil
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'model'))
+
+from manifest import MODEL_MANIFEST, build_manifest  # noqa: E402
+from variants import VARIANTS, variant_files  # noqa: E402
+
+STAGES = ['short', 'medium', 'long']
+
+
+def model_files(models_dir, variants):
+    """需要打包的模型文件：FP32 必须齐全，其他变体只打包存在的"""
+    files = variant_files(STAGES, 'fp32')
+    missing = [f for f in files if not os.path.isfile(os.path.join(models_dir, f))]
+    if missing:
+        raise FileNotFoundError(f"缺少 FP32 模型文件: {missing}")
+    for variant in variants:
+        names = variant_files(STAGES, variant)
+        if all(os.path.isfile(os.path.join(models_dir, f)) for f in names):
+            files += names
+        else:
+            print(f"⚠️  模型变体 {variant} 不完整，跳过")
+    if os.path.isfile(os.path.join(models_dir, 'variants.json')):
+        files.append('variants.json')
+    return files
+
+
+def write_tar(output, code_files, models_dir, files, manifest_dir, compresslevel):
+    with tarfile.open(output, 'w:gz', compresslevel=compresslevel) as tar:
+        for path in code_files:
+            tar.add(path, arcname=os.path.basename(path))
+        tar.add(os.path.join(manifest_dir, MODEL_MANIFEST), arcname=MODEL_MANIFEST)
+        for name in files:
+            print(f"📦 {name}")
+            tar.add(os.path.join(models_dir, name), arcname=name)
+
+
+def write_directory(output, code_files, models_dir, files, manifest_dir):
+    os.makedirs(output, exist_ok=True)
+    for path in code_files:
+        shutil.copy2(path, output)
+    shutil.copy2(os.path.join(manifest_dir, MODEL_MANIFEST), output)
+    for name in files:
+        target = os.path.join(output, name)
+        if os.path.exists(target):
+            os.remove(target)
+        # 同一文件系统上用硬链接，避免复制数GB的权重
+        try:
+            os.link(os.path.join(models_dir, name), target)
+        except OSError:
+            shutil.copy2(os.path.join(models_dir, name), target)
+        print(f"📦 {name}")
+
+
+def upload(output, s3_path, region):
+    if os.path.isdir(output):
+        command = ['aws', 's3', 'sync', output, s3_path.rstrip('/') + '/', '--region', region]
+    else:
+        command = ['aws', 's3', 'cp', output, s3_path, '--region', region]
+    print(f"📤 {' '.join(command)}")
+    subprocess.run(command, check=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='打包模型数据（代码 + 模型文件 + 清单）')
+    parser.add_argument('--models-dir', default='../fuxi_models', help='模型文件目录')
+    parser.add_argument('--code-dir', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'model'),
+                        help='推理代码目录')
+    parser.add_argument('--format', choices=['tar', 'directory'], default='tar', help='输出布局')
+    parser.add_argument('--output', default='model.tar.gz', help='输出的归档文件或目录')
+    parser.add_argument('--variants', nargs='*', default=[v for v in VARIANTS if v != 'fp32'],
+                        help='一并打包的低精度变体（存在时）')
+    parser.add_argument('--compresslevel', type=int, default=1, help='gzip 压缩级别')
+    parser.add_argument('--upload', help='可选，上传到的S3路径（tar）或前缀（directory）')
+    parser.add_argument('--region', default='cn-northwest-1', help='AWS区域')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    files = model_files(args.models_dir, args.variants)
+    code_files = sorted(glob.glob(os.path.join(args.code_dir, '*.py')))
+    size = sum(os.path.getsize(os.path.join(args.models_dir, f)) for f in files)
+    print(f"🚀 打包 {len(code_files)} 个代码文件和 {len(files)} 个模型文件（{size / 2**30:.2f} GB）")
+
+    manifest_dir = tempfile.mkdtemp(prefix='fuxi-manifest-')
+    try:
+        build_manifest(args.models_dir, files, save_dir=manifest_dir)
+        print(f"✅ {MODEL_MANIFEST}: {time.perf_counter() - start:.1f} sec")
+        if args.format == 'tar':
+            write_tar(args.output, code_files, args.models_dir, files, manifest_dir, args.compresslevel)
+        else:
+            write_directory(args.output, code_files, args.models_dir, files, manifest_dir)
+    finally:
+        shutil.rmtree(manifest_dir, ignore_errors=True)
+    print(f"✅ 模型数据: {args.output}（{time.perf_counter() - start:.1f} sec）")
+
+    if args.upload:
+        upload(args.output, args.upload, args.region)
+        print(f"✅ 上传完成: {args.upload}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+FuXi Weather Model - 本地推理服务模拟
+
+在本机模拟 SageMaker 推理容器：HTTP 前端提供 /ping 和 /invocations，
+请求分发给 --workers 个工作进程，每个进程与容器中的模型服务器工作进程一样
+执行一次 model_fn，之后对每个请求依次调用 input_fn → predict_fn → output_fn。
+GET /metrics 返回各工作进程的请求数、忙碌时间、当前和峰值内存，供
+scripts/load_test.py 汇总。
+
+--synthetic 在工作目录中生成合成模型、本地S3目录（FUXI_S3_LOCAL_ROOT）中的
+合成初始场，以及与 lambda_handler 相同格式的 JSONL 清单（manifest.jsonl），
+不需要模型权重、GPU 或 AWS 环境。各工作进程的输出写入工作目录中的 worker-N.log。
+
+示例:
+    python serve_local.py --synthetic /tmp/fuxi-sim --workers 2 --init-times 8
+    python serve_local.py --model-dir ../fuxi_models --s3-root /data/s3 --workers 1 \\
+        --env FUXI_DEVICE_TYPE=cpu --env FUXI_CPU_MEMORY_MB=auto
+"""
+
+import argparse
+import contextlib
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'model')
+BUCKET = 'fuxi-local'
+
+
+def prepare_synthetic(work_dir, init_times, lat, lon, dim, depth):
+    """生成合成模型、本地S3中的初始场和 JSONL 清单，返回 (model_dir, s3_root, manifest)"""
+    sys.path.insert(0, MODEL_DIR)
+    import shutil
+    from datetime import datetime, timedelta
+    from synthetic import synthetic_input, synthetic_models
+
+    model_dir = os.path.join(work_dir, 'model')
+    s3_root = os.path.join(work_dir, 's3')
+    if not os.path.exists(os.path.join(model_dir, 'model_manifest.json')):
+        print(f"生成合成模型: {model_dir}")
+        synthetic_models(model_dir, lat=lat, lon=lon, dim=dim, depth=depth)
+
+    incoming = os.path.join(s3_root, BUCKET, 'incoming')
+    os.makedirs(incoming, exist_ok=True)
+    pairs = []
+    start = datetime(2023, 10, 1)
+    for i in range(init_times):
+        stem = (start + timedelta(hours=6 * i)).strftime('%Y%m%d-%H')
+        netcdf = os.path.join(incoming, f'{stem}_input_netcdf.nc')
+        if not os.path.exists(netcdf):
+            synthetic_input(netcdf, start + timedelta(hours=6 * i), lat=lat, lon=lon, seed=i)
+            shutil.copyfile(netcdf, os.path.join(incoming, f'{stem}_input_grib.nc'))
+        pairs.append({'filename1': f's3://{BUCKET}/incoming/{stem}_input_netcdf.nc',
+                      'filename2': f's3://{BUCKET}/incoming/{stem}_input_grib.nc', 'init_time': stem})
+
+    manifest = os.path.join(work_dir, 'manifest.jsonl')
+    with open(manifest, 'w') as f:
+        f.write('\n'.join(json.dumps(pair) for pair in pairs))
+    print(f"生成 {len(pairs)} 个起报时间的初始场: s3://{BUCKET}/incoming/，清单: {manifest}")
+    return model_dir, s3_root, manifest
+
+
+def _rss():
+    """(当前, 峰值) 常驻内存（MB）"""
+    import resource
+    current = 0
+    with contextlib.suppress(OSError):
+        with open('/proc/self/statm') as f:
+            current = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return round(current / 2**20, 1), round(peak / 2**20, 1)
+
+
+def worker_main(index, model_dir, env, log_path, requests, results):
+    """工作进程：执行 model_fn 后逐个处理请求，结果和进程统计放入 results"""
+    os.environ.update(env)
+    log = open(log_path, 'a', buffering=1)
+    sys.stdout = sys.stderr = log
+    sys.path.insert(0, MODEL_DIR)
+    stats = {'worker': index, 'pid': os.getpid(), 'requests': 0, 'errors': 0, 'busy_sec': 0.0}
+    try:
+        start = time.perf_counter()
+        import inference
+        model = inference.model_fn(model_dir)
+        stats['model_fn_sec'] = round(time.perf_counter() - start, 3)
+    except Exception:
+        traceback.print_exc()
+        results.put(('failed', index, None, None, stats))
+        return
+    stats['rss_mb'], stats['peak_rss_mb'] = _rss()
+    results.put(('ready', index, None, None, dict(stats)))
+
+    while True:
+        item = requests.get()
+        if item is None:
+            break
+        request_id, body, content_type = item
+        start = time.perf_counter()
+        try:
+            response = inference.output_fn(
+                inference.predict_fn(inference.input_fn(body, content_type), model), 'application/json')
+            status = 200
+        except Exception as e:
+            traceback.print_exc()
+            response = json.dumps({'error': f'{type(e).__name__}: {e}'})
+            status = 500
+            stats['errors'] += 1
+        seconds = time.perf_counter() - start
+        stats['requests'] += 1
+        stats['busy_sec'] = round(stats['busy_sec'] + seconds, 3)
+        stats['rss_mb'], stats['peak_rss_mb'] = _rss()
+        results.put(('done', index, request_id, (status, response, seconds), dict(stats)))
+
+
+class LocalServer:
+    """
+    HTTP 前端和工作进程池
+
+    所有工作进程共享一个请求队列，与模型服务器把请求交给空闲工作进程的行为一致；
+    HTTP 线程按请求号等待结果。
+    """
+
+    def __init__(self, model_dir, workers=1, env=None, log_dir='.'):
+        context = multiprocessing.get_context('spawn')
+        self.requests = context.Queue()
+        self.results = context.Queue()
+        self.stats = {}
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.ids = itertools.count()
+        self.processes = []
+        for index in range(workers):
+            # 输入缓存不支持多进程共享目录，每个工作进程使用自己的缓存目录
+            worker_env = dict(env or {})
+            worker_env.setdefault('FUXI_INPUT_CACHE_DIR', os.path.join(log_dir, f'cache-{index}'))
+            process = context.Process(
+                target=worker_main, daemon=True,
+                args=(index, model_dir, worker_env, os.path.join(log_dir, f'worker-{index}.log'),
+                      self.requests, self.results))
+            process.start()
+            self.processes.append(process)
+        self.workers = workers
+        self.collector = threading.Thread(target=self._collect, daemon=True)
+        self.collector.start()
+
+    def _collect(self):
+        while True:
+            kind, index, request_id, result, stats = self.results.get()
+            with self.lock:
+                self.stats[index] = dict(stats, state=kind if kind != 'done' else 'ready')
+                waiter = self.pending.pop(request_id, None) if request_id is not None else None
+            if waiter is not None:
+                waiter[1].append(result)
+                waiter[0].set()
+
+    def ready(self):
+        with self.lock:
+            return len(self.stats) == self.workers and all(s['state'] == 'ready' for s in self.stats.values())
+
+    def failed(self):
+        with self.lock:
+            return [i for i, s in self.stats.items() if s['state'] == 'failed']
+
+    def invoke(self, body, content_type):
+        """把请求交给空闲的工作进程，返回 (状态码, 响应, 处理耗时)"""
+        request_id = next(self.ids)
+        event, result = threading.Event(), []
+        with self.lock:
+            self.pending[request_id] = (event, result)
+        self.requests.put((request_id, body, content_type))
+        event.wait()
+        return result[0]
+
+    def metrics(self):
+        with self.lock:
+            return {'workers': [self.stats[i] for i in sorted(self.stats)], 'queued': len(self.pending)}
+
+    def close(self):
+        for _ in self.processes:
+            self.requests.put(None)
+        for process in self.processes:
+            process.join(timeout=30)
+
+
+def make_handler(server):
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def _reply(self, status, body, headers=None):
+            data = body.encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == '/ping':
+                self._reply(200 if server.ready() else 503, '{}')
+            elif self.path == '/metrics':
+                self._reply(200, json.dumps(server.metrics()))
+            else:
+                self._reply(404, '{}')
+
+        def do_POST(self):
+            if self.path != '/invocations':
+                self._reply(404, '{}')
+                return
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8')
+            status, response, seconds = server.invoke(body, self.headers.get('Content-Type', 'application/json'))
+            self._reply(status, response, {'X-Fuxi-Service-Sec': f'{seconds:.4f}'})
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地推理服务模拟')
+    parser.add_argument('--synthetic', metavar='WORK_DIR', help='在工作目录中生成合成模型、本地S3和清单')
+    parser.add_argument('--model-dir', help='模型目录（不使用 --synthetic 时必须指定）')
+    parser.add_argument('--s3-root', help='本地S3目录（FUXI_S3_LOCAL_ROOT），不指定时使用真实的S3')
+    parser.add_argument('--workers', type=int, default=1, help='工作进程数（SAGEMAKER_MODEL_SERVER_WORKERS）')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE', help='工作进程的环境变量')
+    parser.add_argument('--init-times', type=int, default=4, help='合成初始场的起报时间数')
+    parser.add_argument('--lat', type=int, default=181, help='合成网格的纬向格点数')
+    parser.add_argument('--lon', type=int, default=360, help='合成网格的经向格点数')
+    parser.add_argument('--dim', type=int, default=64, help='合成模型的嵌入维度')
+    parser.add_argument('--depth', type=int, default=2, help='合成模型的 MLP 块数')
+    args = parser.parse_args()
+
+    env = {}
+    log_dir = os.path.abspath(args.synthetic or '.')
+    if args.synthetic:
+        os.makedirs(log_dir, exist_ok=True)
+        model_dir, s3_root, _ = prepare_synthetic(log_dir, args.init_times, args.lat, args.lon,
+                                                  args.dim, args.depth)
+        env.update({'FUXI_DEVICE_TYPE': 'cpu', 'FUXI_S3_LOCAL_ROOT': s3_root, 'FUXI_MODEL_BUCKET': BUCKET})
+    elif args.model_dir:
+        model_dir = os.path.abspath(args.model_dir)
+    else:
+        parser.error('需要 --synthetic 或 --model-dir')
+    if args.s3_root:
+        env['FUXI_S3_LOCAL_ROOT'] = os.path.abspath(args.s3_root)
+    env.update(item.split('=', 1) for item in args.env)
+
+    server = LocalServer(model_dir, workers=args.workers, env=env, log_dir=log_dir)
+    print(f"启动 {args.workers} 个工作进程，日志: {log_dir}/worker-N.log")
+    while not server.ready():
+        if server.failed():
+            print(f"❌ 工作进程 {server.failed()} 的 model_fn 失败，见日志")
+            server.close()
+            return 1
+        time.sleep(0.5)
+    for stats in server.metrics()['workers']:
+        print(f"  worker {stats['worker']}: model_fn {stats['model_fn_sec']:.2f} sec, "
+              f"RSS {stats['rss_mb']:.0f} MB")
+
+    httpd = ThreadingHTTPServer((args.host, args.port), make_handler(server))
+    print(f"✅ 监听 http://{args.host}:{args.port}（/ping, /invocations, /metrics）")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        server.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())